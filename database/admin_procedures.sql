@@ -134,7 +134,7 @@ BEGIN
     SET @pid_val = pid_p;
     SET @price_per_qty_val = price_per_qty_p;
     
-	SET @qry = 'INSERT INTO supplies_seafood_product VALUES (?, ?, ?)';
+	SET @qry = 'INSERT INTO vendor_supplies_seafood_product (vendor_id, pid, price_per_qty) VALUES (?, ?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @vendor_id_val, @pid_val, @price_per_qty_val;
     DEALLOCATE PREPARE stmt;
@@ -159,7 +159,7 @@ BEGIN
 	SET @pzipcode_val = zipcode_p;
     SET @partner_id_val = partner_id_p;
     
-	SET @qry = 'INSERT INTO delivery_zone VALUES (?, ?)';
+	SET @qry = 'INSERT INTO delivery_zone (zipcode, partner_id) VALUES (?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @pzipcode_val, @partner_id_val;
     DEALLOCATE PREPARE stmt;
@@ -178,7 +178,7 @@ BEGIN
     SET @coupon_expiration_date_val = coupon_expiration_date_p;
     SET @coupon_description_val = coupon_description_p;
     
-	SET @qry = 'INSERT INTO coupon VALUES (?, ?, ?, ?)';
+	SET @qry = 'INSERT INTO coupon (coupon_code, coupon_discount_amt, coupon_expiration_date, coupon_description) VALUES (?, ?, ?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @coupon_code_val, @coupon_discount_amt_val, @coupon_expiration_date_val, @coupon_description_val;
     DEALLOCATE PREPARE stmt;
@@ -207,19 +207,30 @@ END ^^
 DELIMITER ;
 -- call count_order_per_cid();
 
+-- number of orders per customer placed in [start_p, end_p), customers without orders in the period are left out
+drop procedure if exists count_order_per_cid_range;
+DELIMITER ^^
+CREATE PROCEDURE count_order_per_cid_range(IN start_p DATE, IN end_p DATE)
+BEGIN
+    SELECT c.cid, c.email, COUNT(o.order_id) AS num_orders
+		FROM customer c
+		JOIN order_invoice o ON c.cid = o.customer_id
+        WHERE o.order_date >= start_p AND o.order_date < end_p
+		GROUP BY c.cid, c.email ORDER BY num_orders DESC;
+END ^^
+DELIMITER ;
+-- call count_order_per_cid_range('2023-01-01', '2024-01-01');
+
 
--- find the best selling products in a given year
+-- find the best selling products in a given year, over an order_date range rather than YEAR(order_date)
+-- so the idx_order_date index can be used (see the migrations in isf_plancheck.py)
 DELIMITER ^^
 CREATE PROCEDURE get_product_sales(IN year_p INT)
 BEGIN
-	SET @year_val = year_p;
-    SET @qry = 'SELECT p_name AS product, SUM(quantity) AS num_sold FROM order_invoice
-							JOIN order_item USING (order_id)
-							WHERE YEAR(order_date) = ?
-							GROUP BY product ORDER BY num_sold DESC;';
-    PREPARE stmt FROM @qry;
-    EXECUTE stmt USING @year_val;
-    DEALLOCATE PREPARE stmt;
+	SELECT p_name AS product, SUM(quantity) AS num_sold FROM order_invoice
+		JOIN order_item USING (order_id)
+		WHERE order_date >= MAKEDATE(year_p, 1) AND order_date < MAKEDATE(year_p + 1, 1)
+		GROUP BY product ORDER BY num_sold DESC;
 END^^
 DELIMITER ;
 
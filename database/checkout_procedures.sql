@@ -0,0 +1,138 @@
+use seafood_service_v4;
+
+-- Checkout of a whole cart in one call and one transaction, replacing the place_order, add_item_to_order,
+-- remove_item_from_inventory and begin_delivery round trips of the customer site.
+-- Run this file after rollup_procedures.sql (the rollup triggers count the items inserted here).
+--
+--   CALL checkout_cart(1, 'Venmo', '', '[{"p_name": "Maine Uni 150 g", "quantity": 2},
+--                                          {"p_name": "Sashimi Tuna 1 lb", "quantity": 1}]');
+--
+-- returns one row (order_id, expected_delivery_date), or signals without writing anything:
+--   45013 the cart is empty or not a JSON array of {"p_name", "quantity"} with quantities above 0
+--   45010 customer not found, 45011 payment doesnt exist, 45005 coupon not found (as place_order)
+--   45008 product does not exist, 45003 not enough qty in stock, 45014 no delivery partner for the zip code
+--
+-- Stock rows are locked with SELECT ... FOR UPDATE one at a time in ascending pid order, so concurrent
+-- checkouts of overlapping carts queue behind each other instead of deadlocking, and the stock checked
+-- is the stock decremented: two buyers can't both take the last units.
+
+drop procedure if exists checkout_cart;
+DELIMITER ^^
+CREATE PROCEDURE checkout_cart(
+	IN c_customer_id INT,
+    IN c_payment_type VARCHAR(16),
+    IN c_coupon_code VARCHAR(10),
+    IN c_cart JSON
+)
+BEGIN
+	DECLARE customer_zip CHAR(5);
+    DECLARE payment_type_exists VARCHAR(16);
+    DECLARE coupon_code_exists VARCHAR(10);
+    DECLARE partner_id_v INT;
+    DECLARE n_lines INT;
+    DECLARE n_invalid INT;
+    DECLARE missing_product VARCHAR(64);
+    DECLARE pid_v INT;
+    DECLARE p_name_v VARCHAR(64);
+    DECLARE quantity_v INT;
+    DECLARE in_stock_v INT;
+    DECLARE order_id_v INT;
+    DECLARE delivery_date_v DATE;
+    DECLARE msg VARCHAR(128);
+    DECLARE done INT DEFAULT 0;
+    DECLARE lines_cursor CURSOR FOR SELECT pid, p_name, quantity FROM checkout_lines ORDER BY pid;
+    DECLARE CONTINUE HANDLER FOR NOT FOUND SET done = 1;
+    DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+		ROLLBACK;
+        DROP TEMPORARY TABLE IF EXISTS checkout_lines;
+        RESIGNAL;
+	END;
+
+	-- validate the cart and the order before taking any lock
+	IF c_cart IS NULL OR JSON_TYPE(c_cart) <> 'ARRAY' OR JSON_LENGTH(c_cart) = 0 THEN
+		SIGNAL SQLSTATE '45013' SET MESSAGE_TEXT = 'cart is empty';
+	END IF;
+
+	SELECT COUNT(*) INTO n_invalid
+		FROM JSON_TABLE(c_cart, '$[*]' COLUMNS (p_name VARCHAR(64) PATH '$.p_name', quantity INT PATH '$.quantity')) AS j
+        WHERE j.p_name IS NULL OR j.quantity IS NULL OR j.quantity <= 0;
+    IF n_invalid > 0 THEN
+		SIGNAL SQLSTATE '45013' SET MESSAGE_TEXT = 'cart lines need a p_name and a quantity above 0';
+	END IF;
+
+	DROP TEMPORARY TABLE IF EXISTS checkout_lines;
+    CREATE TEMPORARY TABLE checkout_lines (
+		p_name VARCHAR(64) NOT NULL PRIMARY KEY,
+        quantity INT NOT NULL,
+        pid INT NULL
+	);
+    -- the same product listed twice is one line
+    INSERT INTO checkout_lines (p_name, quantity)
+		SELECT j.p_name, SUM(j.quantity)
+        FROM JSON_TABLE(c_cart, '$[*]' COLUMNS (p_name VARCHAR(64) PATH '$.p_name', quantity INT PATH '$.quantity')) AS j
+		GROUP BY j.p_name;
+	SET n_lines = ROW_COUNT();
+
+	UPDATE checkout_lines l JOIN product p ON p.p_name = l.p_name SET l.pid = p.pid;
+    SELECT p_name INTO missing_product FROM checkout_lines WHERE pid IS NULL LIMIT 1;
+    IF missing_product IS NOT NULL THEN
+		SET msg = CONCAT('product does not exist: ', missing_product);
+		SIGNAL SQLSTATE '45008' SET MESSAGE_TEXT = msg;
+	END IF;
+
+    SELECT zip INTO customer_zip FROM customer WHERE cid = c_customer_id;
+    SELECT payment_type INTO payment_type_exists FROM payment WHERE payment_type = c_payment_type;
+    SELECT coupon_code INTO coupon_code_exists FROM coupon WHERE coupon_code = c_coupon_code;
+    SELECT partner_id INTO partner_id_v FROM delivery_zone WHERE zipcode = customer_zip;
+    SET done = 0; -- the SELECT ... INTOs above set it when they find no row
+
+    IF customer_zip IS NULL THEN
+		SIGNAL SQLSTATE '45010' SET MESSAGE_TEXT = 'customer not found';
+	ELSEIF payment_type_exists IS NULL THEN
+		SIGNAL SQLSTATE '45011' SET MESSAGE_TEXT = 'payment doesnt exist';
+	ELSEIF coupon_code_exists IS NULL AND c_coupon_code <> '' THEN
+		SIGNAL SQLSTATE '45005' SET MESSAGE_TEXT = 'coupon not found';
+	ELSEIF partner_id_v IS NULL THEN
+		SIGNAL SQLSTATE '45014' SET MESSAGE_TEXT = 'no delivery partner for the zip code';
+	END IF;
+
+	START TRANSACTION;
+    -- lock the stock of every line in pid order, checking it under the lock
+    OPEN lines_cursor;
+    lock_lines: LOOP
+		FETCH lines_cursor INTO pid_v, p_name_v, quantity_v;
+        IF done THEN
+			LEAVE lock_lines;
+		END IF;
+		SELECT qty_in_stock INTO in_stock_v FROM product WHERE pid = pid_v FOR UPDATE;
+        IF in_stock_v < quantity_v THEN
+			SET msg = CONCAT('Not enough qty in stock: ', p_name_v, ' (', in_stock_v, ' left)');
+			SIGNAL SQLSTATE '45003' SET MESSAGE_TEXT = msg;
+		END IF;
+	END LOOP;
+    CLOSE lines_cursor;
+
+    INSERT INTO order_invoice (customer_id, payment_type, coupon_code, order_date)
+    VALUES (c_customer_id, c_payment_type, c_coupon_code, CURRENT_TIMESTAMP);
+    SET order_id_v = LAST_INSERT_ID();
+
+    INSERT INTO order_item (order_id, p_name, quantity)
+		SELECT order_id_v, p_name, quantity FROM checkout_lines ORDER BY p_name;
+	UPDATE product p JOIN checkout_lines l ON l.pid = p.pid
+		SET p.qty_in_stock = p.qty_in_stock - l.quantity;
+
+	-- same delivery date rule as begin_delivery, by the number of order lines
+    SET delivery_date_v = CASE
+		WHEN n_lines < 5 THEN DATE_ADD(CURRENT_DATE, INTERVAL 1 DAY)
+		WHEN n_lines <= 10 THEN DATE_ADD(CURRENT_DATE, INTERVAL 2 DAY)
+		ELSE DATE_ADD(CURRENT_DATE, INTERVAL 5 DAY)
+	END;
+    INSERT INTO delivery (order_id, delivery_partner_id, expected_delivery_date, delivery_status)
+    VALUES (order_id_v, partner_id_v, delivery_date_v, 'placed');
+    COMMIT;
+
+    DROP TEMPORARY TABLE IF EXISTS checkout_lines;
+    SELECT order_id_v AS order_id, delivery_date_v AS expected_delivery_date;
+END^^
+DELIMITER ;
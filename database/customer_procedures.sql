@@ -145,7 +145,6 @@ CREATE PROCEDURE remove_item_from_inventory(
 )
 BEGIN
     DECLARE pid_exists INT;
-    DECLARE c_qty_exists INT;
     
 	SELECT COUNT(*) INTO pid_exists FROM product
     WHERE pid = c_pid;
@@ -153,14 +152,12 @@ BEGIN
     IF pid_exists = 0 THEN
 		SIGNAL SQLSTATE '45002' SET MESSAGE_TEXT = 'product not found';
 	ELSE
-		SELECT qty_in_stock INTO c_qty_exists FROM product
-		WHERE pid = c_pid;
+		-- check and decrement in one statement, so two concurrent calls can't both pass the check
+		UPDATE product SET qty_in_stock = qty_in_stock - c_qty
+        WHERE pid = c_pid AND qty_in_stock >= c_qty;
 	
-		IF c_qty_exists < c_qty THEN
+		IF ROW_COUNT() = 0 AND c_qty > 0 THEN
 			SIGNAL SQLSTATE '45003' SET MESSAGE_TEXT = 'Not enough qty in stock';
-		ELSE
-			UPDATE product SET qty_in_stock = qty_in_stock - c_qty
-            WHERE pid = c_pid;
 		END IF;
 	END IF;
 END //
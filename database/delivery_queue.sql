@@ -0,0 +1,26 @@
+use seafood_service_v4;
+
+-- Indexes behind the work queue of a delivery partner (isf_delivery.py). Run after row_versions.sql.
+-- idx_partner_open: a partner's open deliveries (placed / in-transit) by expected date, without reading the
+--                   delivered history of the partner.
+-- idx_partner_updated: the feed of a partner's rows written since a watermark (new assignments, status changes).
+-- Safe to run again, existing indexes are kept.
+
+drop procedure if exists add_delivery_index;
+DELIMITER ^^
+CREATE PROCEDURE add_delivery_index(IN index_p VARCHAR(64), IN columns_p VARCHAR(255))
+BEGIN
+	IF NOT EXISTS (SELECT 1 FROM information_schema.STATISTICS
+				   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'delivery' AND INDEX_NAME = index_p) THEN
+		SET @ddl = CONCAT('ALTER TABLE delivery ADD INDEX ', index_p, ' (', columns_p, ')');
+		PREPARE stmt FROM @ddl;
+		EXECUTE stmt;
+		DEALLOCATE PREPARE stmt;
+	END IF;
+END^^
+DELIMITER ;
+
+CALL add_delivery_index('idx_partner_open', 'delivery_partner_id, delivery_status, expected_delivery_date');
+CALL add_delivery_index('idx_partner_updated', 'delivery_partner_id, updated_at');
+
+drop procedure if exists add_delivery_index;
@@ -407,7 +407,7 @@ BEGIN
     SET @coupon_expiration_date_val = coupon_expiration_date_p;
     SET @coupon_description_val = coupon_description_p;
     
-	SET @qry = 'INSERT INTO coupon VALUES (?, ?, ?, ?)';
+	SET @qry = 'INSERT INTO coupon (coupon_code, coupon_discount_amt, coupon_expiration_date, coupon_description) VALUES (?, ?, ?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @coupon_code_val, @coupon_discount_amt_val, @coupon_expiration_date_val, @coupon_description_val;
     DEALLOCATE PREPARE stmt;
@@ -452,7 +452,7 @@ BEGIN
 	SET @pzipcode_val = zipcode_p;
     SET @partner_id_val = partner_id_p;
     
-	SET @qry = 'INSERT INTO delivery_zone VALUES (?, ?)';
+	SET @qry = 'INSERT INTO delivery_zone (zipcode, partner_id) VALUES (?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @pzipcode_val, @partner_id_val;
     DEALLOCATE PREPARE stmt;
@@ -584,7 +584,7 @@ BEGIN
     SET @pid_val = pid_p;
     SET @price_per_qty_val = price_per_qty_p;
     
-	SET @qry = 'INSERT INTO supplies_seafood_product VALUES (?, ?, ?)';
+	SET @qry = 'INSERT INTO vendor_supplies_seafood_product (vendor_id, pid, price_per_qty) VALUES (?, ?, ?)';
     PREPARE stmt FROM @qry;
     EXECUTE stmt USING @vendor_id_val, @pid_val, @price_per_qty_val;
     DEALLOCATE PREPARE stmt;
@@ -868,14 +868,10 @@ DELIMITER ;
 DELIMITER ;;
 CREATE DEFINER=`root`@`localhost` PROCEDURE `get_product_sales`(IN year_p INT)
 BEGIN
-	SET @year_val = year_p;
-    SET @qry = 'SELECT p_name AS product, SUM(quantity) AS num_sold FROM order_invoice
-							JOIN order_item USING (order_id)
-							WHERE YEAR(order_date) = ?
-							GROUP BY product ORDER BY num_sold DESC;';
-    PREPARE stmt FROM @qry;
-    EXECUTE stmt USING @year_val;
-    DEALLOCATE PREPARE stmt;
+	SELECT p_name AS product, SUM(quantity) AS num_sold FROM order_invoice
+		JOIN order_item USING (order_id)
+		WHERE order_date >= MAKEDATE(year_p, 1) AND order_date < MAKEDATE(year_p + 1, 1)
+		GROUP BY product ORDER BY num_sold DESC;
 END ;;
 DELIMITER ;
 /*!50003 SET sql_mode              = @saved_sql_mode */ ;
@@ -1214,7 +1210,6 @@ CREATE DEFINER=`root`@`localhost` PROCEDURE `remove_item_from_inventory`(
 )
 BEGIN
     DECLARE pid_exists INT;
-    DECLARE c_qty_exists INT;
     
 	SELECT COUNT(*) INTO pid_exists FROM product
     WHERE pid = c_pid;
@@ -1222,14 +1217,12 @@ BEGIN
     IF pid_exists = 0 THEN
 		SIGNAL SQLSTATE '45002' SET MESSAGE_TEXT = 'product not found';
 	ELSE
-		SELECT qty_in_stock INTO c_qty_exists FROM product
-		WHERE pid = c_pid;
+		-- check and decrement in one statement, so two concurrent calls can't both pass the check
+		UPDATE product SET qty_in_stock = qty_in_stock - c_qty
+        WHERE pid = c_pid AND qty_in_stock >= c_qty;
 	
-		IF c_qty_exists < c_qty THEN
+		IF ROW_COUNT() = 0 AND c_qty > 0 THEN
 			SIGNAL SQLSTATE '45003' SET MESSAGE_TEXT = 'Not enough qty in stock';
-		ELSE
-			UPDATE product SET qty_in_stock = qty_in_stock - c_qty
-            WHERE pid = c_pid;
 		END IF;
 	END IF;
 END ;;
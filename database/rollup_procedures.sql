@@ -0,0 +1,203 @@
+use seafood_service_v4;
+
+-- Pre-aggregated summaries for the analytics page, kept up to date by triggers as orders are written
+-- (place_order, add_item_to_order, admin edits) instead of aggregating every order on each call.
+-- Run this file once after admin_procedures.sql; it ends with a full rebuild of the rollups.
+
+-- units sold per product per day, and how many order_item rows make up each sum
+-- (a day/product row is removed when its last item goes, like get_product_sales would stop listing it)
+-- renamed or deleted products cascade here the same way they cascade to order_item
+CREATE TABLE IF NOT EXISTS product_sales_daily (
+	sale_date DATE NOT NULL,
+    p_name VARCHAR(64) NOT NULL,
+    num_sold BIGINT NOT NULL DEFAULT 0,
+    num_items INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (sale_date, p_name),
+    KEY p_name (p_name),
+    CONSTRAINT product_sales_daily_fk_product FOREIGN KEY (p_name) REFERENCES product (p_name)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+-- number of orders per customer, customers without orders have no row
+CREATE TABLE IF NOT EXISTS customer_order_count (
+	cid INT NOT NULL PRIMARY KEY,
+    num_orders INT NOT NULL DEFAULT 0,
+    CONSTRAINT customer_order_count_fk_customer FOREIGN KEY (cid) REFERENCES customer (cid)
+		ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+
+-- add (sign_p = 1) or subtract (sign_p = -1) all items of an order to the daily sales of sale_date_p
+-- orders without an order_date are not counted, a NULL order_date never matches in get_product_sales either
+drop procedure if exists rollup_order_items;
+DELIMITER ^^
+CREATE PROCEDURE rollup_order_items(IN order_id_p INT, IN sale_date_p DATE, IN sign_p INT)
+BEGIN
+	IF sale_date_p IS NOT NULL THEN
+		INSERT INTO product_sales_daily (sale_date, p_name, num_sold, num_items)
+			SELECT sale_date_p, i.p_name, sign_p * i.qty, sign_p * i.n
+            FROM (SELECT p_name, SUM(quantity) AS qty, COUNT(*) AS n FROM order_item
+				  WHERE order_id = order_id_p GROUP BY p_name) AS i
+		ON DUPLICATE KEY UPDATE num_sold = num_sold + sign_p * i.qty, num_items = num_items + sign_p * i.n;
+		DELETE FROM product_sales_daily WHERE sale_date = sale_date_p AND num_items <= 0;
+	END IF;
+END^^
+DELIMITER ;
+
+-- add (sign_p = 1) or subtract (sign_p = -1) one order_item row
+drop procedure if exists rollup_item;
+DELIMITER ^^
+CREATE PROCEDURE rollup_item(IN order_id_p INT, IN p_name_p VARCHAR(64), IN quantity_p INT, IN sign_p INT)
+BEGIN
+	DECLARE sale_date_v DATE;
+    SELECT DATE(order_date) INTO sale_date_v FROM order_invoice WHERE order_id = order_id_p;
+    IF sale_date_v IS NOT NULL THEN
+		INSERT INTO product_sales_daily (sale_date, p_name, num_sold, num_items)
+			VALUES (sale_date_v, p_name_p, sign_p * quantity_p, sign_p)
+		ON DUPLICATE KEY UPDATE num_sold = num_sold + sign_p * quantity_p, num_items = num_items + sign_p;
+		DELETE FROM product_sales_daily WHERE sale_date = sale_date_v AND p_name = p_name_p AND num_items <= 0;
+	END IF;
+END^^
+DELIMITER ;
+
+
+-- triggers don't fire for rows changed by foreign key cascades, so deleting an order (or a customer)
+-- subtracts its items before the cascade removes them; renamed/deleted products cascade through the FK above
+drop trigger if exists order_item_after_insert;
+DELIMITER ^^
+CREATE TRIGGER order_item_after_insert AFTER INSERT ON order_item FOR EACH ROW
+BEGIN
+	CALL rollup_item(NEW.order_id, NEW.p_name, NEW.quantity, 1);
+END^^
+DELIMITER ;
+
+drop trigger if exists order_item_after_update;
+DELIMITER ^^
+CREATE TRIGGER order_item_after_update AFTER UPDATE ON order_item FOR EACH ROW
+BEGIN
+	CALL rollup_item(OLD.order_id, OLD.p_name, OLD.quantity, -1);
+	CALL rollup_item(NEW.order_id, NEW.p_name, NEW.quantity, 1);
+END^^
+DELIMITER ;
+
+drop trigger if exists order_item_after_delete;
+DELIMITER ^^
+CREATE TRIGGER order_item_after_delete AFTER DELETE ON order_item FOR EACH ROW
+BEGIN
+	CALL rollup_item(OLD.order_id, OLD.p_name, OLD.quantity, -1);
+END^^
+DELIMITER ;
+
+drop trigger if exists order_invoice_after_insert;
+DELIMITER ^^
+CREATE TRIGGER order_invoice_after_insert AFTER INSERT ON order_invoice FOR EACH ROW
+BEGIN
+	INSERT INTO customer_order_count (cid, num_orders) VALUES (NEW.customer_id, 1)
+    ON DUPLICATE KEY UPDATE num_orders = num_orders + 1;
+END^^
+DELIMITER ;
+
+drop trigger if exists order_invoice_after_update;
+DELIMITER ^^
+CREATE TRIGGER order_invoice_after_update AFTER UPDATE ON order_invoice FOR EACH ROW
+BEGIN
+	IF NOT (DATE(OLD.order_date) <=> DATE(NEW.order_date)) THEN
+		-- the items of the order (already moved to NEW.order_id by the cascade) move to the new day
+		CALL rollup_order_items(NEW.order_id, DATE(OLD.order_date), -1);
+		CALL rollup_order_items(NEW.order_id, DATE(NEW.order_date), 1);
+	END IF;
+    -- the order was moved to another customer (a cid renumbered on customer cascades to both tables instead)
+    IF OLD.customer_id <> NEW.customer_id THEN
+		UPDATE customer_order_count SET num_orders = num_orders - 1 WHERE cid = OLD.customer_id;
+		INSERT INTO customer_order_count (cid, num_orders) VALUES (NEW.customer_id, 1)
+		ON DUPLICATE KEY UPDATE num_orders = num_orders + 1;
+	END IF;
+END^^
+DELIMITER ;
+
+drop trigger if exists order_invoice_before_delete;
+DELIMITER ^^
+CREATE TRIGGER order_invoice_before_delete BEFORE DELETE ON order_invoice FOR EACH ROW
+BEGIN
+	CALL rollup_order_items(OLD.order_id, DATE(OLD.order_date), -1);
+    UPDATE customer_order_count SET num_orders = num_orders - 1 WHERE cid = OLD.customer_id;
+END^^
+DELIMITER ;
+
+-- the orders of a deleted customer go by cascade: subtract their items here, the order count row cascades
+drop trigger if exists customer_before_delete;
+DELIMITER ^^
+CREATE TRIGGER customer_before_delete BEFORE DELETE ON customer FOR EACH ROW
+BEGIN
+	UPDATE product_sales_daily s
+		JOIN (SELECT DATE(o.order_date) AS sale_date, i.p_name, SUM(i.quantity) AS qty, COUNT(*) AS n
+			  FROM order_invoice o JOIN order_item i USING (order_id)
+              WHERE o.customer_id = OLD.cid AND o.order_date IS NOT NULL
+              GROUP BY sale_date, i.p_name) AS d
+		  ON s.sale_date = d.sale_date AND s.p_name = d.p_name
+	SET s.num_sold = s.num_sold - d.qty, s.num_items = s.num_items - d.n;
+    DELETE FROM product_sales_daily WHERE num_items <= 0;
+END^^
+DELIMITER ;
+
+
+-- recompute both rollups from the order tables, e.g. after loading data with triggers disabled
+drop procedure if exists rebuild_sales_rollups;
+DELIMITER ^^
+CREATE PROCEDURE rebuild_sales_rollups()
+BEGIN
+	DECLARE EXIT HANDLER FOR SQLEXCEPTION
+    BEGIN
+		ROLLBACK;
+        RESIGNAL;
+	END;
+	START TRANSACTION;
+    DELETE FROM product_sales_daily;
+    INSERT INTO product_sales_daily (sale_date, p_name, num_sold, num_items)
+		SELECT DATE(order_date), p_name, SUM(quantity), COUNT(*)
+        FROM order_invoice JOIN order_item USING (order_id)
+        WHERE order_date IS NOT NULL
+        GROUP BY DATE(order_date), p_name;
+	DELETE FROM customer_order_count;
+    INSERT INTO customer_order_count (cid, num_orders)
+		SELECT customer_id, COUNT(*) FROM order_invoice GROUP BY customer_id;
+	COMMIT;
+END^^
+DELIMITER ;
+
+
+-- same result as count_order_per_cid, read from the per-customer counter
+drop procedure if exists count_order_per_cid_rollup;
+DELIMITER ^^
+CREATE PROCEDURE count_order_per_cid_rollup()
+BEGIN
+    SELECT c.cid, c.email, COALESCE(r.num_orders, 0) AS num_orders
+		FROM customer c
+		LEFT JOIN customer_order_count r ON r.cid = c.cid
+		ORDER BY num_orders DESC;
+END ^^
+DELIMITER ;
+
+-- same result as get_product_sales, a range over the first column of the daily rollup's primary key
+drop procedure if exists get_product_sales_rollup;
+DELIMITER ^^
+CREATE PROCEDURE get_product_sales_rollup(IN year_p INT)
+BEGIN
+	SELECT p_name AS product, SUM(num_sold) AS num_sold FROM product_sales_daily
+		WHERE sale_date >= MAKEDATE(year_p, 1) AND sale_date < MAKEDATE(year_p + 1, 1)
+		GROUP BY product ORDER BY num_sold DESC;
+END^^
+DELIMITER ;
+
+-- best selling products over the days in [start_p, end_p), for comparing periods on the analytics page
+drop procedure if exists get_product_sales_range;
+DELIMITER ^^
+CREATE PROCEDURE get_product_sales_range(IN start_p DATE, IN end_p DATE)
+BEGIN
+	SELECT p_name AS product, SUM(num_sold) AS num_sold FROM product_sales_daily
+		WHERE sale_date >= start_p AND sale_date < end_p
+		GROUP BY product ORDER BY num_sold DESC;
+END^^
+DELIMITER ;
+
+CALL rebuild_sales_rollups();
@@ -0,0 +1,46 @@
+use seafood_service_v4;
+
+-- Row versions for optimistic concurrency on the tables edited in the admin portal.
+-- A commit updates or deletes a row only if its row_version is still the one the editor loaded, and bumps it,
+-- so two admins editing the same row can't silently overwrite each other (see commit_update in isf_dbapp.py).
+-- updated_at is kept by MySQL on every change, by any writer, and indexed so a delivery partner's work queue can read
+-- only the rows changed since its last read (see read_feed in isf_delivery.py), and the analytics results are dropped
+-- when a product or order item is edited (see orders_token_query in isf_analytics.py).
+-- Safe to run again, existing columns are kept.
+
+drop procedure if exists add_row_version;
+DELIMITER ^^
+CREATE PROCEDURE add_row_version(IN table_p VARCHAR(64))
+BEGIN
+	IF NOT EXISTS (SELECT 1 FROM information_schema.COLUMNS
+				   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_p AND COLUMN_NAME = 'row_version') THEN
+		SET @ddl = CONCAT('ALTER TABLE `', table_p, '` ',
+						  'ADD COLUMN row_version INT UNSIGNED NOT NULL DEFAULT 0, ',
+						  'ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ',
+						  'ON UPDATE CURRENT_TIMESTAMP(6)');
+		PREPARE stmt FROM @ddl;
+		EXECUTE stmt;
+		DEALLOCATE PREPARE stmt;
+	END IF;
+	IF NOT EXISTS (SELECT 1 FROM information_schema.STATISTICS
+				   WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = table_p AND INDEX_NAME = 'idx_updated_at') THEN
+		SET @ddl = CONCAT('ALTER TABLE `', table_p, '` ADD INDEX idx_updated_at (updated_at)');
+		PREPARE stmt FROM @ddl;
+		EXECUTE stmt;
+		DEALLOCATE PREPARE stmt;
+	END IF;
+END^^
+DELIMITER ;
+
+CALL add_row_version('category');
+CALL add_row_version('coupon');
+CALL add_row_version('delivery_partner');
+CALL add_row_version('delivery_zone');
+CALL add_row_version('payment');
+CALL add_row_version('product');
+CALL add_row_version('vendor');
+CALL add_row_version('vendor_supplies_seafood_product');
+CALL add_row_version('delivery');
+CALL add_row_version('order_item');
+
+drop procedure if exists add_row_version;
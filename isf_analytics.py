@@ -0,0 +1,97 @@
+# This file contains the analytics reports shown on the analytics page: the columns of each report,
+# running its procedure into a typed dataframe, and the change token telling when cached results are out of date.
+
+import contextvars
+import time
+
+import pandas as pd
+
+from isf_frames import typed_frame
+from isf_sql import quote_ident
+
+# {report title: (columns, dtypes)} of the result set returned by the report's procedure
+REPORT_COLUMNS = {"Best Selling Products by Year": (["Product", "Sold"], {"Sold": "Int64"}), # SUM() is a DECIMAL
+                  "Number of Orders per Customer": (["cid", "email", "num_orders"],
+                                                    {"cid": "Int64", "num_orders": "Int64"}),
+                  "Best Selling Products": (["Product", "Sold"], {"Sold": "Int64"}),
+                  "Orders per Customer": (["cid", "email", "num_orders"], {"cid": "Int64", "num_orders": "Int64"})}
+
+# {report title: (row label column, value column)} for lining up the results of several periods
+COMPARE_COLUMNS = {"Best Selling Products": ("Product", "Sold"),
+                   "Orders per Customer": ("email", "num_orders")}
+
+# years that have sales, offered for comparison
+ORDER_YEARS_QUERY = "SELECT DISTINCT YEAR(sale_date) FROM product_sales_daily ORDER BY 1"
+
+# moves whenever an order or order item is added or removed, or a customer registers;
+# read from the primary key indexes, much cheaper than running the reports again
+ORDERS_TOKEN_QUERY = """
+SELECT (SELECT MAX(order_id) FROM order_invoice), (SELECT COUNT(*) FROM order_invoice),
+       (SELECT COUNT(*) FROM order_item), (SELECT COUNT(*) FROM customer)
+"""
+# tables whose edited rows change the reports too (a renamed product, a changed quantity), see orders_token_query()
+EDITED_TOKEN_TABLES = ('product', 'order_item')
+
+
+def orders_token_query(updated_col: str, tables: list) -> str:
+    '''
+    ORDERS_TOKEN_QUERY, also moving when a row of tables is edited: the MAX of their updated_col,
+    read from its index (database/row_versions.sql)
+    '''
+    updated = "".join(f", (SELECT MAX({quote_ident(updated_col)}) FROM {quote_ident(table)})" for table in tables)
+    return ORDERS_TOKEN_QUERY.rstrip() + updated
+
+
+def run_report(conn, title: str, procedure: str, args: tuple = ()):
+    '''call the procedure of a report and return its result as a typed dataframe'''
+    columns, dtypes = REPORT_COLUMNS[title]
+    cursor = conn.cursor()
+    cursor.callproc(procedure, args)
+    rows = cursor.fetchall()
+    cursor.close()
+    return typed_frame(rows, columns, dtypes)
+
+
+def fetch_report(result_cache, my_db, title: str, procedure: str, args: tuple = ()):
+    '''
+    return the result of a report from the result cache (a TableCache keyed by (procedure, args)),
+    running its procedure on a connection borrowed from the pool on a miss.
+    returns: (dataframe, seconds since it was computed or None if computed by this call, seconds this call took)
+    '''
+    start = time.perf_counter()
+    computed = []
+    def loader():
+        computed.append(True)
+        with my_db.connection() as conn:
+            return run_report(conn, title, procedure, args)
+    df = result_cache.get((procedure, args), loader)
+    age = None if computed else result_cache.age((procedure, args))
+    return df, age, time.perf_counter() - start
+
+
+def fetch_reports(executor, result_cache, my_db, jobs: list):
+    '''
+    run several reports at once on a thread pool, each on its own pooled connection,
+    so the wait is about the slowest query instead of the sum of all of them.
+    params:
+        jobs: [(title, procedure, args), ...]
+    returns: ([fetch_report() result, ...] in the order of jobs, wall-clock seconds)
+    '''
+    start = time.perf_counter()
+    # each job runs in a copy of the caller's context, so its queries count towards the caller's rerun
+    futures = [executor.submit(contextvars.copy_context().run, fetch_report, result_cache, my_db, *job) for job in jobs]
+    results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def compare_periods(title: str, results: list):
+    '''
+    line up the results of one report over several periods: one row per product/customer, one column per period,
+    0 where it has no result in a period, ordered by the total over all periods
+    params:
+        results: [(period label, dataframe), ...]
+    '''
+    label_col, value_col = COMPARE_COLUMNS[title]
+    columns = [df.set_index(label_col)[value_col].rename(period) for period, df in results]
+    table = pd.concat(columns, axis=1).fillna(0)
+    return table.loc[table.sum(axis=1).sort_values(ascending=False, kind="stable").index]
@@ -0,0 +1,315 @@
+# This file contains the benchmark harness for the admin data paths: table loads, batched commits and the
+# analytics procedures, run against the database in .streamlit/secrets.toml (scale it with isf_datagen.py first).
+#
+#   python isf_bench.py run --out bench_results.json
+#   python isf_bench.py run --out bench_results.json --baseline bench_baseline.json
+#   python isf_bench.py compare bench_results.json bench_baseline.json
+#   python isf_bench.py checkout --buyers 16 --stock 200     # concurrent checkouts of the same products
+#
+# Each scenario reports latency percentiles, round trips to MySQL (the session's "Questions" counter,
+# statements inside stored procedures are not counted) and memory: the peak of Python allocations during
+# one extra traced run, and the process peak RSS once the scenario is done.
+
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pymysql
+import toml
+
+import isf_config as config
+import isf_dbapp as dbapp
+from isf_analytics import run_report
+from isf_cache import TableCache
+from isf_checkout import SIGNAL_ERROR, DEADLOCK, LOCK_WAIT_TIMEOUT, checkout
+from isf_pool import ConnectionPool, connect_args
+
+# tables whose size decides most timings, recorded with the results
+SIZE_TABLES = ['customer', 'product', 'order_invoice', 'order_item', 'delivery']
+# rows written by the commit scenarios go to coupon, nothing references the generated codes
+BENCH_CODE = "bench{:05d}"
+# products fought over by the checkout stress test, created for the run and removed after it
+HOT_PRODUCTS = ["bench checkout A", "bench checkout B", "bench checkout C"]
+
+
+def questions(my_db) -> int:
+    '''statements the server has received on the pool's (single) connection so far'''
+    with my_db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SHOW SESSION STATUS LIKE 'Questions'")
+        count = int(cursor.fetchone()[1])
+        cursor.close()
+    return count
+
+
+def peak_rss_mb() -> float:
+    '''peak resident set size of this process so far'''
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024 # bytes on macOS, KiB on Linux
+
+
+def measure(my_db, name: str, run, repeat: int, setup=None) -> dict:
+    '''
+    time run() repeat times (setup() before each, not timed), then once more under tracemalloc.
+    returns: latency percentiles in ms, round trips per run, peak traced allocation and process peak RSS in MB
+    '''
+    times = []
+    trips = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        before = questions(my_db)
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        trips.append(questions(my_db) - before - 1) # the SHOW STATUS of the first reading counts too
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    run()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ms = np.array(times) * 1000
+    result = {"p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+              "p99_ms": float(np.percentile(ms, 99)), "mean_ms": float(ms.mean()), "runs": repeat,
+              "round_trips": int(np.median(trips)), "peak_alloc_mb": peak_alloc / 1024 / 1024,
+              "peak_rss_mb": peak_rss_mb()}
+    print(f"{name:<40} p50 {result['p50_ms']:9.1f} ms  p95 {result['p95_ms']:9.1f} ms  "
+          f"trips {result['round_trips']:6d}  alloc {result['peak_alloc_mb']:8.1f} MB")
+    return result
+
+
+def table_sizes(my_db) -> dict:
+    with my_db.connection() as conn:
+        cursor = conn.cursor()
+        sizes = {}
+        for table in SIZE_TABLES:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            sizes[table] = int(cursor.fetchone()[0])
+        cursor.close()
+    return sizes
+
+
+def commit_scenarios(my_db, rows: int, batch_sizes: list, repeat: int) -> dict:
+    '''insert, update and delete the same generated coupons at each batch size, through the app's commit paths'''
+    results = {}
+    codes = [BENCH_CODE.format(i) for i in range(rows)]
+    added = [{"coupon_code": code, "coupon_discount_amt": 5, "coupon_description": "benchmark"} for code in codes]
+    edited = {(code,): {"coupon_description": "benchmark, edited"} for code in codes}
+    deleted = [(code,) for code in codes]
+
+    def clear():
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM coupon WHERE coupon_code LIKE 'bench%'")
+            cursor.close()
+
+    def insert():
+        clear()
+        dbapp.commit_insert(my_db, 'coupon', added)
+
+    for batch_size in batch_sizes:
+        # the commit functions read their chunk sizes from the config on each call
+        config.COMMIT_BATCH_SIZE = config.INSERT_CHUNK_SIZE = config.DELETE_CHUNK_SIZE = batch_size
+        results[f"commit_insert/{rows} rows/batch {batch_size}"] = measure(
+            my_db, f"commit_insert {rows} rows, batch {batch_size}",
+            lambda: dbapp.commit_insert(my_db, 'coupon', added), repeat, setup=clear)
+        results[f"commit_update/{rows} rows/batch {batch_size}"] = measure(
+            my_db, f"commit_update {rows} rows, batch {batch_size}",
+            lambda: dbapp.commit_update(my_db, 'coupon', edited), repeat, setup=insert)
+        results[f"commit_delete/{rows} rows/batch {batch_size}"] = measure(
+            my_db, f"commit_delete {rows} rows, batch {batch_size}",
+            lambda: dbapp.commit_delete(my_db, 'coupon', deleted), repeat, setup=insert)
+    clear()
+    return results
+
+
+def run_benchmarks(my_db, args) -> dict:
+    results = {}
+    for table in args.tables:
+        results[f"fetch_data/{table}"] = measure(my_db, f"fetch_data {table}",
+                                                 lambda: dbapp.fetch_data(my_db, table), args.repeat)
+
+    # what set_table_sessions did when the app started: every table the admin pages show, through a cold cache
+    all_tables = config.EDITABLE_TABLES + config.VIEW_ONLY_TABLES
+    def load_all_tables():
+        table_cache = TableCache(config.TABLE_CACHE_MAX_MB * 1024 * 1024)
+        for table in all_tables:
+            table_cache.get(table, lambda: dbapp.fetch_data(my_db, table))
+    results["set_table_sessions/all tables"] = measure(my_db, "set_table_sessions (all tables)",
+                                                       load_all_tables, args.repeat)
+
+    results.update(commit_scenarios(my_db, args.commit_rows, args.batch_sizes, args.repeat))
+
+    for title, args_ in [("Best Selling Products by Year", (args.year,)), ("Number of Orders per Customer", ())]:
+        for procedure in (config.ANALYTICS_SOURCE[title], config.ANALYTICS[title]):
+            def call(procedure=procedure, title=title, args_=args_):
+                with my_db.connection() as conn:
+                    run_report(conn, title, procedure, args_)
+            results[f"{procedure}"] = measure(my_db, procedure, call, args.repeat)
+    return results
+
+
+def checkout_stress(secrets, buyers: int, orders_per_buyer: int, stock: int, seed: int) -> dict:
+    '''
+    many buyers checking out carts of the same few products at once, each on its own connection, the products
+    listed in random order; ends with the stock and the units sold of each product, which must add up
+    '''
+    admin = pymysql.connect(**connect_args(secrets))
+    cursor = admin.cursor()
+    cursor.execute("SELECT c.cid FROM customer c JOIN delivery_zone z ON z.zipcode = c.zip ORDER BY c.cid LIMIT 1")
+    customer_id = cursor.fetchone()[0]
+    cursor.execute("SELECT payment_type FROM payment ORDER BY payment_type LIMIT 1")
+    payment_type = cursor.fetchone()[0]
+    cursor.execute("SELECT category_name FROM category ORDER BY category_name LIMIT 1")
+    category = cursor.fetchone()[0]
+    cursor.executemany("INSERT INTO product (p_name, category, sell_price, qty_in_stock, product_img) "
+                       "VALUES (%s, %s, 1, %s, 'benchmark')", [(name, category, stock) for name in HOT_PRODUCTS])
+
+    counts = {"ok": 0, "out_of_stock": 0, "deadlocks": 0, "lock_timeouts": 0, "other_errors": 0}
+    order_ids = []
+    latencies = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(buyers)
+
+    def buyer(i):
+        rng = random.Random(seed + i)
+        conn = pymysql.connect(**connect_args(secrets))
+        start_line.wait()
+        for _ in range(orders_per_buyer):
+            cart = [(name, rng.randint(1, 3)) for name in rng.sample(HOT_PRODUCTS, rng.randint(1, len(HOT_PRODUCTS)))]
+            start = time.perf_counter()
+            try:
+                order_id, _ = checkout(conn, config.CHECKOUT, customer_id, payment_type, '', cart, retries=0)
+                outcome = "ok"
+            except pymysql.Error as e:
+                code = e.args[0]
+                outcome = {DEADLOCK: "deadlocks", LOCK_WAIT_TIMEOUT: "lock_timeouts"}.get(code, "other_errors")
+                if code == SIGNAL_ERROR and "Not enough qty" in e.args[1]:
+                    outcome = "out_of_stock"
+                elif outcome == "other_errors":
+                    print("checkout failed:", e.args)
+            with lock:
+                counts[outcome] += 1
+                if outcome == "ok":
+                    order_ids.append(order_id)
+                    latencies.append(time.perf_counter() - start)
+        conn.close()
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(buyers)]
+    wall = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall
+
+    # every unit that left the stock is on an order, and no stock went below zero
+    stock_check = {}
+    for name in HOT_PRODUCTS:
+        cursor.execute("SELECT qty_in_stock FROM product WHERE p_name = %s", (name,))
+        left = cursor.fetchone()[0]
+        cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM order_item WHERE p_name = %s", (name,))
+        sold = int(cursor.fetchone()[0])
+        stock_check[name] = {"stock": stock, "sold": sold, "left": left, "consistent": left >= 0 and stock - sold == left}
+
+    if order_ids:
+        cursor.execute(f"DELETE FROM delivery WHERE order_id IN ({', '.join(['%s'] * len(order_ids))})", order_ids)
+        cursor.execute(f"DELETE FROM order_invoice WHERE order_id IN ({', '.join(['%s'] * len(order_ids))})", order_ids)
+    cursor.execute(f"DELETE FROM product WHERE p_name IN ({', '.join(['%s'] * len(HOT_PRODUCTS))})", HOT_PRODUCTS)
+    cursor.close()
+    admin.close()
+
+    ms = np.array(latencies or [0.0]) * 1000
+    return {"buyers": buyers, "orders_per_buyer": orders_per_buyer, "wall_s": wall, "orders_per_s": counts["ok"] / wall,
+            "p50_ms": float(np.percentile(ms, 50)), "p95_ms": float(np.percentile(ms, 95)),
+            "p99_ms": float(np.percentile(ms, 99)), **counts, "stock_check": stock_check}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    '''scenarios slower than the baseline by more than tolerance (p50 or p95), or making more round trips'''
+    regressions = []
+    print(f"\n{'scenario':<40} {'p50 now/base':>14} {'p95 now/base':>14} {'trips now/base':>16}")
+    for name, base in baseline["results"].items():
+        now = results["results"].get(name)
+        if now is None:
+            continue
+        p50 = now["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        p95 = now["p95_ms"] / base["p95_ms"] if base["p95_ms"] else 1.0
+        flag = ""
+        if p50 > 1 + tolerance or p95 > 1 + tolerance or now["round_trips"] > base["round_trips"]:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(f"{name:<40} {p50:14.2f} {p95:14.2f} {now['round_trips']:>7}/{base['round_trips']:<8}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the admin data paths against a (scaled) database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run.add_argument("--out", default="bench_results.json")
+    run.add_argument("--baseline", help="results file to compare with, exits with 1 on a regression")
+    run.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    run.add_argument("--repeat", type=int, default=10, help="timed runs per scenario")
+    run.add_argument("--tables", nargs="+", default=['product', 'customer', 'order_invoice', 'order_item'])
+    run.add_argument("--commit-rows", type=int, default=1000, help="rows written by each commit scenario")
+    run.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 100, 1000])
+    run.add_argument("--year", type=int, default=datetime.now().year, help="year of the sales report")
+    run.add_argument("--secrets", default=".streamlit/secrets.toml", help="file with the DB_* credentials")
+    stress = commands.add_parser("checkout", help="concurrent checkouts of the same products, checks for oversell")
+    stress.add_argument("--buyers", type=int, default=16, help="concurrent connections checking out")
+    stress.add_argument("--orders", type=int, default=50, help="checkouts per buyer")
+    stress.add_argument("--stock", type=int, default=500, help="starting stock of each contested product")
+    stress.add_argument("--max-deadlocks", type=int, default=0, help="deadlocks tolerated before failing")
+    stress.add_argument("--seed", type=int, default=1)
+    stress.add_argument("--secrets", default=".streamlit/secrets.toml", help="file with the DB_* credentials")
+    cmp = commands.add_parser("compare", help="compare a results file with a baseline")
+    cmp.add_argument("results")
+    cmp.add_argument("baseline")
+    cmp.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "checkout":
+        result = checkout_stress(toml.load(args.secrets), args.buyers, args.orders, args.stock, args.seed)
+        print(json.dumps(result, indent=2))
+        oversold = [name for name, check in result["stock_check"].items() if not check["consistent"]]
+        if oversold:
+            print("stock and orders don't add up for", oversold)
+        if result["deadlocks"] > args.max_deadlocks:
+            print(f"{result['deadlocks']} deadlocks, at most {args.max_deadlocks} allowed")
+        sys.exit(1 if oversold or result["deadlocks"] > args.max_deadlocks else 0)
+
+    if args.command == "compare":
+        with open(args.results) as f_results, open(args.baseline) as f_baseline:
+            regressions = compare(json.load(f_results), json.load(f_baseline), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+    # one connection, so the session's Questions counter sees every statement of a scenario
+    my_db = ConnectionPool(connect_args(toml.load(args.secrets)), min_size=1, max_size=1, ping_interval=3600)
+    results = {"meta": {"started": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                        "machine": platform.platform(), "table_sizes": table_sizes(my_db), "repeat": args.repeat},
+               "results": run_benchmarks(my_db, args)}
+    my_db.close()
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("results written to", args.out)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
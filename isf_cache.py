@@ -0,0 +1,264 @@
+# This file contains the process-wide caches shared by all streamlit sessions.
+# Cached dataframes are shared read-only snapshots: sessions keep references to them, never modify them in place.
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from isf_sql import quote_ident
+
+
+def frame_bytes(df) -> int:
+    '''approximate memory footprint of a dataframe, including python objects in object columns'''
+    if isinstance(df, tuple): # e.g. (page dataframe, keyset position, has_more)
+        return sum(frame_bytes(item) for item in df)
+    if not hasattr(df, "memory_usage"): # small non-frame entries, e.g. row counts
+        return sys.getsizeof(df)
+    usage = df.memory_usage(index=True, deep=True) # a number for a series, one per column for a dataframe
+    return int(usage.sum() if hasattr(usage, "sum") else usage)
+
+
+def table_of(key) -> str:
+    '''entries are keyed by table name, or by a tuple starting with the table name (e.g. one page of a table)'''
+    return key[0] if isinstance(key, tuple) else key
+
+
+class TableCache:
+    '''
+    A shared snapshot cache of table dataframes keyed by table name, or by (table_name, ...) for parts of a table.
+
+    Entries expire after a per-table TTL and are explicitly invalidated when a commit touches the table;
+    invalidating a table drops every entry of that table.
+    When the total size of the cached dataframes goes over max_bytes, the least recently used entries are evicted.
+
+    params:
+        max_bytes: memory cap for all cached dataframes together
+        default_ttl: seconds an entry stays fresh, None for no expiry
+        ttls: {table_name: seconds} overriding default_ttl for specific tables
+    '''
+
+    def __init__(self, max_bytes: int, default_ttl=None, ttls=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key: (df, loaded_at, nbytes), least recently used first
+        self._loading = {}  # key: lock held while the entry is being fetched, so it's fetched once
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def _ttl(self, key):
+        return self.ttls.get(table_of(key), self.default_ttl)
+
+    def _fresh(self, key, loaded_at) -> bool:
+        ttl = self._ttl(key)
+        return ttl is None or time.monotonic() - loaded_at < ttl
+
+    def _lookup(self, key):
+        '''return the cached df if present and fresh, must hold self._lock'''
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        df, loaded_at, nbytes = entry
+        if not self._fresh(key, loaded_at):
+            self._drop(key)
+            self._stats["expired"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return df
+
+    def get(self, key, loader):
+        '''return the cached dataframe for a key, calling loader() to fetch it on a miss or after expiry'''
+        with self._lock:
+            df = self._lookup(key)
+            if df is not None:
+                self._stats["hits"] += 1
+                return df
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # only one thread fetches a given entry, the others wait and then read it from the cache
+        with load_lock:
+            with self._lock:
+                df = self._lookup(key)
+                if df is not None:
+                    self._stats["hits"] += 1
+                    return df
+                self._stats["misses"] += 1
+            try:
+                df = loader()
+                self.put(key, df)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+            return df
+
+    def peek(self, key):
+        '''return the cached dataframe for a key if it is cached and fresh, without loading it'''
+        with self._lock:
+            return self._lookup(key)
+
+    def put(self, key, df):
+        '''store a new snapshot for a key, replacing the old one, then evict down to the memory cap'''
+        nbytes = frame_bytes(df)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (df, time.monotonic(), nbytes)
+            self._bytes += nbytes
+            # evict least recently used entries, but always keep the one just stored
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, table_name: str):
+        '''drop every entry of a table so the next get() fetches it again'''
+        with self._lock:
+            for key in [key for key in self._entries if table_of(key) == table_name]:
+                self._drop(key)
+                self._stats["invalidations"] += 1
+
+    def clear(self):
+        '''drop every entry'''
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry[2]
+        return True
+
+    def age(self, key):
+        '''seconds since the cached snapshot for a key was loaded, None if not cached'''
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            res = dict(self._stats)
+            res["entries"] = len(self._entries)
+            res["bytes"] = self._bytes
+            res["max_bytes"] = self.max_bytes
+        lookups = res["hits"] + res["misses"]
+        res["hit_ratio"] = res["hits"] / lookups if lookups else 0.0
+        return res
+
+
+class ChangeToken:
+    '''
+    A cheap fingerprint of the data some cached results depend on, e.g. the max id and row counts of a table.
+    The token query is run at most once per min_interval seconds, however many sessions ask;
+    changed() tells whether the token moved since it was last read, so the dependent entries can be dropped.
+    '''
+
+    def __init__(self, query: str, min_interval: float):
+        self.query = query
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._token = None
+        self._checked_at = None
+
+    def changed(self, my_db) -> bool:
+        '''read the token again if it is due, return whether it differs from the previous reading'''
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < self.min_interval:
+                return False
+            self._checked_at = now # other sessions keep the current results while this one reads
+
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.query)
+            token = cursor.fetchone()
+            cursor.close()
+        with self._lock:
+            changed = self._token is not None and token != self._token
+            self._token = token
+        return changed
+
+
+class TableWatch:
+    '''
+    Change detection for the tables shown in open views, from the UPDATE_TIME InnoDB keeps in memory for each table
+    (information_schema.TABLES, read with information_schema_stats_expiry = 0 so it isn't served from the cached
+    statistics): one query for every watched table at most once per min_interval, however big the tables are and
+    however many sessions ask. Each table has a generation number that moves when the table changed,
+    so a view can tell whether it is behind.
+    UPDATE_TIME is NULL for a table not written since the server started (it isn't persisted), such tables are
+    fingerprinted with their COUNT(*) and MAX(updated_col) instead, until UPDATE_TIME is set again.
+    '''
+
+    def __init__(self, min_interval: float, updated_col: str = None):
+        self.min_interval = min_interval
+        self.updated_col = updated_col
+        self._lock = threading.Lock()
+        self._tables = set()
+        self._tokens = {} # table: (UPDATE_TIME, fingerprint when it is NULL) at the last probe
+        self._probed_at = None # server time of the last probe
+        self._checked_at = None
+        self._generations = {}
+
+    def poll(self, my_db, tables: list, on_change=None) -> dict:
+        '''
+        probe the watched tables if it is due (a table is watched from its first poll on), calling
+        on_change(changed tables) before their generations move, so other sessions find the caches already updated.
+        returns: {table: generation} for the tables asked
+        '''
+        with self._lock:
+            self._tables.update(tables)
+            now = time.monotonic()
+            due = self._checked_at is None or now - self._checked_at >= self.min_interval
+            if due:
+                self._checked_at = now # other sessions keep the current generations while this one probes
+                watched = sorted(self._tables)
+
+        if due:
+            changed = self._probe(my_db, watched)
+            if changed and on_change is not None:
+                on_change(changed)
+            with self._lock:
+                for table in changed:
+                    self._generations[table] = self._generations.get(table, 0) + 1
+        with self._lock:
+            return {table: self._generations.get(table, 0) for table in tables}
+
+    def _probe(self, my_db, watched: list) -> set:
+        '''read UPDATE_TIME of the watched tables, return the tables that changed since the previous probe'''
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+            cursor.execute("SELECT t.TABLE_NAME, t.UPDATE_TIME, NOW(), "
+                           "EXISTS (SELECT 1 FROM information_schema.COLUMNS c WHERE c.TABLE_SCHEMA = t.TABLE_SCHEMA "
+                           "AND c.TABLE_NAME = t.TABLE_NAME AND c.COLUMN_NAME = %s) "
+                           "FROM information_schema.TABLES t WHERE t.TABLE_SCHEMA = DATABASE() "
+                           "AND t.TABLE_NAME IN (" + ", ".join(["%s"] * len(watched)) + ")",
+                           [self.updated_col, *watched])
+            rows = cursor.fetchall()
+            fingerprints = {}
+            unknown = [(table, has_updated) for table, update_time, _, has_updated in rows if update_time is None]
+            if unknown:
+                cursor.execute(" UNION ALL ".join(
+                    f"SELECT %s, COUNT(*), {f'MAX({quote_ident(self.updated_col)})' if has_updated else 'NULL'} "
+                    f"FROM {quote_ident(table)}" for table, has_updated in unknown), [table for table, _ in unknown])
+                fingerprints = {table: (count, last_updated) for table, count, last_updated in cursor.fetchall()}
+            cursor.close()
+
+        changed = set()
+        with self._lock:
+            for table, update_time, probed_at, _ in rows:
+                token = (update_time, fingerprints.get(table))
+                # UPDATE_TIME has a resolution of one second: a table written in the second of the previous probe
+                # may have changed again after it without UPDATE_TIME moving, so it is read again once more
+                if table in self._tokens and (token != self._tokens[table] or (
+                        update_time is not None and self._probed_at is not None and update_time >= self._probed_at)):
+                    changed.add(table)
+                self._tokens[table] = token
+            if rows:
+                self._probed_at = rows[0][2]
+        return changed
@@ -0,0 +1,182 @@
+# This file contains the schema metadata catalog: columns, types, keys and foreign keys of every table,
+# built from a single information_schema query and kept in memory for the whole process.
+
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+# one round trip for the whole schema: every column, joined with the key constraints it takes part in
+# (a column can show up in several rows, e.g. order_item.order_id is part of the PK and of a FK)
+CATALOG_QUERY = """
+SELECT c.TABLE_NAME, c.COLUMN_NAME, c.ORDINAL_POSITION, c.DATA_TYPE, c.COLUMN_TYPE, c.IS_NULLABLE,
+       c.COLUMN_DEFAULT, c.CHARACTER_MAXIMUM_LENGTH, c.NUMERIC_PRECISION, c.NUMERIC_SCALE, c.EXTRA,
+       k.CONSTRAINT_NAME, k.ORDINAL_POSITION, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+       r.UPDATE_RULE, r.DELETE_RULE
+FROM information_schema.COLUMNS c
+JOIN information_schema.TABLES t
+  ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME AND t.TABLE_TYPE = 'BASE TABLE'
+LEFT JOIN information_schema.KEY_COLUMN_USAGE k
+  ON k.TABLE_SCHEMA = c.TABLE_SCHEMA AND k.TABLE_NAME = c.TABLE_NAME AND k.COLUMN_NAME = c.COLUMN_NAME
+LEFT JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+  ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.TABLE_NAME = k.TABLE_NAME
+ AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+WHERE c.TABLE_SCHEMA = DATABASE()
+ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION, k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+"""
+
+ENUM_VALUE = re.compile(r"'((?:[^']|'')*)'")
+
+
+@dataclass
+class ColumnInfo:
+    name: str
+    position: int
+    data_type: str  # e.g. 'int', 'varchar', 'enum', 'date'
+    column_type: str  # full type, e.g. "varchar(64)", "enum('placed','in-transit','delivered')"
+    nullable: bool
+    default: object
+    max_length: int  # characters for string types, None otherwise
+    precision: int
+    scale: int
+    auto_increment: bool
+    enum_values: tuple = ()
+    generated: bool = False  # a VIRTUAL/STORED generated column, computed by MySQL
+
+
+@dataclass
+class ForeignKey:
+    name: str
+    table: str
+    columns: tuple
+    referenced_table: str
+    referenced_columns: tuple
+    on_update: str  # 'CASCADE', 'RESTRICT', 'SET NULL', 'NO ACTION'
+    on_delete: str
+
+
+@dataclass
+class TableInfo:
+    name: str
+    columns: list = field(default_factory=list)  # [ColumnInfo, ...] in table order
+    primary_key: tuple = ()
+    unique_keys: dict = field(default_factory=dict)  # {constraint_name: (col, ...)}
+    foreign_keys: list = field(default_factory=list)  # [ForeignKey, ...]
+
+    def column(self, name) -> ColumnInfo:
+        for col in self.columns:
+            if col.name == name:
+                return col
+        raise KeyError(f"{self.name} has no column {name}")
+
+    @property
+    def column_names(self) -> list:
+        return [col.name for col in self.columns]
+
+    @property
+    def fk_columns(self) -> set:
+        return {col for fk in self.foreign_keys for col in fk.columns}
+
+    @property
+    def view_only_columns(self) -> list:
+        '''
+        columns MySQL fills in itself: generated columns, and auto-increment ids (the surrogate primary keys)
+        unless they are also foreign keys to pick from
+        '''
+        return [col.name for col in self.columns
+                if col.generated or (col.auto_increment and col.name not in self.fk_columns)]
+
+
+class Catalog:
+    '''
+    In-memory schema metadata for every base table of the connected database.
+    Built by refresh() with one information_schema query; call refresh() again after schema changes.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = {}
+        self.loaded_at = None
+
+    def refresh(self, my_db):
+        '''re-read the schema metadata through a connection borrowed from the pool'''
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(CATALOG_QUERY)
+            rows = cursor.fetchall()
+            cursor.close()
+        tables = build_tables(rows)
+        with self._lock:
+            self._tables = tables
+            self.loaded_at = time.time()
+
+    def table_names(self) -> list:
+        return sorted(self._tables)
+
+    def table(self, table_name: str) -> TableInfo:
+        try:
+            return self._tables[table_name]
+        except KeyError:
+            raise KeyError(f"unknown table {table_name}") from None
+
+    def columns(self, table_name: str) -> list:
+        '''column names of a table, in table order'''
+        return self.table(table_name).column_names
+
+    def primary_key(self, table_name: str) -> tuple:
+        '''the (possibly composite) primary key columns of a table'''
+        return self.table(table_name).primary_key
+
+    def foreign_keys(self, table_name: str) -> list:
+        '''foreign keys declared on a table'''
+        return self.table(table_name).foreign_keys
+
+    def referenced_by(self, table_name: str) -> list:
+        '''foreign keys of other tables that reference this table'''
+        return [fk for table in self._tables.values() for fk in table.foreign_keys
+                if fk.referenced_table == table_name]
+
+
+def build_tables(rows) -> dict:
+    '''turn the rows of CATALOG_QUERY into {table_name: TableInfo}'''
+    tables = {}
+    fks = {}  # (table, constraint): ForeignKey, composite foreign keys span several rows
+    key_parts = {}  # (table, constraint): [(position in key, column, referenced column), ...]
+    for (table_name, col_name, position, data_type, column_type, is_nullable, default, max_length,
+         precision, scale, extra, constraint, key_position, ref_table, ref_column, update_rule, delete_rule) in rows:
+        table = tables.setdefault(table_name, TableInfo(table_name))
+        data_type = data_type.lower()
+        if not table.columns or table.columns[-1].name != col_name:
+            enum_values = ()
+            if data_type in ('enum', 'set'):
+                enum_values = tuple(v.replace("''", "'") for v in ENUM_VALUE.findall(column_type))
+            table.columns.append(ColumnInfo(
+                name=col_name, position=int(position), data_type=data_type, column_type=column_type,
+                nullable=(is_nullable == 'YES'), default=default,
+                max_length=int(max_length) if max_length is not None else None,
+                precision=int(precision) if precision is not None else None,
+                scale=int(scale) if scale is not None else None,
+                auto_increment=('auto_increment' in (extra or '').lower()), enum_values=enum_values,
+                generated=('generated' in (extra or '').lower())))
+
+        if constraint is None:
+            continue
+        key_parts.setdefault((table_name, constraint), []).append((int(key_position), col_name, ref_column))
+        if ref_table is not None and (table_name, constraint) not in fks:
+            fk = ForeignKey(constraint, table_name, (), ref_table, (), update_rule, delete_rule)
+            fks[(table_name, constraint)] = fk
+            table.foreign_keys.append(fk)
+
+    # rows come ordered by column position, put the columns of composite keys back in key order
+    for (table_name, constraint), parts in key_parts.items():
+        parts.sort()
+        cols = tuple(col for _, col, _ in parts)
+        table = tables[table_name]
+        if constraint == 'PRIMARY':
+            table.primary_key = cols
+        elif (table_name, constraint) in fks:
+            fks[(table_name, constraint)].columns = cols
+            fks[(table_name, constraint)].referenced_columns = tuple(ref for _, _, ref in parts)
+        else:
+            table.unique_keys[constraint] = cols
+    return tables
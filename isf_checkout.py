@@ -0,0 +1,38 @@
+# This file contains the client side of the single-call checkout (database/checkout_procedures.sql):
+# a whole cart is validated, ordered, taken from stock and scheduled for delivery in one transaction.
+
+import json
+
+import pymysql
+
+# MySQL error numbers of failed checkouts: a SIGNAL from the procedure, and lock conflicts worth a retry
+SIGNAL_ERROR = 1644
+DEADLOCK = 1213
+LOCK_WAIT_TIMEOUT = 1205
+
+
+def cart_json(cart) -> str:
+    '''the procedure's JSON cart from {p_name: quantity} or [(p_name, quantity), ...]'''
+    lines = cart.items() if isinstance(cart, dict) else cart
+    return json.dumps([{"p_name": p_name, "quantity": int(quantity)} for p_name, quantity in lines])
+
+
+def checkout(conn, procedure: str, customer_id: int, payment_type: str, coupon_code: str, cart, retries: int = 2):
+    '''
+    place an order for a whole cart in one round trip.
+    a deadlock or lock wait timeout rolls the whole checkout back, so it is simply run again (up to retries times);
+    a rejected cart (unknown product, not enough stock, ...) raises the procedure's pymysql error as is.
+    returns: (order_id, expected_delivery_date)
+    '''
+    args = (customer_id, payment_type, coupon_code, cart_json(cart))
+    for attempt in range(retries + 1):
+        cursor = conn.cursor()
+        try:
+            cursor.callproc(procedure, args)
+            order_id, delivery_date = cursor.fetchone()
+            return order_id, delivery_date
+        except pymysql.err.OperationalError as e:
+            if e.args[0] not in (DEADLOCK, LOCK_WAIT_TIMEOUT) or attempt == retries:
+                raise
+        finally:
+            cursor.close()
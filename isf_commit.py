@@ -0,0 +1,143 @@
+# This file contains the transactional batch executor used to commit data_editor changes.
+# Statements are grouped into batches; a batch that fails is replayed row by row so errors are reported per row.
+
+from dataclasses import dataclass, field
+
+import pymysql
+
+# commit modes: "atomic" saves nothing if any row fails, "savepoint" keeps every row that succeeded
+ATOMIC = "atomic"
+SAVEPOINT = "savepoint"
+
+# reported for a row of an expect_rows batch that matched nothing: its version moved on, or it was deleted
+CONFLICT = "Conflict: the row was changed or deleted by someone else since it was loaded"
+
+
+@dataclass
+class Batch:
+    '''
+    One round trip worth of changes.
+
+    sql, params: the batched statement, run with cursor.executemany(sql, params) if many, else cursor.execute(sql, params)
+    rows: [(sql, params, label), ...] the same changes as one statement per row, replayed when the batch fails;
+          label describes the row in error messages
+    expect_rows: every row must match exactly one row in the database (conditional UPDATE/DELETE on a row version);
+                 if the batch affects fewer, it is replayed row by row and the rows matching nothing are conflicts
+
+    filled in by run_batches() once the transaction is committed:
+    row_ok: [bool, ...] aligned with rows, whether the change of each row was saved
+    row_conflict: [bool, ...] aligned with rows, whether the row failed because it matched nothing (expect_rows)
+    row_error: [str or None, ...] aligned with rows, the error message of each row that failed
+    '''
+    sql: str
+    params: list
+    rows: list = field(default_factory=list)
+    many: bool = False
+    expect_rows: bool = False
+    row_ok: list = field(default_factory=list)
+    row_conflict: list = field(default_factory=list)
+    row_error: list = field(default_factory=list)
+
+
+def chunked(items: list, size: int):
+    '''split a list into consecutive chunks of at most size items'''
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_batches(conn, batches: list, mode: str = SAVEPOINT):
+    '''
+    run batches inside one explicit transaction on a borrowed connection.
+
+    each batch runs under a savepoint; if it fails it is rolled back and its rows are replayed one at a time,
+    each under its own savepoint, to find the rows that fail. an expect_rows batch that affected fewer rows
+    than it has is replayed the same way, a replayed row affecting none fails as a conflict. in ATOMIC mode the whole transaction is rolled
+    back when any row failed, in SAVEPOINT mode the rows that succeeded are committed.
+
+    returns: (failed labels, error messages, committed)
+    '''
+    failed = []
+    error_msgs = []
+    cursor = conn.cursor()
+    try:
+        conn.begin()
+        for batch in batches:
+            batch.row_ok = [False] * len(batch.rows)
+            batch.row_conflict = [False] * len(batch.rows)
+            batch.row_error = [None] * len(batch.rows)
+            cursor.execute("SAVEPOINT isf_batch")
+            try:
+                if batch.many:
+                    cursor.executemany(batch.sql, batch.params)
+                else:
+                    cursor.execute(batch.sql, batch.params)
+                if not batch.expect_rows or cursor.rowcount >= len(batch.rows):
+                    cursor.execute("RELEASE SAVEPOINT isf_batch")
+                    batch.row_ok = [True] * len(batch.rows)
+                    continue
+            except pymysql.Error:
+                pass
+            cursor.execute("ROLLBACK TO SAVEPOINT isf_batch")
+
+            # the batch failed as a whole (or missed rows), find out which rows caused it
+            for i, (sql, params, label) in enumerate(batch.rows):
+                cursor.execute("SAVEPOINT isf_row")
+                try:
+                    cursor.execute(sql, params)
+                    if batch.expect_rows and cursor.rowcount == 0:
+                        cursor.execute("RELEASE SAVEPOINT isf_row")
+                        batch.row_conflict[i] = True
+                        batch.row_error[i] = CONFLICT
+                        failed.append(label)
+                        error_msgs.append(CONFLICT)
+                        continue
+                    cursor.execute("RELEASE SAVEPOINT isf_row")
+                    batch.row_ok[i] = True
+                except pymysql.Error as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT isf_row")
+                    batch.row_error[i] = f"Error: {e.args[-1]}"
+                    failed.append(label)
+                    error_msgs.append(batch.row_error[i])
+
+        if failed and mode == ATOMIC:
+            conn.rollback()
+            for batch in batches:
+                batch.row_ok = [False] * len(batch.rows)
+            return failed, error_msgs, False
+        conn.commit()
+        return failed, error_msgs, True
+
+    except pymysql.Error as e:
+        # the transaction itself broke (deadlock, lost connection...): nothing of it was saved
+        try:
+            conn.rollback()
+        except pymysql.Error:
+            pass
+        for batch in batches:
+            batch.row_ok = [False] * len(batch.rows)
+        for batch in batches:
+            if len(batch.row_error) != len(batch.rows): # not reached before the transaction broke
+                batch.row_error = [None] * len(batch.rows)
+            for i, (_, _, label) in enumerate(batch.rows):
+                if batch.row_error[i] is None:
+                    batch.row_error[i] = f"Error: {e.args[-1]}"
+                    failed.append(label)
+                    error_msgs.append(batch.row_error[i])
+        return failed, error_msgs, False
+    finally:
+        cursor.close()
+
+
+def batch_failures(batches: list):
+    '''(failed labels, error messages) of the rows of some of the batches run by run_batches(), in batch order'''
+    failed = [(label, error) for batch in batches for (_, _, label), error in zip(batch.rows, batch.row_error)
+              if error is not None]
+    return [label for label, _ in failed], [error for _, error in failed]
+
+
+def commit_batches(my_db, batches: list, mode: str = SAVEPOINT):
+    '''borrow a connection from the pool and run the batches in one transaction, see run_batches()'''
+    if not batches:
+        return [], [], True
+    with my_db.connection() as conn:
+        return run_batches(conn, batches, mode)
@@ -12,45 +12,99 @@ DB_NAME = "seafood_service_v4"
 
 SITE_NAME = "Seafood Trading Co."
 
-VIEW_ONLY_TABLES = ['customer', 'order_invoice', 'order_item', 'delivery', 'vendor_supplies_seafood_product']
-EDITABLE_TABLES = ['category', 'coupon', 'delivery_partner', 'delivery_zone', 'payment', 'product', 'vendor']
+# connection pool shared by all sessions: connections kept open, upper bound, seconds to wait for a free one,
+# and seconds a connection may sit idle before it is pinged (and reconnected) on checkout
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 8
+POOL_TIMEOUT = 10
+POOL_PING_INTERVAL = 30
 
-# a dictionary of table_with_dropdown: [(fk_col, referenced_pk, referenced_table), ...]
-TABLE_WITH_DROPDOWN = {'product': [('category', 'category_name', 'category')],
-                       'delivery_zone': [('partner_id', 'partner_id', 'delivery_partner')]
-                    #    'vendor_supplies_seafood_product': [('vendor_id', 'vendor_id', 'vendor'), 
-                    #                                        ('pid', 'pid', 'product')]
-                    }   
+# shared table snapshot cache: memory cap for all cached tables, default seconds before a snapshot is refetched 
+# (None: only refetched after a commit or manual refresh), and per-table overrides
+TABLE_CACHE_MAX_MB = 256
+TABLE_CACHE_TTL = 600
+TABLE_CACHE_TTLS = {'order_invoice': 120, 
+                    'order_item': 120, 
+                    'delivery': 60, 
+                    'customer': 300}
+
+# committing data_editor edits: rows per executemany batch, and the default mode when some rows fail
+# ("savepoint": keep the rows that succeeded, "atomic": roll back all edited rows)
+COMMIT_BATCH_SIZE = 100
+COMMIT_MODE = "savepoint"
+# edits are checked all at once before the commit (isf_validate.py), the most rejected rows listed one by one
+# (more are shown as a table)
+EDIT_MAX_REJECTS = 10
+# "bulk": multi-row INSERT ... VALUES and DELETE ... WHERE pk IN (...) in chunks of the sizes below,
+# "procedure": one add_<table>/delete_from call per row, to validate the stored procedures
+WRITE_ENGINE = "bulk"
+INSERT_CHUNK_SIZE = 500
+DELETE_CHUNK_SIZE = 500
+
+# rows per chunk read from the unbuffered cursor when a whole table is loaded
+FETCH_CHUNK_SIZE = 5000
+
+# paged table views: rows per page choices (the first is the default), the estimated row count under which
+# the exact count is shown instead, and background threads prefetching the next page
+PAGE_SIZES = [100, 250, 500, 1000]
+EXACT_COUNT_BELOW = 100000
+PREFETCH_WORKERS = 2
+
+# analytics results shared by all sessions, keyed by (procedure, parameters): memory cap, seconds before a result
+# is computed again, and seconds between reads of the change token that drops every result when orders change
+RESULT_CACHE_MAX_MB = 32
+RESULT_CACHE_TTL = 900
+RESULT_TOKEN_INTERVAL = 5
+
+# foreign key dropdown options shared by all sessions: memory cap, seconds before a list is read again, 
+# the most values sent to the browser as a full list, and the most matches listed for a search in a bigger table
+OPTION_CACHE_MAX_MB = 32
+OPTION_CACHE_TTL = 600
+OPTION_LIST_MAX = 1000
+OPTION_SEARCH_LIMIT = 50
+
+# CSV/Parquet import and export of admin tables: file rows per transaction (sent in batches of INSERT_CHUNK_SIZE),
+# and the most rejected rows listed in the import report
+IMPORT_CHUNK_SIZE = 5000
+IMPORT_MAX_REJECTS = 1000
+
+# query timing log shown on the devops page: query records kept in memory, per-rerun totals kept,
+# and a JSONL file every record is also appended to (None: memory only)
+QUERY_LOG_SIZE = 5000
+QUERY_LOG_RERUNS = 500
+QUERY_LOG_FILE = None
+
+# row version columns added by database/row_versions.sql: commits only change a row whose version is still the one
+# the editor loaded (and bump it), a row changed by someone else meanwhile is reported as a conflict
+VERSION_COL = 'row_version'
+UPDATED_COL = 'updated_at'
+
+# open editors and table views rerun on their own every WATCH_INTERVAL seconds to show changes made elsewhere
+# (customer site, other app processes), found by one probe of the tables' update times for all sessions.
+# a cached table with an updated_at column gets the rows updated since its newest one merged in, going back
+# WATCH_GRACE seconds for transactions that committed after newer ones
+WATCH_INTERVAL = 5
+WATCH_GRACE = 10
+
+# query plan checks (isf_plancheck.py): full scans of tables estimated to have fewer rows are not flagged
+PLAN_SCAN_MIN_ROWS = 1000
+
+VIEW_ONLY_TABLES = ['customer', 'order_invoice', 'order_item', 'delivery']
+EDITABLE_TABLES = ['category', 'coupon', 'delivery_partner', 'delivery_zone', 'payment', 'product', 'vendor',
+                   'vendor_supplies_seafood_product']
 
 DELIVERY_STATUS = ['placed','in-transit','delivered']
+# the statuses of the deliveries still to be done, listed in a delivery partner's work queue
+DELIVERY_OPEN = ['placed', 'in-transit']
 
 STRONG_ENTITY = ['customer', 'delivery_partner', 'vendor', 'delivery_zone', 'category', 'product', 'coupon', 'payment']
 
-TABLE_PK = {'category': 'category_name', 
-            'coupon': 'coupon_code', 
-            'customer': 'cid', 
-            'delivery': 'order_id',
-            'delivery_partner': 'partner_id',
-            'delivery_zone': 'zipcode',
-            'payment': 'payment_type',
-            'product': 'pid',
-            'vendor': 'vendor_id',
-            'vendor_supplies_seafood_product': 'vendor_id'}
-
-# True means all columns are view only, False means all columns are editable
-VIEW_ONLY_COLS = {'product': ['pid', 'qty_in_stock'], 
-                  'category': False,
-                  'coupon': False,
-                  'customer': True,
-                  'delivery': ['order_id'],
-                  'delivery_zone': False,
-                  'delivery_partner': ['partner_id'],
-                  'delivery_status': ['order_id', 'delivery_partner_id'],
-                  'payment': False,
-                  'order_invoice': True,
-                  'order_item': True,
-                  'vendor': ['vendor_id'],
-                  'vendor_supplies_seafood_product': True} # temporary set to uneditable
+# primary keys, foreign key dropdowns and auto-increment ids come from the schema catalog (isf_catalog.py)
+
+# columns the schema can't tell are view only: the stock only changes with orders.
+# generated columns, auto-increment ids and row version columns come from the schema catalog,
+# see get_view_only_cols(); every column of a VIEW_ONLY_TABLES table is view only
+VIEW_ONLY_COLS = {'product': ['qty_in_stock']}
 
 
 # names of the procedures to call for CRUD and other operations
@@ -58,13 +112,25 @@ PROCEDURES = {'create': 'add_',  # call add_<table_name> (params: all fields) fo
               'read': 'read_table', # read_table(table_name). This might need to be function as it will return things.
               'update': 'update_table', # update_table(tablename_p, field_p, new_val_p, pk_field_p, pk_val_p)
               'delete': 'delete_from',  # delete_from(table_name, pk_field_name, pk_value)
-              'get_col': 'get_all',  # get_all(col_name, table_name)
+              'get_col': 'get_all',  # get_all(col_name, table_name), dropdowns now read through isf_options.py
               'Number of Orders per Customer': 'count_order_per_cid' # count_order_by_cid()
               } 
 
-# names of the analytics procedures
-ANALYTICS = {'Number of Orders per Customer': 'count_order_per_cid', # count_order_by_cid()
-             'Best Selling Products by Year': 'get_product_sales' # get_product_sales(year)
+# names of the analytics procedures, reading the rollups kept up to date by triggers (database/rollup_procedures.sql)
+ANALYTICS = {'Number of Orders per Customer': 'count_order_per_cid_rollup', # count_order_per_cid_rollup()
+             'Best Selling Products by Year': 'get_product_sales_rollup' # get_product_sales_rollup(year)
                         }
+# reports compared over periods on the analytics page, called with (start date, end date) for [start, end)
+PERIOD_REPORTS = {'Best Selling Products': 'get_product_sales_range', # get_product_sales_range(start, end)
+                  'Orders per Customer': 'count_order_per_cid_range'} # count_order_per_cid_range(start, end)
+# threads running the queries of a comparison at once, each on its own pooled connection
+ANALYTICS_WORKERS = 4
+# the procedures aggregating the order tables directly, the rollups must return the same results
+ANALYTICS_SOURCE = {'Number of Orders per Customer': 'count_order_per_cid',
+                    'Best Selling Products by Year': 'get_product_sales'}
+ROLLUP_REBUILD = 'rebuild_sales_rollups'
+
+# the single-call checkout of a whole cart (database/checkout_procedures.sql), see isf_checkout.py
+CHECKOUT = 'checkout_cart' # checkout_cart(customer_id, payment_type, coupon_code, cart JSON)
 
 # names of the procedures to call for CRUD and other operations
\ No newline at end of file
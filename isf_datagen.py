@@ -0,0 +1,207 @@
+# This file contains the synthetic data generator used to scale the schema for load tests and benchmarks.
+# It appends generated vendors, products, customers, delivery zones, orders, items and deliveries to the
+# database named in .streamlit/secrets.toml (load database/dump.sql first), in chunks of multi-row INSERTs.
+#
+#   python isf_datagen.py --scale small            # 10k orders
+#   python isf_datagen.py --orders 250000 --seed 7
+#
+# Only run it against a local database: it writes millions of rows at the larger scales.
+
+import argparse
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+
+import pymysql
+import toml
+
+from isf_pool import connect_args
+
+# orders per scale; the other tables are sized from the number of orders in sizes_for()
+SCALES = {"small": 10_000, "medium": 1_000_000, "large": 10_000_000}
+
+SPECIES = ["Salmon", "Tuna", "Cod", "Halibut", "Scallop", "Shrimp", "Lobster", "Crab", "Oyster", "Mussel",
+           "Clam", "Octopus", "Squid", "Uni", "Mackerel", "Haddock", "Swordfish", "Eel", "Roe", "Sardine"]
+CUTS = ["Filet", "Steak", "Whole", "Sashimi", "Smoked", "Frozen", "Live", "Loin"]
+FIRST_NAMES = ["Ava", "Ben", "Chloe", "Dan", "Emma", "Finn", "Grace", "Hugo", "Ivy", "Jack", "Kai", "Lena",
+               "Max", "Nora", "Owen", "Pia", "Quinn", "Ruth", "Sam", "Tess", "Uma", "Vic", "Will", "Zoe"]
+LAST_NAMES = ["Smith", "Brown", "Lee", "Garcia", "Miller", "Davis", "Clark", "Lopez", "Young", "King",
+              "Wright", "Hill", "Scott", "Green", "Adams", "Baker", "Nelson", "Carter", "Perez", "Roberts"]
+STATES = ["ME", "MA", "NH", "VT", "RI", "CT", "NY"]
+
+
+def sizes_for(n_orders: int) -> dict:
+    '''row counts of the other tables for a number of orders'''
+    return {"orders": n_orders,
+            "customers": max(100, n_orders // 8),
+            "products": min(2000, max(100, n_orders // 1000)),
+            "categories": 12,
+            "vendors": max(10, min(500, n_orders // 5000)),
+            "partners": max(5, min(300, n_orders // 10000)),
+            "zones": max(50, min(3000, n_orders // 1000))}
+
+
+def zipf_weights(n: int, s: float) -> list:
+    '''cumulative weights of ranks 1..n with popularity proportional to 1 / rank**s'''
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+class Loader:
+    '''multi-row inserts in chunks, committed chunk by chunk, with a progress line per table'''
+
+    def __init__(self, conn, chunk_size: int):
+        self.conn = conn
+        self.chunk_size = chunk_size
+
+    def insert_chunk(self, table: str, cols: tuple, rows: list):
+        '''insert a list of row tuples; pymysql's executemany sends them as multi-row INSERT ... VALUES'''
+        cursor = self.conn.cursor()
+        cursor.executemany(f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['%s'] * len(cols))})", rows)
+        cursor.close()
+
+    def insert(self, table: str, cols: tuple, rows):
+        '''insert an iterable of row tuples chunk by chunk, committing each chunk'''
+        start = time.perf_counter()
+        total = 0
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self.insert_chunk(table, cols, chunk)
+            self.conn.commit()
+            total += len(chunk)
+            print(f"\r{table}: {total} rows", end="", flush=True)
+        print(f"\r{table}: {total} rows in {time.perf_counter() - start:.1f}s")
+
+    def next_id(self, table: str, col: str) -> int:
+        cursor = self.conn.cursor()
+        cursor.execute(f"SELECT COALESCE(MAX({col}), 0) + 1 FROM {table}")
+        next_id = int(cursor.fetchone()[0])
+        cursor.close()
+        return next_id
+
+    def column(self, sql: str) -> list:
+        cursor = self.conn.cursor()
+        cursor.execute(sql)
+        values = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return values
+
+
+def generate(conn, sizes: dict, years: int, seed: int, chunk_size: int):
+    '''append synthetic rows of every table; ids continue after the existing rows'''
+    rng = random.Random(seed)
+    load = Loader(conn, chunk_size)
+    run = f"g{seed}"  # keeps generated names unique between runs with different seeds
+
+    categories = [f"{run} Category {i}" for i in range(sizes["categories"])]
+    load.insert("category", ("category_name",), ((name,) for name in categories))
+
+    first_pid = load.next_id("product", "pid")
+    products = [f"{run} {rng.choice(CUTS)} {rng.choice(SPECIES)} {i}" for i in range(sizes["products"])]
+    load.insert("product", ("pid", "p_name", "category", "sell_price", "qty_in_stock", "product_img"),
+                ((first_pid + i, name, rng.choice(categories), rng.randint(5, 120), rng.randint(0, 5000),
+                  f"https://picsum.photos/200/300?random={i}") for i, name in enumerate(products)))
+
+    first_vendor = load.next_id("vendor", "vendor_id")
+    load.insert("vendor", ("vendor_id", "first_name", "last_name", "phone_number", "steet_number", "street_name",
+                           "city", "state", "zip"),
+                ((first_vendor + i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"{rng.randrange(10**10):010d}",
+                  str(rng.randint(1, 999)), "Wharf St", "Portland", rng.choice(STATES), f"{rng.randrange(10**5):05d}")
+                 for i in range(sizes["vendors"])))
+    # every product has one to three suppliers
+    supplies = {(first_vendor + rng.randrange(sizes["vendors"]), first_pid + i)
+                for i in range(sizes["products"]) for _ in range(rng.randint(1, 3))}
+    load.insert("vendor_supplies_seafood_product", ("vendor_id", "pid", "price_per_qty"),
+                ((vendor_id, pid, round(rng.uniform(3, 80), 2)) for vendor_id, pid in sorted(supplies)))
+
+    first_partner = load.next_id("delivery_partner", "partner_id")
+    load.insert("delivery_partner", ("partner_id", "first_name", "last_name", "phone"),
+                ((first_partner + i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"{rng.randrange(10**11):011d}")
+                 for i in range(sizes["partners"])))
+    taken = set(load.column("SELECT zipcode FROM delivery_zone"))
+    zips = [zipcode for zipcode in (f"{n:05d}" for n in rng.sample(range(1000, 99999), sizes["zones"] + len(taken)))
+            if zipcode not in taken][:sizes["zones"]]
+    # zones per partner are skewed too, a few partners cover most of the area
+    partner_weights = zipf_weights(sizes["partners"], 0.8)
+    zone_partner = {zipcode: first_partner + rng.choices(range(sizes["partners"]), cum_weights=partner_weights)[0]
+                    for zipcode in zips}
+    load.insert("delivery_zone", ("zipcode", "partner_id"), zone_partner.items())
+
+    # customers live in the delivery zones, more of them in the first (busier) zones
+    first_cid = load.next_id("customer", "cid")
+    zone_weights = zipf_weights(len(zips), 0.6)
+    customer_zip = rng.choices(zips, cum_weights=zone_weights, k=sizes["customers"])
+    load.insert("customer", ("cid", "c_fname", "c_lname", "email", "pwd", "phone", "street", "apt", "city", "state", "zip"),
+                ((first_cid + i, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"{run}.c{first_cid + i}@example.com",
+                  "hashed_password", f"{rng.randrange(10**11):011d}", f"{rng.randint(1, 999)} Main St",
+                  None if rng.random() < 0.6 else f"Apt {rng.randint(1, 99)}", "Portland", rng.choice(STATES), zipcode)
+                 for i, zipcode in enumerate(customer_zip)))
+
+    payments = load.column("SELECT payment_type FROM payment")
+    coupons = load.column("SELECT coupon_code FROM coupon WHERE coupon_code <> ''")
+    all_products = load.column("SELECT p_name FROM product")
+    product_weights = zipf_weights(len(all_products), 1.1)
+    # a few loyal customers place many orders (pareto), orders spread over the last years with more recent ones
+    customer_weights = list(itertools.accumulate(rng.paretovariate(1.2) for _ in range(sizes["customers"])))
+    now = datetime.now().replace(microsecond=0)
+    span = timedelta(days=365 * years).total_seconds()
+
+    # orders are written a chunk at a time with their items and deliveries, so memory stays flat at any scale
+    first_order = load.next_id("order_invoice", "order_id")
+    start = time.perf_counter()
+    for chunk_start in range(0, sizes["orders"], chunk_size):
+        orders, items, deliveries = [], [], []
+        for order_id in range(first_order + chunk_start, first_order + min(chunk_start + chunk_size, sizes["orders"])):
+            customer = rng.choices(range(sizes["customers"]), cum_weights=customer_weights)[0]
+            order_date = now - timedelta(seconds=int(span * rng.random() ** 1.5))
+            coupon = rng.choice(coupons) if coupons and rng.random() < 0.15 else None
+            orders.append((order_id, first_cid + customer, rng.choice(payments), coupon, order_date))
+            for p_name in set(rng.choices(all_products, cum_weights=product_weights, k=rng.randint(1, 5))):
+                items.append((order_id, p_name, rng.randint(1, 10)))
+            age = (now - order_date).days
+            status = "delivered" if age > 7 else ("in-transit" if age > 1 else "placed")
+            deliveries.append((order_id, zone_partner[customer_zip[customer]],
+                               (order_date + timedelta(days=rng.randint(1, 5))).date(), status))
+        load.insert_chunk("order_invoice", ("order_id", "customer_id", "payment_type", "coupon_code", "order_date"), orders)
+        load.insert_chunk("order_item", ("order_id", "p_name", "quantity"), items)
+        load.insert_chunk("delivery", ("order_id", "delivery_partner_id", "expected_delivery_date", "delivery_status"),
+                          deliveries)
+        conn.commit()
+        print(f"\rorders: {chunk_start + len(orders)} with their items and deliveries", end="", flush=True)
+    print(f" in {time.perf_counter() - start:.1f}s")
+
+    # rows inserted before the rollup triggers existed (or with them dropped for speed) are picked up here
+    cursor = conn.cursor()
+    try:
+        cursor.callproc("rebuild_sales_rollups")
+        conn.commit()
+        print("sales rollups rebuilt")
+    except pymysql.Error as e:
+        print("sales rollups not rebuilt:", e.args[-1])
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append synthetic rows to the seafood schema for load tests.")
+    parser.add_argument("--scale", choices=list(SCALES), default="small", help="preset number of orders")
+    parser.add_argument("--orders", type=int, help="number of orders, overrides --scale")
+    parser.add_argument("--years", type=int, default=3, help="orders are spread over this many past years")
+    parser.add_argument("--seed", type=int, default=1, help="same seed, same data")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="rows per INSERT round trip and commit")
+    parser.add_argument("--secrets", default=".streamlit/secrets.toml", help="file with the DB_* credentials")
+    args = parser.parse_args()
+
+    sizes = sizes_for(args.orders or SCALES[args.scale])
+    print("generating", sizes)
+    conn = pymysql.connect(**dict(connect_args(toml.load(args.secrets)), autocommit=False))
+    try:
+        generate(conn, sizes, args.years, args.seed, args.chunk_size)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
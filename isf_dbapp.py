@@ -1,29 +1,46 @@
 import pymysql
 import pandas as pd
 import streamlit as st
+import os
+import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
 
 import isf_config as config 
+from isf_pool import ConnectionPool, connect_args
+from isf_cache import TableCache, ChangeToken, TableWatch
+from isf_catalog import Catalog
+from isf_pages import FILTER_OPS, PageQuery, fetch_page, estimate_count
+from isf_sql import (quote_ident, describe_pk, update_statement, case_update_statement, insert_statement, 
+                     delete_statement, call_statement)
+import isf_commit as committer
+from isf_refresh import TouchedRows, cascaded_tables, fetch_rows
+from isf_frames import column_dtypes, read_frame
+from isf_rollups import rebuild_rollups, compare_rollups
+from isf_options import load_options, search_options
+from isf_metrics import QueryLog, timed_cursor
+from isf_delivery import load_queue, read_feed, apply_feed
+from isf_transfer import FORMATS, file_format, file_rows, import_file, export_table
+from isf_validate import fold_key, validate_edits
+from isf_analytics import EDITED_TOKEN_TABLES, orders_token_query, ORDER_YEARS_QUERY, fetch_report, fetch_reports, compare_periods
 
-# cache database connection
+# cache the connection pool, shared by all sessions and script threads
 @st.cache_resource
 # connect to the remote hosted MySQL database using streamlit.secrets
-def connectDB(db_name) -> pymysql.connections.Connection:
+def connectDB(db_name) -> ConnectionPool:
     try: 
-        connection = pymysql.connect(
-            host = st.secrets["DB_HOST"],
-            port = st.secrets["DB_PORT"],
-            user = st.secrets["DB_USER"],
-            password = st.secrets["DB_PASSWORD"],
-            database = st.secrets["DB_NAME"],
-            # database = db_name,
-            cursorclass =pymysql.cursors.Cursor,
-            # cursorclass=pymysql.cursors.DictCursor,
-            autocommit = True)
+        pool = ConnectionPool(
+            # database = st.secrets["DB_NAME"] rather than db_name, every query is timed into the query log
+            dict(connect_args(st.secrets), cursorclass = timed_cursor(get_query_log())),
+            min_size = config.POOL_MIN_SIZE,
+            max_size = config.POOL_MAX_SIZE,
+            timeout = config.POOL_TIMEOUT,
+            ping_interval = config.POOL_PING_INTERVAL)
 
         print(">>> Connected to ", db_name, "<<<")
         print("-----------------------------------------")
-        return connection
+        return pool
     except pymysql.Error as e:
         code, msg = e.args
         print(f"Connection to {db_name} failed. Please try again.")
@@ -32,6 +49,61 @@ def connectDB(db_name) -> pymysql.connections.Connection:
         return None
     
 
+# one cache of table pages and row counts for the whole process, shared read-only by all sessions
+@st.cache_resource
+def get_table_cache() -> TableCache:
+    return TableCache(max_bytes = config.TABLE_CACHE_MAX_MB * 1024 * 1024,
+                      default_ttl = config.TABLE_CACHE_TTL,
+                      ttls = config.TABLE_CACHE_TTLS)
+
+# schema metadata (columns, keys, foreign keys) read once per process, refreshed explicitly from the devops page
+@st.cache_resource
+def get_catalog(_my_db) -> Catalog:
+    catalog = Catalog()
+    catalog.refresh(_my_db)
+    return catalog
+
+# analytics results keyed by (procedure, parameters), shared by all sessions
+@st.cache_resource
+def get_result_cache() -> TableCache:
+    return TableCache(max_bytes = config.RESULT_CACHE_MAX_MB * 1024 * 1024,
+                      default_ttl = config.RESULT_CACHE_TTL)
+
+# fingerprint of the order tables, the cached analytics results are dropped when it moves
+@st.cache_resource
+def get_orders_token(_my_db) -> ChangeToken:
+    catalog = get_catalog(_my_db)
+    edited = [table for table in EDITED_TOKEN_TABLES if config.UPDATED_COL in catalog.columns(table)]
+    return ChangeToken(orders_token_query(config.UPDATED_COL, edited), config.RESULT_TOKEN_INTERVAL)
+
+# foreign key dropdown options keyed by (referenced_table, referenced_pk), shared by all sessions
+@st.cache_resource
+def get_option_cache() -> TableCache:
+    return TableCache(max_bytes = config.OPTION_CACHE_MAX_MB * 1024 * 1024,
+                      default_ttl = config.OPTION_CACHE_TTL)
+
+# update times of the tables shown in open views, probed once per interval for all sessions
+@st.cache_resource
+def get_table_watch() -> TableWatch:
+    return TableWatch(config.WATCH_INTERVAL, config.UPDATED_COL)
+
+# threads running the queries of an analytics comparison in parallel, shared by all sessions
+@st.cache_resource
+def get_report_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers = config.ANALYTICS_WORKERS, thread_name_prefix = "isf_report")
+
+# background threads prefetching the next page of the paged views, shared by all sessions
+@st.cache_resource
+def get_prefetcher() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers = config.PREFETCH_WORKERS, thread_name_prefix = "isf_prefetch")
+
+# timings of the queries run by all sessions, shown on the devops page
+@st.cache_resource
+def get_query_log() -> QueryLog:
+    return QueryLog(capacity = config.QUERY_LOG_SIZE,
+                    rerun_capacity = config.QUERY_LOG_RERUNS,
+                    export_path = config.QUERY_LOG_FILE)
+
 # display sidebar for selecting role and entering password
 def verifyRole(role):
     if role in st.session_state: # already verified for this session
@@ -52,15 +124,17 @@ def verifyRole(role):
     return role_verified
 
 # render content for a verified role
-def renderContentFor(role, my_db, table_names, table_keys):
+def renderContentFor(role, my_db):
     renderMsgFor(role)
     if role == 'admin':
-        admin_content(my_db, table_names, table_keys)
+        admin_content(my_db)
     elif role == 'delivery':
         table_name = 'delivery'
-        edits_key = delivery_management(my_db, table_name, table_name + "_df")
-        update_btn(my_db, table_name, edits_key, table_name + "_df")
-        manual_rerender_btn(my_db, table_name)
+        partner_id = delivery_partner_picker(my_db)
+        if partner_id is None:
+            st.info("Choose your delivery partner ID in the sidebar to see your open deliveries.")
+        else:
+            live_delivery_management(my_db, table_name, partner_id)
     elif role == 'analytics':
         analytics_content(my_db)
     else:
@@ -87,162 +161,417 @@ def renderMsgFor(role):
             st.write("For testing features 🛠️")
 
 
-def fetch_data(my_db, table_name: str):
-    '''fetch a table from the database and return a dataframe'''
-    col_names = get_fields(my_db, table_name)
-    mycursor = my_db.cursor()
-    mycursor.execute(f"SELECT * FROM {table_name}")
-    result = mycursor.fetchall()
-    mycursor.close()
-    return pd.DataFrame(result, columns=col_names)
+def fetch_data(my_db: ConnectionPool, table_name: str):
+    '''fetch a table from the database and return a dataframe typed from the schema catalog, see isf_frames.py'''
+    table = get_catalog(my_db).table(table_name)
+    with my_db.connection() as conn:
+        return read_frame(conn, f"SELECT * FROM {quote_ident(table_name)}", (), table.column_names, 
+                          column_dtypes(table), config.FETCH_CHUNK_SIZE)
 
-def set_table_sessions(my_db, table_names: list):
-    '''define a key for each table to retrieve the dataframe from session state'''
-    table_keys = [table_name + "_df" for table_name in table_names] # 
+def drop_table(table_name: str):
+    '''
+    invalidate the cached pages and dropdown options of a table, and the page this session holds,
+    so the views showing the table read it again from the DB on the next run
+    '''
+    get_table_cache().invalidate(table_name)
+    get_option_cache().invalidate(table_name)
+    st.session_state.pop(table_name + "_page_df", None)
+
+def page_loader(my_db, query: PageQuery, after: tuple = None):
+    '''a loader for the table cache reading one page of a paged view, see fetch_page()'''
+    table = get_catalog(my_db).table(query.table_name)
+    columns, dtypes = table.column_names, column_dtypes(table)
+    def loader():
+        with my_db.connection() as conn:
+            return fetch_page(conn, query, columns, after, dtypes)
+    return loader
 
-    for ith, table_name in enumerate(table_names):
-        if table_keys[ith] not in st.session_state:
-            # store a dataframe in the session state
-            st.session_state[table_keys[ith]] = fetch_data(my_db, table_name)
+def load_page(my_db, query: PageQuery, after: tuple = None):
+    '''
+    return (dataframe, keyset position after its last row, has_more) for one page of a paged view.
+    pages are shared through the table cache under the key (table_name, query, after).
+    '''
+    loader = page_loader(my_db, query, after)
+    with st.spinner(f"Loading {query.table_name}..."):
+        return get_table_cache().get((query.table_name, query, after), loader)
 
-    return table_keys
+def prefetch_page(my_db, query: PageQuery, after: tuple):
+    '''read the next page into the table cache in the background, so "Next" is served from memory'''
+    table_cache = get_table_cache()
+    key = (query.table_name, query, after)
+    if table_cache.peek(key) is not None:
+        return
+    loader = page_loader(my_db, query, after)
 
-def get_table_names(my_db: pymysql.connections.Connection):
-    '''get a list of table names from the database'''
-    cursor = my_db.cursor()
-    cursor.execute("SHOW TABLES")
-    res = cursor.fetchall()
-    cursor.close()
-    table_names = [each[0] for each in res]
-    return table_names
+    def prefetch():
+        try:
+            table_cache.get(key, loader)
+        except pymysql.Error: # the page is read when it is viewed instead, the failed query is in the query log
+            pass
+    get_prefetcher().submit(prefetch)
 
+def count_rows(my_db, query: PageQuery):
+    '''(number of rows matching the filters of a paged view, whether it is exact), cached like the pages'''
+    def loader():
+        with my_db.connection() as conn:
+            return estimate_count(conn, query, config.EXACT_COUNT_BELOW)
+    return get_table_cache().get((query.table_name, "count", query.filters), loader)
 
-def get_fields(my_db: pymysql.connections.Connection, table_name: str):
-    '''get a list of field names from the database for a given table'''
-    cursor = my_db.cursor()
-    cursor.execute("SHOW COLUMNS FROM " + table_name)
-    res = cursor.fetchall() 
-    cursor.close()
-    return [each[0] for each in res] # a list of field names
+def page_controls(my_db, table_name: str) -> PageQuery:
+    '''render the sort, filter and page size controls of a paged view, return the PageQuery they describe'''
+    table = get_catalog(my_db).table(table_name)
+    key = table_name + "_pager"
+    with st.expander("Sort and filter"):
+        col1, col2, col3 = st.columns(3)
+        # a keyset position can't be compared with NULL, only NOT NULL columns are offered for sorting
+        sortable = [col.name for col in table.columns if not col.nullable]
+        sort_col = col1.selectbox("Sort by", ["primary key"] + sortable, key=key + "_sort")
+        descending = col2.checkbox("Descending", key=key + "_desc")
+        page_size = col3.selectbox("Rows per page", config.PAGE_SIZES, key=key + "_size")
+        empty = pd.DataFrame({"column": pd.Series(dtype=object), "operator": pd.Series(dtype=object), 
+                              "value": pd.Series(dtype=object)})
+        filters = st.data_editor(empty, key=key + "_filters", num_rows="dynamic", hide_index=True,
+                                 column_config={"column": st.column_config.SelectboxColumn(options=table.column_names),
+                                                "operator": st.column_config.SelectboxColumn(options=list(FILTER_OPS)),
+                                                "value": st.column_config.TextColumn()})
+    # filter rows that are not filled in yet are ignored
+    conditions = tuple((row.column, row.operator, None if pd.isna(row.value) else row.value) 
+                       for row in filters.itertuples(index=False)
+                       if pd.notna(row.column) and pd.notna(row.operator) 
+                       and (row.operator in ("is empty", "is not empty") or (pd.notna(row.value) and row.value != "")))
+    return PageQuery(table_name, table.primary_key, None if sort_col == "primary key" else sort_col,
+                     descending, conditions, page_size)
 
+def paged_view(my_db, table_name: str, edits_key: str = None):
+    '''
+    render the controls and page navigation of a paged view, return the dataframe of the current page.
+    sorting and filtering run in MySQL, pages are read with keyset pagination (see isf_pages.py).
+    the session keeps the query and a stack of page start positions under "<table_name>_pager", and a reference
+    to the page shown under "<table_name>_page_df". while the editor under edits_key has pending edits,
+    the session stays on the page those edits were made against.
+    '''
+    pager_key = table_name + "_pager"
+    page_key = table_name + "_page_df"
+    pending = has_pending_edits(edits_key)
+    query = page_controls(my_db, table_name)
+    pager = st.session_state.get(pager_key)
+    if pager is None or (pager["query"] != query and not pending):
+        pager = {"query": query, "starts": [None], "next": None, "has_more": False}
+        st.session_state[pager_key] = pager
+    elif pager["query"] != query:
+        st.warning("Commit the pending edits before sorting or filtering the table differently.")
+    query = pager["query"]
 
-def commit_delete(my_db, table_name: str, table_key: str, deleted_rows: list):
+    if page_key in st.session_state and pending:
+        df = st.session_state[page_key]
+    else:
+        df, pager["next"], pager["has_more"] = load_page(my_db, query, pager["starts"][-1])
+        st.session_state[page_key] = df
+    if pager["has_more"]:
+        prefetch_page(my_db, query, pager["next"])
+
+    page_nav(my_db, pager, len(df), pending)
+    return df
+
+def page_nav(my_db, pager: dict, n_rows: int, pending: bool):
+    '''render the position of the current page and the buttons moving between pages'''
+    query = pager["query"]
+    count, exact = count_rows(my_db, query)
+    first_row = (len(pager["starts"]) - 1) * query.page_size
+    shown = f"rows {first_row + 1}-{first_row + n_rows}" if n_rows else "no rows"
+    st.caption(f"Page {len(pager['starts'])}, {shown} of {'' if exact else 'about '}{count}")
+
+    def first_page():
+        del pager["starts"][1:]
+    def previous_page():
+        pager["starts"].pop()
+    def next_page():
+        pager["starts"].append(pager["next"])
+
+    key = query.table_name + "_pager"
+    col1, col2, col3 = st.columns(3)
+    col1.button("First", key=key + "_first", on_click=first_page, disabled=pending or len(pager["starts"]) == 1)
+    col2.button("Previous", key=key + "_prev", on_click=previous_page, disabled=pending or len(pager["starts"]) == 1)
+    col3.button("Next", key=key + "_next", on_click=next_page, disabled=pending or not pager["has_more"])
+
+def has_pending_edits(edits_key: str) -> bool:
+    '''whether a data_editor holds edits that have not been committed yet'''
+    if edits_key is None or edits_key not in st.session_state:
+        return False
+    edits = st.session_state[edits_key]
+    return bool(edits["edited_rows"] or edits["added_rows"] or edits["deleted_rows"])
+
+def get_fields(my_db: ConnectionPool, table_name: str):
+    '''get a list of field names for a given table from the schema catalog'''
+    return get_catalog(my_db).columns(table_name) # a list of field names
+
+
+def get_view_only_cols(my_db, table_name: str):
+    '''
+    columns the editor must not change: True for a view-only table, otherwise config.VIEW_ONLY_COLS
+    plus the generated columns and auto-increment ids found in the catalog, and the row version columns
     '''
+    if table_name in config.VIEW_ONLY_TABLES:
+        return True
+    table = get_catalog(my_db).table(table_name)
+    view_only = list(config.VIEW_ONLY_COLS.get(table_name, []))
+    view_only += [col for col in table.view_only_columns + version_cols(my_db, table_name) if col not in view_only]
+    return view_only or False
+
+
+def version_cols(my_db, table_name: str) -> list:
+    '''the row version columns of a table, kept by the commits and MySQL, hidden in the editors'''
+    return [col for col in (config.VERSION_COL, config.UPDATED_COL) if col in get_catalog(my_db).columns(table_name)]
+
+
+def get_dropdowns(my_db, table_name: str):
+    '''a list of (fk_col, referenced_pk, referenced_table) for the single-column foreign keys of a table'''
+    return [(fk.columns[0], fk.referenced_columns[0], fk.referenced_table) 
+            for fk in get_catalog(my_db).foreign_keys(table_name) if len(fk.columns) == 1]
+
+
+def get_row_pk(df, row_i: int, pk_cols: tuple) -> tuple:
+    '''the primary key values of the row at position row_i of a dataframe, as plain python values'''
+    row = df.iloc[int(row_i)]
+    return tuple(row[col].item() if hasattr(row[col], "item") else row[col] for col in pk_cols)
+
+
+def row_version_col(my_db, table_name: str, versions: dict):
+    '''config.VERSION_COL if the table has it and the commit knows the versions of its rows, else None'''
+    if versions is None or config.VERSION_COL not in get_catalog(my_db).columns(table_name):
+        return None
+    return config.VERSION_COL
+
+
+def commit_delete(my_db, table_name: str, deleted_pks: list, mode: str = None, engine: str = None,
+                  versions: dict = None):
+    '''
+    delete rows in one transaction. the "bulk" engine deletes chunks of config.DELETE_CHUNK_SIZE rows with
+    DELETE ... WHERE pk IN (...) (pk tuples for composite keys), a chunk that fails is retried row by row.
+    the "procedure" engine calls delete_from once per row, for validating the stored procedures.
+
     params:
-        table_key: the key for retrieving the data before deletion from session state
-        deleted_rows: [row_i, ...]
-    
+        deleted_pks: [(pk value, ...), ...] primary keys of the rows to delete
+        mode: committer.SAVEPOINT or committer.ATOMIC, see commit_update()
+        engine: "bulk" or "procedure", defaults to config.WRITE_ENGINE
+        versions: {(pk value, ...): row version, ...} the versions the editor loaded, see commit_update()
+    returns: (failed rows, error messages, TouchedRows of the deleted rows)
     '''
-    did_not_delete = []
-    error_msg = []
-    mycursor = my_db.cursor()
-    pk_col = config.TABLE_PK[table_name] #  pk field name of this table
+    batches, touched = delete_batches(my_db, table_name, deleted_pks, engine, versions)
+    did_not_delete, error_msg, _ = committer.commit_batches(my_db, batches, mode or config.COMMIT_MODE)
+    return did_not_delete, error_msg, touched()
 
-    for row_i in deleted_rows:
-        pk_val = st.session_state[table_key].iloc[row_i][pk_col]
-        try:
-            procedure_name = config.PROCEDURES['delete']
-            params = (table_name, pk_col, pk_val)
-            mycursor.callproc(procedure_name, params)
-            print(f"deleted from {table_name} where {pk_col} = {pk_val}") # for debugging
-        except pymysql.Error as e:
-            code, msg = e.args
-            did_not_delete.append(f"{pk_col} = {pk_val}")
-            error_msg.append(f"Error: {msg}")
-    
-    mycursor.close()
-    return did_not_delete, error_msg
+def delete_batches(my_db, table_name: str, deleted_pks: list, engine: str = None, versions: dict = None):
+    '''the batches of commit_delete(), and a function returning their TouchedRows once they have run'''
+    engine = engine or config.WRITE_ENGINE
+    pk_cols = get_catalog(my_db).primary_key(table_name) # pk field name(s) of this table
+    rows = list(deleted_pks)
+    version_col = row_version_col(my_db, table_name, versions)
+
+    batches = []
+    single_sql = delete_statement(table_name, pk_cols, version_col=version_col)
+    if engine == "procedure" and len(pk_cols) == 1 and version_col is None:
+        # delete_from only takes one pk field, composite keys always use the statements
+        sql = call_statement(config.PROCEDURES['delete'], 3)
+        for pk_vals in rows:
+            params = (table_name, pk_cols[0], pk_vals[0])
+            batches.append(committer.Batch(sql, params, [(sql, params, describe_pk(pk_cols, pk_vals))]))
+    else:
+        chunk_size = 1 if engine == "procedure" else config.DELETE_CHUNK_SIZE
+        for chunk in committer.chunked(rows, chunk_size):
+            keys = [pk_vals + ((versions[pk_vals],) if version_col else ()) for pk_vals in chunk]
+            batches.append(committer.Batch(delete_statement(table_name, pk_cols, len(chunk), version_col),
+                                           [val for key in keys for val in key],
+                                           [(single_sql, key, describe_pk(pk_cols, pk_vals)) 
+                                            for key, pk_vals in zip(keys, chunk)], 
+                                           expect_rows=version_col is not None))
+
+    def touched():
+        # each batch row is one pk, in the order of rows
+        ok = [row_ok for batch in batches for row_ok in batch.row_ok]
+        conflict = [row_conflict for batch in batches for row_conflict in batch.row_conflict]
+        touched = TouchedRows(saved=sum(ok), deleted=any(ok))
+        touched.conflicts = {pk_vals for pk_vals, row_conflict in zip(rows, conflict) if row_conflict}
+        return touched
+    return batches, touched
 
 
-def commit_update(my_db, table_name: str, table_key: str, edited_rows: dict):
+def commit_update(my_db, table_name: str, edited_rows: dict, mode: str = None, versions: dict = None):
     '''
+    commit all edited rows in one transaction: the edits to a row are coalesced into one multi-column UPDATE,
+    rows editing the same set of columns are sent together as one UPDATE ... SET col = CASE pk WHEN ... END
+    per batch of config.COMMIT_BATCH_SIZE rows (with executemany when the edits change primary key columns).
+    with versions, on a table with a config.VERSION_COL, each UPDATE only matches the row if its version is still
+    the one the editor loaded: a row changed or deleted by someone else meanwhile is reported as a conflict
+    (from the affected row counts of the same round trip) instead of being overwritten.
+
     params:
         table_name: name of the table to be updated
-        table_key: str, the key for retrieving the pk field name and value of the edited row
-        edited_rows: {row_i: {col_name: new_value, ...}, ...}
-    '''
-    did_not_update = []
-    error_msg = []
-    mycursor = my_db.cursor()
-
-    pk_field_name = config.TABLE_PK[table_name]
-    procedure_name = config.PROCEDURES['update']
-
-    # update the database for each modified tuple (row)
-    for row_i, edit in edited_rows.items():
-        row_i = int(row_i)
-        pk_val = st.session_state[table_key].iloc[row_i][pk_field_name]
-        # enumerate through the modified fields for this tup;e
-        for field, new_value in edit.items():
-            try:
-                print(f"updating {table_name} set {field} = {new_value} where {pk_field_name} = {pk_val}")
-                params = (table_name, field, new_value, pk_field_name, pk_val)
-                mycursor.callproc(procedure_name, params)
-
-            except pymysql.Error as e:
-                print(f"failed to update {table_name} set {field} = {new_value} where {pk_field_name} = {pk_val}")
-                code, msg = e.args
-                did_not_update.append(f"{field} = {new_value} where {pk_field_name} = {pk_val}")
-                error_msg.append(f"Error: {msg}")
-                    
-    mycursor.close()
-    return did_not_update, error_msg
-
-def commit_insert(my_db, table_name: str, table_key: str, added_rows: list):
-    '''
-    added_rows: a list of dictionaries, each dictionary is a row to be inserted; 
-                fields that are not filled-in will not be in the dictionary. 
-
-                "added_rows":[
-                    0:{field1: value1, ...},
-                    1:{field1: value1, field3: value3, ...}, 
-                    ...
-                ]
-    '''
-    # retrieve all column names (or editable column names) of the table
-    table_fields = get_fields(my_db, table_name)
-    did_not_insert = []
-    error_msgs = []
-
-    mycursor = my_db.cursor()
-    for row in added_rows: # retrive new values for each tuple, 
-        params = [row.get(field, None) for field in table_fields] # None for fields that are not filled-in (not in the dictionary)
-        params = tuple(params) # for calling the procedure
-        try:
-            procedure_name = config.PROCEDURES['create'] + table_name
-            mycursor.callproc(procedure_name, params)
-        except pymysql.Error as e:
-            code, msg = e.args
-            did_not_insert.append(params)
-            error_msgs.append(f"Error: {msg}")
-    
-    # update the static df stored in session state with the latest data from the DB using key = table_key
-    # st.session_state[table_key] = fetch_data(my_db, table_name)
-    mycursor.close()
-    return did_not_insert, error_msgs
+        edited_rows: {(pk value, ...): {col_name: new_value, ...}, ...} edits keyed by the current pk of the row
+        mode: committer.SAVEPOINT keeps the rows that succeeded, committer.ATOMIC saves nothing if any row fails
+        versions: {(pk value, ...): row version, ...} the versions of the edited rows when they were loaded
+    returns: (failed rows, error messages, TouchedRows of the updated rows)
+    '''
+    batches, touched = update_batches(my_db, table_name, edited_rows, versions)
+    did_not_update, error_msg, _ = committer.commit_batches(my_db, batches, mode or config.COMMIT_MODE)
+    return did_not_update, error_msg, touched()
+
+def update_batches(my_db, table_name: str, edited_rows: dict, versions: dict = None):
+    '''the batches of commit_update(), and a function returning their TouchedRows once they have run'''
+    pk_cols = get_catalog(my_db).primary_key(table_name)
+    version_col = row_version_col(my_db, table_name, versions)
 
-def update_db(my_db, edits_key: str, table_name: str, table_key: str):
+    # group the rows by the columns they change, so each group shares one UPDATE statement
+    groups = {} # (col, ...): [(params, label, pk), ...]
+    for pk_vals, edit in edited_rows.items():
+        if not edit:
+            continue
+        cols = tuple(sorted(edit))
+        params = tuple(edit[col] for col in cols) + pk_vals + ((versions[pk_vals],) if version_col else ())
+        changes = ", ".join(f"{col} = {edit[col]}" for col in cols)
+        groups.setdefault(cols, []).append((params, f"{changes} where {describe_pk(pk_cols, pk_vals)}", pk_vals))
+
+    batches = []
+    keys = [] # [(cols, [old pk, ...]), ...] aligned with batches
+    for cols, rows in groups.items():
+        sql = update_statement(table_name, cols, pk_cols, version_col)
+        one_statement = not set(cols) & set(pk_cols)
+        for chunk in committer.chunked(rows, config.COMMIT_BATCH_SIZE):
+            row_sqls = [(sql, params, label) for params, label, _ in chunk]
+            if one_statement:
+                # params of a row: the new values in cols order, then its pk values (and version)
+                case_params = [val for i in range(len(cols)) for params, _, _ in chunk 
+                               for val in params[len(cols):len(cols) + len(pk_cols)] + (params[i],)]
+                case_params += [val for params, _, _ in chunk for val in params[len(cols):]]
+                batches.append(committer.Batch(case_update_statement(table_name, cols, pk_cols, len(chunk), version_col),
+                                               case_params, row_sqls, expect_rows=version_col is not None))
+            else:
+                batches.append(committer.Batch(sql, [params for params, _, _ in chunk], row_sqls, many=True,
+                                               expect_rows=version_col is not None))
+            keys.append((cols, [pks for _, _, pks in chunk]))
+
+    def touched():
+        touched = TouchedRows()
+        for batch, (cols, pks) in zip(batches, keys):
+            for row_ok, row_conflict, pk_vals in zip(batch.row_ok, batch.row_conflict, pks):
+                if row_conflict: # shown with what the row holds now
+                    touched.conflicts.add(pk_vals)
+                if row_ok:
+                    touched.saved += 1
+                    touched.changed_cols.update(cols)
+        return touched
+    return batches, touched
+
+def commit_insert(my_db, table_name: str, added_rows: list, mode: str = None, engine: str = None):
+    '''
+    insert rows in one transaction. the "bulk" engine groups rows by the fields they fill in and sends
+    multi-row INSERT ... VALUES statements of config.INSERT_CHUNK_SIZE rows, a chunk that fails is retried
+    row by row. the "procedure" engine calls add_<table_name> once per row, for validating the stored procedures.
+
+    params:
+        added_rows: a list of dictionaries, each dictionary is a row to be inserted; 
+                    fields that are not filled-in will not be in the dictionary. 
+
+                    "added_rows":[
+                        0:{field1: value1, ...},
+                        1:{field1: value1, field3: value3, ...}, 
+                        ...
+                    ]
+        mode: committer.SAVEPOINT or committer.ATOMIC, see commit_update()
+        engine: "bulk" or "procedure", defaults to config.WRITE_ENGINE
+    returns: (failed rows, error messages, TouchedRows of the inserted rows)
+    '''
+    batches, touched = insert_batches(my_db, table_name, added_rows, engine)
+    did_not_insert, error_msgs, _ = committer.commit_batches(my_db, batches, mode or config.COMMIT_MODE)
+    return did_not_insert, error_msgs, touched()
+
+def insert_batches(my_db, table_name: str, added_rows: list, engine: str = None):
+    '''the batches of commit_insert(), and a function returning their TouchedRows once they have run'''
+    engine = engine or config.WRITE_ENGINE
+    # retrieve all column names (or editable column names) of the table,
+    # the row version columns come last and are left to their defaults (add_<table_name> doesn't take them)
+    table_fields = [field for field in get_fields(my_db, table_name) if field not in version_cols(my_db, table_name)]
+
+    batches = []
+    if engine == "procedure":
+        sql = call_statement(config.PROCEDURES['create'] + table_name, len(table_fields))
+        for row in added_rows: # retrive new values for each tuple, 
+            params = tuple(row.get(field, None) for field in table_fields) # None for fields that are not filled-in
+            batches.append(committer.Batch(sql, params, [(sql, params, params)]))
+    else:
+        # rows filling in the same fields share one INSERT statement, missing fields get their column default
+        groups = {} # (field, ...): [(values, label), ...]
+        for row in added_rows:
+            fields = tuple(field for field in table_fields if row.get(field) is not None)
+            label = tuple(row.get(field, None) for field in table_fields)
+            groups.setdefault(fields, []).append((tuple(row[field] for field in fields), label))
+        for fields, rows in groups.items():
+            single_sql = insert_statement(table_name, fields)
+            for chunk in committer.chunked(rows, config.INSERT_CHUNK_SIZE):
+                params = [val for values, _ in chunk for val in values]
+                batches.append(committer.Batch(insert_statement(table_name, fields, len(chunk)), params, 
+                                               [(single_sql, values, label) for values, label in chunk]))
+    return batches, lambda: TouchedRows(saved=sum(row_ok for batch in batches for row_ok in batch.row_ok))
+
+def update_db(my_db, edits_key: str, table_name: str, table_key: str, mode: str = None):
     '''
     commit front-end eidts to DB with edits stored in session state.
 
     params:
-        my_db: pymysql.connections.Connection
+        my_db: ConnectionPool, a connection is borrowed for the checks, and one for the commit
         edits_key: the key for retrieving edits from session state
         table_name: name of the table to be updated
-        table_key: the key for retrieving the static before-change dataframe from session state
+        table_key: the key for retrieving the dataframe the edits were made against (whole table or one page)
+        mode: committer.SAVEPOINT keeps the rows that succeeded, committer.ATOMIC saves none of the updates,
+              inserts and deletes if any row fails
     '''
     if edits_key not in st.session_state:
         return
     
     all_sussess = True # for indicating whether all changes were successful
+    mode = mode or config.COMMIT_MODE
 
     edited_rows = st.session_state[edits_key]["edited_rows"]
     added_rows = st.session_state[edits_key]["added_rows"]
     deleted_rows = st.session_state[edits_key]["deleted_rows"]
 
-    failed_updates, update_error = commit_update(my_db, table_name, table_key, edited_rows)
-    failed_inserts, insert_errors = commit_insert(my_db, table_name, table_key, added_rows)
-    failed_deletes, delete_errors = commit_delete(my_db, table_name, table_key, deleted_rows)
+    # check all the edits at once and drop the ones that change nothing, only clean rows are sent to the DB
+    df = st.session_state[table_key]
+    table = get_catalog(my_db).table(table_name)
+    key_sets = referenced_key_sets(my_db, table_name) # foreign keys found there need no query
+    with my_db.connection() as conn:
+        cursor = conn.cursor()
+        pending = validate_edits(table, df, edited_rows, added_rows, cursor, key_sets, config.COMMIT_BATCH_SIZE)
+        cursor.close()
+    if pending.rejected:
+        all_sussess = False
+        rejects_panel(pending.rejected)
+        if mode == committer.ATOMIC:
+            st.warning("No changes were saved, fix the rejected rows first.")
+            return all_sussess
+    edited_rows, added_rows = pending.edited, pending.added
+
+    # the editor reports row positions, turn them into primary keys of the rows they point at
+    pk_cols = table.primary_key
+    edited_pks = {get_row_pk(df, row_i, pk_cols): edit for row_i, edit in edited_rows.items()}
+    deleted_pks = [get_row_pk(df, row_i, pk_cols) for row_i in deleted_rows]
+    # the row versions the edits were made against, checked by the UPDATE/DELETE statements
+    versions = None
+    if config.VERSION_COL in df.columns:
+        versions = {get_row_pk(df, row_i, pk_cols): get_row_pk(df, row_i, (config.VERSION_COL,))[0] 
+                    for row_i in list(edited_rows) + list(deleted_rows)}
+
+    # updates, inserts and deletes run in one transaction on one connection, in ATOMIC mode all of them or none
+    steps = [update_batches(my_db, table_name, edited_pks, versions),
+             insert_batches(my_db, table_name, added_rows),
+             delete_batches(my_db, table_name, deleted_pks, versions=versions)]
+    _, _, committed = committer.commit_batches(my_db, [batch for batches, _ in steps for batch in batches], mode)
+    touched = TouchedRows()
+    failures = []
+    for batches, step_touched in steps:
+        failures.append(committer.batch_failures(batches))
+        touched.merge(step_touched())
+    (failed_updates, update_error), (failed_inserts, insert_errors), (failed_deletes, delete_errors) = failures
 
     if len(failed_updates) > 0:
         all_sussess = False
@@ -259,90 +588,278 @@ def update_db(my_db, edits_key: str, table_name: str, table_key: str):
         for i, row in enumerate(failed_deletes):
             st.error(f"Failed to delete {failed_deletes[i]}. {delete_errors[i]}")
 
-    st.session_state[table_key] = fetch_data(my_db, table_name) # update the static df stored in session state with the latest data from DB
+    if not committed:
+        st.warning("None of the changes were saved, the commit was rolled back.")
+
+    if touched.conflicts:
+        conflicts_panel(my_db, table_name, touched.conflicts)
+    refresh_after_commit(my_db, table_name, touched) # drop the cached pages showing the changed rows
     return all_sussess
 
+def rejects_panel(rejected: list):
+    '''show the rows left out of a commit by the checks before it, as a table when there are many'''
+    if len(rejected) <= config.EDIT_MAX_REJECTS:
+        for label, reason in rejected:
+            st.error(f"Did not save {label}. {reason}")
+        return
+    st.error(f"{len(rejected)} rows were not saved, their values don't fit the table:")
+    st.dataframe(pd.DataFrame(rejected, columns=["Row", "Reason"]), hide_index=True)
+
+def conflicts_panel(my_db, table_name: str, conflicts: set):
+    '''show the current values of the rows whose edits conflicted with someone else's, and which of them are gone'''
+    catalog = get_catalog(my_db)
+    pk_cols = catalog.primary_key(table_name)
+    with my_db.connection() as conn:
+        current = fetch_rows(conn, table_name, catalog.columns(table_name), pk_cols, conflicts,
+                             dtypes=column_dtypes(catalog.table(table_name)))
+    st.error(f"{len(conflicts)} rows were changed or deleted by someone else since you loaded them, "
+             "your edits to them were not saved. Their current values:")
+    st.dataframe(current, hide_index=True)
+    found = {get_row_pk(current, row_i, pk_cols) for row_i in range(len(current))}
+    for pk_vals in sorted(conflicts - found, key=str):
+        st.error(f"The row where {describe_pk(pk_cols, pk_vals)} was deleted.")
+
+def refresh_after_commit(my_db, table_name: str, touched: TouchedRows):
+    '''
+    drop what the views of a committed table read from the shared caches: its cached pages (rows may have moved
+    in or out of a page, with its sort order and filters, so pages are not patched) and the dropdowns listing its
+    keys. tables that FK cascades may have changed are dropped too. a page is read again when it is viewed,
+    an open work queue reads the committed rows from its feed.
+    '''
+    for other_table in cascaded_tables(get_catalog(my_db), table_name, touched):
+        drop_table(other_table)
+    if touched.empty:
+        return
+    get_table_cache().invalidate(table_name)
+    get_option_cache().invalidate(table_name)
+    st.session_state.pop(table_name + "_page_df", None)
+    if table_name + "_queue" in st.session_state:
+        st.session_state[table_name + "_queue"]["stale"] = True
+
 # make a button, on click, update the database        
 def update_btn(my_db, table_name, edits_key, table_key):
     '''make a button, on click, try update DB with edits stored in session state'''
+    if table_name + "_commit_msg" in st.session_state: # result of the commit before the last rerun
+        st.success(st.session_state.pop(table_name + "_commit_msg"))
+    modes = {"Keep the rows that succeed": committer.SAVEPOINT, "Save no changes if any row fails": committer.ATOMIC}
+    choice = st.radio("If a changed row fails", list(modes), horizontal=True, key=table_name + "_commit_mode",
+                      index=list(modes.values()).index(config.COMMIT_MODE))
     if st.button(f"Commit Changes", key=table_name + "_update_btn"):
-        all_sussess = update_db(my_db, edits_key, table_name, table_key)
-        if all_sussess: # refresh tab
-            st.success("All changes were successful.")
-            time.sleep(3)
+        all_sussess = update_db(my_db, edits_key, table_name, table_key, modes[choice])
+        if all_sussess: # refresh tab, the message is shown again after the rerun
+            st.session_state[table_name + "_commit_msg"] = "All changes were successful."
             st.rerun()
         else: # not to refresh so failure messages stay on page, user will have a button for manual refresh
             st.warning("Some changes were not successful. Please refresh page to see the latest data.")
 
 
-def delivery_management(my_db, table_name: str, table_key: str):
-    '''Render a data_editor for delivery management'''
+def delivery_management(my_db, table_name: str, table_key: str, partner_id):
+    '''Render a data_editor over the open deliveries of a delivery partner'''
     st.header("Delivery Management")
     st.info("Edit the expected data and delivery status for orders you're delivering")
-    edits_key = "delivery_status_edits"
-    mycursor = my_db.cursor()
+    edits_key = f"delivery_status_edits_{partner_id}" # edits point at row positions of this partner's queue
     config_dict = {"expected_delivery_date": st.column_config.DatetimeColumn(required=True),
                     "delivery_status": st.column_config.SelectboxColumn(width="medium", 
                                                                         options=config.DELIVERY_STATUS,required=True,)}
-    st.data_editor(st.session_state[table_key], key=edits_key, 
-                        disabled=config.VIEW_ONLY_COLS["delivery_status"], 
+    editable = list(config_dict) # a partner only changes the date and status of their deliveries
+    config_dict.update({col: None for col in version_cols(my_db, table_name)})
+    queue = delivery_queue(my_db, table_name, partner_id, edits_key)
+    st.session_state[table_key] = queue # the rows the edits are made against, see update_db()
+    st.data_editor(queue, key=edits_key, hide_index=True,
+                        disabled=[col for col in queue.columns if col not in editable],
                         column_config=config_dict)
-        
-        # retrieve count from session state with key for data in this table
-    st.write("Total Records:", len(st.session_state[table_key]))
-    mycursor.close()
+    st.write("Open deliveries:", len(queue))
     return edits_key
 
-def make_editable_table(my_db, table_name, table_key):
-    '''Render a data_editor for an editable table, apply pre-defined column_config'''
+def delivery_queue(my_db, table_name: str, partner_id, edits_key: str):
+    '''
+    the open deliveries of a partner, kept in the session under "<table_name>_queue" with the watermark of its feed.
+    the queue is read once through the partner/status index, then each run only merges the partner's rows and
+    the queued rows written since the watermark (see isf_delivery.py), except while the editor has pending edits
+    (unless the session just committed them, see refresh_after_commit)
+    '''
+    queue_key = table_name + "_queue"
+    state = st.session_state.get(queue_key)
+    if state is not None and state["partner"] == partner_id and not state["stale"] and has_pending_edits(edits_key):
+        return state["df"]
+    table = get_catalog(my_db).table(table_name)
+    with my_db.connection() as conn:
+        if state is None or state["partner"] != partner_id or config.UPDATED_COL not in table.column_names:
+            df, watermark = load_queue(conn, table_name, partner_id, config.DELIVERY_OPEN, table.column_names,
+                                       column_dtypes(table))
+        else:
+            queued = list(state["df"][list(table.primary_key)].astype(object).itertuples(index=False, name=None))
+            fresh, watermark = read_feed(conn, table_name, partner_id, config.UPDATED_COL, state["watermark"],
+                                         config.WATCH_GRACE, table.column_names, column_dtypes(table),
+                                         table.primary_key, queued)
+            df = apply_feed(state["df"], fresh, table.primary_key, config.DELIVERY_OPEN, partner_id)
+    st.session_state[queue_key] = {"partner": partner_id, "df": df, "watermark": watermark, "stale": False}
+    return df
+
+def delivery_partner_picker(my_db):
+    '''the delivery partner whose work queue is shown, picked in the sidebar'''
+    values, _ = option_values(my_db, 'delivery_partner', 'partner_id')
+    return st.sidebar.selectbox("Delivery partner ID", list(values), index=None, key="delivery_partner",
+                                placeholder="Choose your partner ID")
+
+def make_editable_table(my_db, table_name):
+    '''Render a data_editor over one page of an editable table, apply pre-defined column_config'''
     edits_key = table_name + "_edits"
-    mycursor = my_db.cursor()
     config_dict = {} # a dict of specs for cols with special formatting
     
-    if table_name in config.TABLE_WITH_DROPDOWN:
-        fk_cols = []
-        options = []
-        # for each fk_col, get the list of valid values from the referenced table
-        for fk_col, referenced_pk, referenced_table in config.TABLE_WITH_DROPDOWN[table_name]:
-            fk_cols.append(fk_col)
-            # call the procedure to get the list of valid valuee given a referenced table and pk_field_name being referenced
-            mycursor.callproc(config.PROCEDURES['get_col'], (referenced_pk, referenced_table))
-            result = mycursor.fetchall()
-            options.append([row[0] for row in result])
-
-        for i, fk_col in enumerate(fk_cols):
-            config_dict[fk_col] = st.column_config.SelectboxColumn(width="medium", 
-                                                                            options=options[i],required=True,)
-    
+    df = paged_view(my_db, table_name, edits_key)
+    # for each fk_col, get the list of valid values from the referenced table
+    for fk_col, referenced_pk, referenced_table in get_dropdowns(my_db, table_name):
+        options = fk_options(my_db, table_name, fk_col, referenced_pk, referenced_table, df[fk_col])
+        config_dict[fk_col] = st.column_config.SelectboxColumn(width="medium", options=options, required=True,)
+
+    # the dropdowns offer every referenced value, not only the categories found on this page
+    df = df.astype({fk_col: object for fk_col in config_dict if isinstance(df[fk_col].dtype, pd.CategoricalDtype)})
+    config_dict.update({col: None for col in version_cols(my_db, table_name)}) # hidden, still sent back on commit
     # make a data_editor with selectbox column, each fk_col has a column_config for dropdown options
-    st.data_editor(st.session_state[table_key], key=edits_key, num_rows="dynamic", 
-                    disabled=config.VIEW_ONLY_COLS[table_name], 
+    st.data_editor(df, key=edits_key, num_rows="dynamic", 
+                    disabled=get_view_only_cols(my_db, table_name), 
                     column_config=config_dict)
-    
-    # retrieve count from session state with key for data in this table
-    st.write("Total Records:", len(st.session_state[table_key]))
-    mycursor.close()
     return edits_key
 
+def fk_options(my_db, table_name: str, fk_col: str, referenced_pk: str, referenced_table: str, current) -> list:
+    '''
+    the dropdown options of a foreign key column, from the shared option cache.
+    a referenced table with more than config.OPTION_LIST_MAX keys gets a search box instead of the full list,
+    listing the first config.OPTION_SEARCH_LIMIT keys starting with what was typed.
+    the values already in the column (current) stay options, so existing cells remain valid.
+    '''
+    option_cache = get_option_cache()
+    values, complete = option_values(my_db, referenced_table, referenced_pk)
+
+    if not complete:
+        prefix = st.text_input(f"Search {fk_col}", key=f"{table_name}_{fk_col}_search",
+                               help=f"{referenced_table} has more than {config.OPTION_LIST_MAX} rows, type the start "
+                                    f"of a {referenced_pk} to list up to {config.OPTION_SEARCH_LIMIT} matches")
+        if prefix:
+            def search():
+                with my_db.connection() as conn:
+                    return search_options(conn, referenced_table, referenced_pk, prefix, config.OPTION_SEARCH_LIMIT)
+            values = option_cache.get((referenced_table, referenced_pk, prefix), search)
+        else:
+            values = values[:config.OPTION_SEARCH_LIMIT]
+
+    options = list(values)
+    listed = set(options)
+    options += [val for val in (val.item() if hasattr(val, "item") else val for val in current.dropna().unique()) 
+                if val not in listed]
+    return options
+
+def option_values(my_db, referenced_table: str, referenced_pk: str):
+    '''the values of a referenced key from the option cache: (first config.OPTION_LIST_MAX values, whether that is all)'''
+    def loader():
+        with my_db.connection() as conn:
+            return load_options(conn, referenced_table, referenced_pk, config.OPTION_LIST_MAX)
+    return get_option_cache().get((referenced_table, referenced_pk), loader)
+
+def referenced_key_sets(my_db, table_name: str) -> dict:
+    '''
+    {(referenced table, (referenced pk,)): set of keys} for the dropdowns of a table whose keys are all in the option
+    cache, keys in them are checked without a query by check_foreign_keys()
+    '''
+    key_sets = {}
+    for _, referenced_pk, referenced_table in get_dropdowns(my_db, table_name):
+        values, complete = option_values(my_db, referenced_table, referenced_pk)
+        if complete:
+            key_sets[(referenced_table, (referenced_pk,))] = {fold_key((val,)) for val in values}
+    return key_sets
+
 def manual_rerender_btn(my_db, table_name):
     '''make a button, on click, fetch latest data from DB, then re-render the component'''
-    table_key = table_name + "_df"
     if st.button(f"Click to see cascading changes if you have modified any other table", 
                          key=table_name + "_refresh_btn"):
-        # fetch latest data from DB into session state
-        st.session_state[table_key] = fetch_data(my_db, table_name)
+        # invalidate the cached pages, the view fetches the latest data from DB on rerun
+        drop_table(table_name)
         st.rerun()
 
+def import_panel(my_db, table_name: str):
+    '''upsert the rows of an uploaded CSV/Parquet file into a table chunk by chunk, with progress and rejected rows'''
+    uploaded = st.file_uploader(f"Import rows into {table_name}", type=list(FORMATS), key=table_name + "_upload",
+                                help="rows whose primary or unique key exists are updated, the others are inserted")
+    if uploaded is None or not st.button("Import", key=table_name + "_import_btn"):
+        return
+    table = get_catalog(my_db).table(table_name)
+    view_only = get_view_only_cols(my_db, table_name) or []
+    # auto-increment ids can't be edited, but a file may give them to update existing rows
+    allowed = [col.name for col in table.columns if col.name not in view_only or col.name in table.primary_key]
+    bar = st.progress(0.0)
+    status = st.empty()
+    fmt = file_format(uploaded.name)
+    total = file_rows(uploaded, fmt)
+    def on_progress(report):
+        # rows of the total for Parquet, bytes parsed so far for CSV
+        done = report.rows_read / total if total else uploaded.tell() / max(uploaded.size, 1)
+        bar.progress(min(done, 1.0))
+        status.text(f"{report.rows_read} rows read, {report.rows_saved} saved, {report.n_rejects} rejected")
+
+    try:
+        report = import_file(my_db, table, uploaded, fmt, allowed, config.IMPORT_CHUNK_SIZE,
+                             config.INSERT_CHUNK_SIZE, on_progress, config.IMPORT_MAX_REJECTS,
+                             config.VERSION_COL if config.VERSION_COL in table.column_names else None)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    bar.progress(1.0)
+    refresh_after_commit(my_db, table_name, TouchedRows(saved=report.rows_saved))
+    if report.ignored_cols:
+        st.info(f"Columns not imported: {', '.join(report.ignored_cols)}")
+    if report.n_rejects:
+        st.warning(f"{report.rows_saved} of {report.rows_read} rows saved, {report.n_rejects} rejected"
+                   + (f" (the first {len(report.rejects)} are listed)" if report.n_rejects > len(report.rejects) else ""))
+        rejects = pd.DataFrame(report.rejects, columns=["row", "reason"])
+        st.dataframe(rejects, hide_index=True)
+        st.download_button("Download rejected rows", rejects.to_csv(index=False), file_name=f"{table_name}_rejects.csv",
+                           mime="text/csv")
+    else:
+        st.success(f"All {report.rows_saved} rows saved.")
+
+def export_panel(my_db, table_name: str):
+    '''write a whole table to CSV/Parquet from a server-side cursor, chunk by chunk, and offer it for download'''
+    export_key = table_name + "_export"
+    col1, col2 = st.columns(2)
+    fmt = col1.radio("Export format", FORMATS, horizontal=True, key=export_key + "_fmt")
+    if col2.button("Prepare export", key=export_key + "_btn"):
+        drop_export(export_key)
+        table = get_catalog(my_db).table(table_name)
+        # written to a temporary file rather than memory, only its path is kept in the session
+        with tempfile.NamedTemporaryFile(suffix=f".{fmt}", delete=False) as out:
+            path = out.name
+            with st.spinner(f"Exporting {table_name}..."), my_db.connection() as conn:
+                n_rows = export_table(conn, table, fmt, out, config.FETCH_CHUNK_SIZE)
+        st.session_state[export_key] = (fmt, n_rows, path)
+    if export_key in st.session_state:
+        fmt, n_rows, path = st.session_state[export_key]
+        with open(path, "rb") as data:
+            downloaded = st.download_button(f"Download {table_name}.{fmt} ({n_rows} rows)", data,
+                                            file_name=f"{table_name}.{fmt}", key=export_key + "_download")
+        if downloaded:
+            drop_export(export_key) # the file is only kept until it's downloaded
+
+def drop_export(export_key: str):
+    '''delete the prepared export file of a table, if any'''
+    if export_key in st.session_state:
+        _, _, path = st.session_state.pop(export_key)
+        if os.path.exists(path):
+            os.remove(path)
+
 def analytics_content(my_db):
     '''render analytics content'''
-    queries = ["Best Selling Products by Year", "Number of Orders per Customer"]
-    sales_by_year, order_per_customer = st.tabs(queries)
-    with sales_by_year:
+    views = ["Best Selling Products by Year", "Number of Orders per Customer", "Compare Periods"]
+    # only the chosen view runs its queries, st.tabs would render (and query) every one of them
+    view = st.radio("Report", views, horizontal=True, label_visibility="collapsed")
+    if view == views[0]:
         sales_analytics(my_db)
-    with order_per_customer:
+    elif view == views[1]:
         order_analytics(my_db)
+    else:
+        compare_analytics(my_db)
 
-def admin_content(my_db, table_names, table_keys):
+def admin_content(my_db):
     '''render admin content'''
     st.title(config.SITE_NAME + " - Admin Portal")
     editable_tab, view_only_tab = st.tabs(["Editable Tables", "View Only Tables"]) # make tab components
@@ -350,25 +867,114 @@ def admin_content(my_db, table_names, table_keys):
     with editable_tab:
         # table_name dynamically changes with the selectbox
         table_name = st.selectbox("Select a table to edit", config.EDITABLE_TABLES)
-        edits_key = make_editable_table(my_db, table_name, table_name + "_df")
-        update_btn(my_db, table_name, edits_key, table_name + "_df")
+        live_editable_table(my_db, table_name)
         manual_rerender_btn(my_db, table_name)
+        with st.expander("Import / export a file"):
+            import_panel(my_db, table_name)
+            export_panel(my_db, table_name)
     
     with view_only_tab:
-        table_name = st.selectbox("Select a table to view", config.VIEW_ONLY_TABLES)
-        st.dataframe(st.session_state[table_name + "_df"]) # key for static df
-        st.write("Total Records:", len(st.session_state[table_name + "_df"]))
-        manual_rerender_btn(my_db, table_name)
+        # both tabs render on every rerun, so nothing is loaded here until a table is picked
+        table_name = st.selectbox("Select a table to view", config.VIEW_ONLY_TABLES, 
+                                  index=None, placeholder="Choose a table")
+        if table_name is not None:
+            live_table_view(my_db, table_name)
+            manual_rerender_btn(my_db, table_name)
+            with st.expander("Export to a file"):
+                export_panel(my_db, table_name)
+
+@st.fragment(run_every=config.WATCH_INTERVAL)
+def live_editable_table(my_db, table_name: str):
+    '''
+    the editor of an editable table and its commit button, rerun on their own every config.WATCH_INTERVAL seconds
+    to show changes made elsewhere without rerunning the rest of the page
+    '''
+    with get_query_log().rerun("admin refresh"):
+        edits_key = table_name + "_edits"
+        watch_tables(my_db, [table_name], edits_key)
+        make_editable_table(my_db, table_name)
+        update_btn(my_db, table_name, edits_key, table_name + "_page_df")
+
+@st.fragment(run_every=config.WATCH_INTERVAL)
+def live_table_view(my_db, table_name: str):
+    '''one page of a view-only table, rerun on its own every config.WATCH_INTERVAL seconds'''
+    with get_query_log().rerun("admin refresh"):
+        watch_tables(my_db, [table_name])
+        st.dataframe(paged_view(my_db, table_name))
+
+@st.fragment(run_every=config.WATCH_INTERVAL)
+def live_delivery_management(my_db, table_name: str, partner_id):
+    '''
+    the work queue of a delivery partner and its commit button, rerun on their own every config.WATCH_INTERVAL
+    seconds, each time reading only the partner's rows changed since the last run
+    '''
+    with get_query_log().rerun("delivery refresh"):
+        edits_key = delivery_management(my_db, table_name, table_name + "_queue_df", partner_id)
+        update_btn(my_db, table_name, edits_key, table_name + "_queue_df")
+
+def watch_tables(my_db, tables: list, edits_key: str = None):
+    '''
+    poll the shared table watch for the tables of a view. the views read their tables from the shared caches on
+    every run, which are brought up to date by whichever session's poll found a change (see apply_table_changes),
+    except while the editor under edits_key has pending edits: the session then keeps the data it edits.
+    '''
+    generations = get_table_watch().poll(my_db, tables, lambda changed: apply_table_changes(my_db, changed))
+    seen = st.session_state.setdefault("watch_generations", {})
+    for table_name, generation in generations.items():
+        if seen.get(table_name, generation) != generation and has_pending_edits(edits_key):
+            st.info(f"{table_name} was changed elsewhere since you started editing. Rows you edited that were "
+                    "changed too will be reported as conflicts when you commit.")
+            continue # the notice stays until the edits are committed or discarded
+        seen[table_name] = generation
+
+def apply_table_changes(my_db, changed: set):
+    '''
+    bring the shared caches up to date with tables changed by other writers: cached pages and dropdown options
+    are dropped and read again when viewed, work queues follow their own feed (see delivery_queue)
+    '''
+    table_cache = get_table_cache()
+    for table_name in changed:
+        table_cache.invalidate(table_name)
+        get_option_cache().invalidate(table_name)
+
+def refresh_results(my_db):
+    '''drop every cached analytics result when the orders change token moved'''
+    if get_orders_token(my_db).changed(my_db):
+        get_result_cache().clear()
+
+def cached_report(my_db, title: str, args: tuple = ()):
+    '''
+    return the result of an analytics report from the shared result cache, running its procedure on a miss.
+    returns: (dataframe, seconds since it was computed, or None if it was computed by this call)
+    '''
+    refresh_results(my_db)
+    df, age, _ = fetch_report(get_result_cache(), my_db, title, config.ANALYTICS[title], args)
+    return df, age
+
+def order_years(my_db) -> list:
+    '''years that have sales, cached with the analytics results'''
+    def loader():
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(ORDER_YEARS_QUERY)
+            years = [int(row[0]) for row in cursor.fetchall()]
+            cursor.close()
+        return years
+    return get_result_cache().get(("order_years", ()), loader)
+
+def report_age_caption(age):
+    '''tell whether a report was served from the result cache'''
+    if age is None:
+        st.caption("Computed just now.")
+    else:
+        st.caption(f"Served from cache, computed {age:.0f}s ago.")
 
 def order_analytics(my_db):
     '''render order analytics content generated by stored procedure'''
-    mycursor = my_db.cursor()
-    st.subheader("Number of Orders per Customer")
-    mycursor.callproc(config.ANALYTICS["Number of Orders per Customer"], ())
-    result = mycursor.fetchall() # a list of tuples (cid, email, num_orders)
-    mycursor.close()
-    # make the result a dataframe and display with chart view
-    df = pd.DataFrame(result, columns=["cid", "email", "num_orders"])
+    title = "Number of Orders per Customer"
+    st.subheader(title)
+    df, age = cached_report(my_db, title)
+    report_age_caption(age)
     st.dataframe(df)
     st.bar_chart(df["num_orders"])
 
@@ -377,22 +983,142 @@ def sales_analytics(my_db):
     title = "Best Selling Products by Year"
     st.subheader(title)
     in_year = st.text_input("Enter a year", value="2023")
-    mycursor = my_db.cursor()
-    mycursor.callproc(config.ANALYTICS[title], (in_year,))
-    result = mycursor.fetchall()
-    mycursor.close()
-    # make the result a dataframe and display with chart view
-    df = pd.DataFrame(result, columns=["Product", "Sold"])
-    df["Sold"] = df["Sold"].apply(int)
+    df, age = cached_report(my_db, title, (in_year.strip(),))
+    report_age_caption(age)
     st.dataframe(df)
     st.bar_chart(df, x="Product", y="Sold")
     
+def compare_analytics(my_db):
+    '''render reports over several years or a date range side by side, their queries run in parallel'''
+    st.subheader("Compare Periods")
+    refresh_results(my_db)
+    by = st.radio("Compare", ["Years", "Date range"], horizontal=True)
+    if by == "Years":
+        available = order_years(my_db)
+        years = st.multiselect("Years", available, default=available[-2:])
+        periods = [(str(year), date(year, 1, 1), date(year + 1, 1, 1)) for year in sorted(years)]
+    else:
+        picked = st.date_input("From - to", value=(date.today().replace(month=1, day=1), date.today()))
+        # the end date is included, the procedures take [start, end)
+        periods = [(f"{picked[0]} - {picked[1]}", picked[0], picked[1] + timedelta(days=1))] if len(picked) == 2 else []
+    titles = st.multiselect("Reports", list(config.PERIOD_REPORTS), default=list(config.PERIOD_REPORTS))
+    if not periods or not titles:
+        st.info("Pick at least one period and one report.")
+        return
+
+    jobs = [(title, config.PERIOD_REPORTS[title], (start, end)) for title in titles for _, start, end in periods]
+    results, wall_time = fetch_reports(get_report_executor(), get_result_cache(), my_db, jobs)
+    query_times = [seconds for _, age, seconds in results if age is None]
+    if query_times:
+        st.caption(f"{len(query_times)} of {len(jobs)} results computed in {wall_time:.2f}s "
+                   f"(slowest query {max(query_times):.2f}s, one after another {sum(query_times):.2f}s), "
+                   f"the others served from cache.")
+    else:
+        st.caption(f"All {len(jobs)} results served from cache.")
+
+    for i, title in enumerate(titles):
+        per_period = results[i * len(periods):(i + 1) * len(periods)]
+        table = compare_periods(title, [(label, df) for (label, _, _), (df, _, _) in zip(periods, per_period)])
+        st.markdown(f"**{title}**")
+        st.dataframe(table)
+        st.bar_chart(table)
+
 def devopsContent(my_db):
     st.header("Features under development")
     st.info("Contact chen.shuju@northeastern.edu for any technical issues")
+    pool_stats_panel(my_db)
+    query_log_panel()
+    table_cache_panel()
+    catalog_panel(my_db)
+    rollups_panel(my_db)
     # res = get_fields(my_db, 'customer')
     # st.write(res)
 
+def pool_stats_panel(my_db: ConnectionPool):
+    '''render occupancy and wait-time counters of the shared connection pool, for sizing the pool'''
+    st.subheader("Connection Pool")
+    stats = my_db.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("In use", f"{stats['in_use']} / {stats['max_size']}")
+    col2.metric("Idle", stats["idle"])
+    col3.metric("Peak in use", stats["peak_in_use"])
+    col4.metric("Timeouts", stats["timeouts"])
+    col1.metric("Checkouts", stats["checkouts"])
+    col2.metric("Waited checkouts", stats["waits"])
+    col3.metric("Avg wait (ms)", f"{stats['avg_wait_time'] * 1000:.1f}")
+    col4.metric("Max wait (ms)", f"{stats['max_wait_time'] * 1000:.1f}")
+    st.caption(f"Reconnects: {stats['reconnects']}, discarded connections: {stats['discarded']}")
+
+def query_log_panel():
+    '''render the slowest queries, latency percentiles per statement, queries per rerun and cache hit ratios'''
+    st.subheader("Query Timings")
+    query_log = get_query_log()
+    records = query_log.records()
+    reruns = query_log.reruns()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queries logged", f"{len(records)} / {query_log.total()}")
+    col2.metric("Queries per rerun", f"{reruns['queries'].mean():.1f}" if len(reruns) else "-")
+    col3.metric("p95 per rerun (ms)", f"{reruns['query_ms'].quantile(0.95):.0f}" if len(reruns) else "-")
+    col4.metric("Max per rerun", int(reruns["queries"].max()) if len(reruns) else "-")
+    caches = {"Table cache": get_table_cache(), "Analytics results": get_result_cache(), "Dropdown options": get_option_cache()}
+    for col, (name, cache) in zip(st.columns(4), caches.items()):
+        stats = cache.stats()
+        col.metric(f"{name} hit ratio", f"{stats['hit_ratio']:.0%}", help=f"hits: {stats['hits']}, misses: {stats['misses']}")
+
+    tab1, tab2, tab3 = st.tabs(["Per statement", "Slowest queries", "Per rerun"])
+    tab1.dataframe(query_log.summary())
+    slowest = records.nlargest(20, "ms").assign(at = lambda df: pd.to_datetime(df["at"], unit="s"))
+    tab2.dataframe(slowest, hide_index=True)
+    if len(reruns):
+        tab3.line_chart(reruns.set_index("rerun")[["queries"]])
+    tab3.dataframe(reruns.assign(at = lambda df: pd.to_datetime(df["at"], unit="s")).iloc[::-1], hide_index=True)
+
+    col1, col2 = st.columns(2)
+    col1.download_button("Export query log (JSONL)", query_log.to_jsonl(), file_name="query_log.jsonl",
+                         mime="application/jsonl")
+    if col2.button("Clear query log"):
+        query_log.clear()
+        st.rerun()
+
+def table_cache_panel():
+    '''render size and hit ratio of the shared table page cache'''
+    st.subheader("Table Cache")
+    stats = get_table_cache().stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Cached pages", stats["entries"])
+    col2.metric("Memory (MB)", f"{stats['bytes'] / 1024 / 1024:.1f} / {stats['max_bytes'] / 1024 / 1024:.0f}")
+    col3.metric("Hit ratio", f"{stats['hit_ratio']:.0%}")
+    col4.metric("Evictions", stats["evictions"])
+    st.caption(f"Hits: {stats['hits']}, misses: {stats['misses']}, expired: {stats['expired']}, "
+               f"invalidations: {stats['invalidations']}")
+
+def catalog_panel(my_db):
+    '''show when the schema catalog was read, with a button to re-read it after schema changes'''
+    st.subheader("Schema Catalog")
+    catalog = get_catalog(my_db)
+    st.caption(f"{len(catalog.table_names())} tables, loaded at "
+               f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(catalog.loaded_at))}")
+    if st.button("Refresh schema catalog"):
+        catalog.refresh(my_db)
+        st.rerun()
+
+def rollups_panel(my_db):
+    '''check the sales rollups read by the analytics page against the source procedures, or rebuild them'''
+    st.subheader("Sales Rollups")
+    col1, col2 = st.columns(2)
+    if col1.button("Check rollups against orders"):
+        with my_db.connection() as conn:
+            mismatches = compare_rollups(conn, config.ANALYTICS, config.ANALYTICS_SOURCE)
+        if mismatches:
+            for mismatch in mismatches:
+                st.error(mismatch)
+        else:
+            st.success("The rollups match the order tables.")
+    if col2.button("Rebuild rollups"):
+        with my_db.connection() as conn:
+            rebuild_rollups(conn, config.ROLLUP_REBUILD)
+        st.success("Rollups rebuilt from the order tables.")
+
 def log_out_btn(role):
     '''log the user out from a specific role'''
     with st.sidebar.container():
@@ -404,19 +1130,19 @@ def log_out_btn(role):
 def main():
     disconnect = False
     # connect to remote hosted database using credentials stored in secrets.toml on the cloud
-    my_db = connectDB(config.DB_NAME) # the connection will be cached for this specific db name so it will only connect once
+    my_db = connectDB(config.DB_NAME) # the pool will be cached for this specific db name, queries borrow a connection from it
 
     try:
-        table_names = get_table_names(my_db) 
-        table_keys = set_table_sessions(my_db, table_names)
+        # tables are read a page at a time by the views that need them, see paged_view()
         role = st.sidebar.selectbox("Select a role", ['admin', 'analytics', 'delivery', "devops"])
-        verified = verifyRole(role) # if success, the role will be marked as verified for this session
-        if verified:
-            st.header("🍣 🦑 🐟 🐙 🦐")
-            renderContentFor(role, my_db, table_names, table_keys)
-            log_out_btn(role)
-        else:
-            st.info(f"Password: {st.secrets[role]} 🤫")
+        with get_query_log().rerun(role): # the queries of this run are totalled per rerun on the devops page
+            verified = verifyRole(role) # if success, the role will be marked as verified for this session
+            if verified:
+                st.header("🍣 🦑 🐟 🐙 🦐")
+                renderContentFor(role, my_db)
+                log_out_btn(role)
+            else:
+                st.info(f"Password: {st.secrets[role]} 🤫")
         
     except pymysql.Error as e:
         print("Error:", e.args)
@@ -425,7 +1151,7 @@ def main():
         if (my_db is not None) & (disconnect == True):
             my_db.close()
             print("--------------------------")
-            print("Connection closed")
+            print("Connection pool closed")
             print("--------------------------")
 
 if __name__ == '__main__':
@@ -0,0 +1,81 @@
+# This file contains the work queue of one delivery partner: the open deliveries assigned to the partner, read
+# through the (delivery_partner_id, delivery_status, expected_delivery_date) index (database/delivery_queue.sql),
+# then kept up to date from a feed of the partner's rows updated since a watermark instead of reloading the queue.
+# The feed also reads the rows of the queue updated since the watermark, so a delivery given to another partner
+# leaves the queue.
+
+from datetime import timedelta
+
+from isf_frames import typed_frame
+from isf_refresh import merge_rows
+from isf_sql import quote_ident, pk_in_condition
+
+QUEUE_ORDER = ['expected_delivery_date', 'order_id']
+
+
+def server_now(cursor):
+    '''current time of the DB server, the watermark of a read: rows written later have a later updated_at'''
+    cursor.execute("SELECT NOW(6)")
+    return cursor.fetchone()[0]
+
+
+def queue_sql(table_name: str, n_statuses: int) -> str:
+    '''SELECT of a partner's deliveries in n_statuses statuses, params: partner id, then the statuses'''
+    return (f"SELECT * FROM {quote_ident(table_name)} WHERE delivery_partner_id = %s "
+            f"AND delivery_status IN ({', '.join(['%s'] * n_statuses)}) "
+            f"ORDER BY {', '.join(quote_ident(col) for col in QUEUE_ORDER)}")
+
+
+def feed_sql(table_name: str, updated_col: str, pk_cols: tuple = (), n_queued: int = 0) -> str:
+    '''
+    SELECT of the rows written since a time that are the partner's, or one of the n_queued rows of its queue.
+    params: time, partner id, then the pk values of the queued rows, flattened
+    '''
+    queued = f" OR {pk_in_condition(pk_cols, n_queued)}" if n_queued else ""
+    return (f"SELECT * FROM {quote_ident(table_name)} "
+            f"WHERE {quote_ident(updated_col)} >= %s AND (delivery_partner_id = %s{queued})")
+
+
+def load_queue(conn, table_name: str, partner_id, statuses: list, columns: list, dtypes: dict = None):
+    '''
+    the open deliveries of a partner (delivery_status in statuses), the earliest expected first.
+    returns: (typed dataframe, watermark to read the feed from)
+    '''
+    cursor = conn.cursor()
+    watermark = server_now(cursor)
+    cursor.execute(queue_sql(table_name, len(statuses)), (partner_id, *statuses))
+    rows = cursor.fetchall()
+    cursor.close()
+    return typed_frame(rows, columns, dtypes), watermark
+
+
+def read_feed(conn, table_name: str, partner_id, updated_col: str, watermark, grace: float, columns: list,
+              dtypes: dict = None, pk_cols: tuple = (), queued: list = ()):
+    '''
+    the partner's rows written since the watermark (new assignments, and rows changed in any way, including
+    the ones that left the open statuses), and the rows of the queue written since then (including the ones
+    given to another partner), going back grace seconds for transactions that committed late.
+    params:
+        queued: pk values (tuples in pk_cols order) of the rows in the partner's queue
+    returns: (typed dataframe, the next watermark)
+    '''
+    cursor = conn.cursor()
+    next_watermark = server_now(cursor)
+    cursor.execute(feed_sql(table_name, updated_col, pk_cols, len(queued)),
+                   (watermark - timedelta(seconds=grace), partner_id, *[val for key in queued for val in key]))
+    rows = cursor.fetchall()
+    cursor.close()
+    return typed_frame(rows, columns, dtypes), next_watermark
+
+
+def apply_feed(queue, fresh, pk_cols: tuple, statuses: list, partner_id):
+    '''
+    a new queue dataframe: the fresh rows replace or join the queue,
+    the ones no longer open or no longer assigned to the partner leave it
+    '''
+    if fresh.empty:
+        return queue
+    merged = merge_rows(queue, pk_cols, fresh, set())
+    assigned = (merged["delivery_partner_id"] == partner_id).fillna(False).astype(bool)
+    merged = merged[merged["delivery_status"].isin(statuses) & assigned]
+    return merged.sort_values(QUEUE_ORDER, kind="stable").reset_index(drop=True)
@@ -0,0 +1,114 @@
+# This file contains the typed dataframe materialization of query results: rows are streamed from an
+# unbuffered server-side cursor in chunks, and each column gets a dtype chosen from the schema catalog.
+
+import pandas as pd
+import pymysql
+from pandas.api.types import union_categoricals
+
+DATETIME = "datetime64[ns]"
+
+INT_TYPES = ('tinyint', 'smallint', 'mediumint', 'int', 'bigint', 'year')
+FLOAT_TYPES = ('float', 'double')
+DECIMAL_TYPES = ('decimal',)
+DATE_TYPES = ('date', 'datetime', 'timestamp')
+TEXT_TYPES = ('char', 'varchar', 'tinytext', 'text', 'mediumtext', 'longtext')
+
+
+def column_dtypes(table) -> dict:
+    '''
+    {column name: dtype} for the columns of a catalog TableInfo: nullable Int64/Float64 for numbers,
+    categoricals for ENUM columns (with every allowed value) and text foreign keys, datetime64 for dates.
+    columns not listed stay object (e.g. TIME, BLOB), DECIMAL included: its values stay exact python Decimals
+    rather than floats.
+    '''
+    dtypes = {}
+    for col in table.columns:
+        if col.data_type in INT_TYPES:
+            dtypes[col.name] = "UInt64" if "unsigned" in col.column_type and col.data_type == 'bigint' else "Int64"
+        elif col.data_type in FLOAT_TYPES:
+            dtypes[col.name] = "Float64"
+        elif col.data_type == 'enum':
+            dtypes[col.name] = pd.CategoricalDtype(list(col.enum_values))
+        elif col.data_type in TEXT_TYPES and col.name in table.fk_columns:
+            dtypes[col.name] = "category" # few distinct values repeated over many rows
+        elif col.data_type in DATE_TYPES:
+            dtypes[col.name] = DATETIME
+    return dtypes
+
+
+def to_series(values: list, dtype=None) -> pd.Series:
+    '''one column of raw values from the driver (None for NULL) as a series of the given dtype'''
+    if dtype is None:
+        return pd.Series(values, dtype=object)
+    if dtype in ("Int64", "UInt64"):
+        # DECIMAL results (e.g. SUM of an int column) come back as Decimal
+        return pd.Series(pd.array([None if val is None else int(val) for val in values], dtype=dtype))
+    if dtype == "Float64":
+        return pd.Series(pd.array([None if val is None else float(val) for val in values], dtype=dtype))
+    if dtype == DATETIME:
+        return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
+    if isinstance(dtype, pd.CategoricalDtype) or dtype == "category":
+        categories = dtype.categories if isinstance(dtype, pd.CategoricalDtype) else None
+        return pd.Series(pd.Categorical(values, categories=categories))
+    return pd.Series(values).astype(dtype)
+
+
+def typed_frame(rows, columns: list, dtypes: dict = None) -> pd.DataFrame:
+    '''build a dataframe column by column from driver rows, converting each column to its dtype'''
+    dtypes = dtypes or {}
+    data = {col: to_series([row[i] for row in rows], dtypes.get(col)) for i, col in enumerate(columns)}
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def concat_column(parts: list) -> pd.Series:
+    '''one column from its typed parts, categoricals with different categories (e.g. per chunk) stay categorical'''
+    if isinstance(parts[0].dtype, pd.CategoricalDtype) and any(part.dtype != parts[0].dtype for part in parts):
+        return pd.Series(union_categoricals(parts, sort_categories=True))
+    return pd.concat(parts, ignore_index=True)
+
+
+def concat_frames(frames: list, columns: list) -> pd.DataFrame:
+    '''
+    concatenate typed frames column by column. categorical columns are combined with union_categoricals,
+    pd.concat would turn categoricals with different categories (e.g. per chunk) back into object columns.
+    '''
+    data = {col: concat_column([frame[col] for frame in frames]) for col in columns}
+    return pd.DataFrame(data, columns=columns, copy=False)
+
+
+def iter_frames(conn, sql: str, params, columns: list, dtypes: dict = None, chunk_size: int = 5000):
+    '''
+    run a query on an unbuffered server-side cursor and yield a typed dataframe per chunk of chunk_size rows,
+    so only one chunk of driver tuples is held in memory at a time instead of the whole result.
+    the connection can't run other queries until the generator is exhausted or closed.
+    '''
+    # the connection's own server-side cursor class when its cursors are instrumented (isf_metrics.py)
+    cursor = conn.cursor(getattr(conn.cursorclass, "unbuffered", pymysql.cursors.SSCursor))
+    try:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield typed_frame(rows, columns, dtypes)
+    finally:
+        cursor.close() # reads whatever is left of the result, the connection can't be reused before that
+
+
+def read_frame(conn, sql: str, params, columns: list, dtypes: dict = None, chunk_size: int = 5000) -> pd.DataFrame:
+    '''
+    run a query on an unbuffered server-side cursor and build one typed dataframe from its chunks, see iter_frames().
+    the chunks are kept as columns and each column is concatenated then its parts dropped, so the result and the
+    chunks are only both held for one column at a time
+    '''
+    parts, n_chunks = {col: [] for col in columns}, 0
+    for frame in iter_frames(conn, sql, params, columns, dtypes, chunk_size):
+        for col in columns:
+            parts[col].append(frame[col])
+        n_chunks += 1
+    if n_chunks == 0:
+        return typed_frame([], columns, dtypes)
+    data = {}
+    for col in columns:
+        data[col] = concat_column(parts.pop(col)) if n_chunks > 1 else parts.pop(col)[0]
+    return pd.DataFrame(data, columns=columns, copy=False)
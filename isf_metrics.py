@@ -0,0 +1,300 @@
+# This file contains the query timing instrumentation: pymysql cursor classes that time every execute/callproc,
+# and a bounded in-memory log of the timings with per-rerun totals, shown on the devops page.
+
+import contextvars
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import pandas as pd
+import pymysql
+
+# the rerun (a RerunTotals) the current thread's queries count towards, see QueryLog.rerun()
+_current_rerun = contextvars.ContextVar("isf_rerun", default=None)
+
+_SPACES = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)")
+_REPEATED_LISTS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+# rows sampled to estimate the size of a result
+BYTES_SAMPLE = 50
+
+
+def statement_key(sql: str, limit: int = 300) -> str:
+    '''
+    a statement with its literals and placeholder lists collapsed, so the same query with other values
+    or another number of rows (multi-row VALUES, IN lists) groups together
+    '''
+    sql = _SPACES.sub(" ", sql).strip()
+    sql = _LITERALS.sub("?", sql)
+    sql = _PLACEHOLDER_LIST.sub("(?)", sql)
+    sql = _REPEATED_LISTS.sub("(?), ...", sql)
+    return sql if len(sql) <= limit else sql[:limit] + "..."
+
+
+def param_shape(args) -> str:
+    '''the shape of the parameters, not their values: "3 params", "cols: a, b", "100 x 3 params"'''
+    if args is None:
+        return ""
+    if isinstance(args, dict):
+        return "cols: " + ", ".join(sorted(map(str, args)))
+    if isinstance(args, (list, tuple)):
+        return f"{len(args)} params"
+    return "1 param"
+
+
+def rows_bytes(rows) -> int:
+    '''approximate size of a result on the wire, from the values of a sample of its rows'''
+    if not rows:
+        return 0
+    sample = rows[:BYTES_SAMPLE]
+    size = sum(len(value) if isinstance(value, (str, bytes)) else 8
+               for row in sample for value in (row.values() if isinstance(row, dict) else row) if value is not None)
+    return size * len(rows) // len(sample)
+
+
+def call_site() -> str:
+    '''
+    the application function that ran the query: the nearest frame outside pymysql and this file,
+    prefixed by the isf_dbapp function it was called from when that is a different one
+    '''
+    frame = sys._getframe(2)
+    nearest = None
+    for _ in range(15):
+        if frame is None:
+            break
+        module = frame.f_globals.get("__name__", "")
+        if not module.startswith("pymysql") and module != __name__:
+            name = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0] + "." + frame.f_code.co_name
+            if nearest is None:
+                nearest = name
+            if name.startswith("isf_dbapp."):
+                return name if name == nearest else f"{name} > {nearest}"
+        frame = frame.f_back
+    return nearest or "?"
+
+
+class RerunTotals:
+    '''counters of the queries run for one streamlit rerun, including those of worker threads it started'''
+
+    def __init__(self, rerun_id: int, label: str):
+        self.rerun_id = rerun_id
+        self.label = label
+        self.started = time.time()
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, rows: int, nbytes: int):
+        with self._lock:
+            self.queries += 1
+            self.seconds += seconds
+            self.rows += rows
+            self.bytes += nbytes
+
+
+class QueryLog:
+    '''
+    A bounded in-memory log of query timings shared by all sessions, the oldest records dropped first.
+
+    params:
+        capacity: number of query records kept
+        rerun_capacity: number of per-rerun totals kept
+        export_path: JSONL file every record is also appended to, None to keep them in memory only
+    '''
+
+    def __init__(self, capacity: int, rerun_capacity: int, export_path: str = None):
+        self.capacity = capacity
+        self.export_path = export_path
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=capacity)
+        self._reruns = deque(maxlen=rerun_capacity)
+        self._rerun_ids = itertools.count(1)
+        self._total = 0
+        self._file = open(export_path, "a", buffering=1) if export_path else None
+
+    def record(self, statement: str, params: str, caller: str, seconds: float, rows: int, nbytes: int):
+        rerun = _current_rerun.get()
+        entry = {"at": time.time(), "statement": statement, "params": params, "caller": caller,
+                 "ms": seconds * 1000, "rows": rows, "bytes": nbytes, "rerun": rerun.rerun_id if rerun else None}
+        if rerun:
+            rerun.add(seconds, rows, nbytes)
+        with self._lock:
+            self._records.append(entry)
+            self._total += 1
+            if self._file:
+                self._file.write(json.dumps(entry) + "\n")
+
+    @contextmanager
+    def rerun(self, label: str = ""):
+        '''
+        count the queries of a with-block (one script run) towards a new set of rerun totals.
+        a block inside another (a fragment running as part of a full run) counts towards the outer one
+        '''
+        if _current_rerun.get() is not None:
+            yield _current_rerun.get()
+            return
+        totals = RerunTotals(next(self._rerun_ids), label)
+        token = _current_rerun.set(totals)
+        start = time.perf_counter()
+        try:
+            yield totals
+        finally:
+            _current_rerun.reset(token)
+            with self._lock:
+                self._reruns.append({"rerun": totals.rerun_id, "label": totals.label, "at": totals.started,
+                                     "wall_ms": (time.perf_counter() - start) * 1000, "queries": totals.queries,
+                                     "query_ms": totals.seconds * 1000, "rows": totals.rows, "bytes": totals.bytes})
+
+    def records(self) -> pd.DataFrame:
+        with self._lock:
+            records = list(self._records)
+        return pd.DataFrame(records, columns=["at", "statement", "params", "caller", "ms", "rows", "bytes", "rerun"])
+
+    def reruns(self) -> pd.DataFrame:
+        with self._lock:
+            reruns = list(self._reruns)
+        return pd.DataFrame(reruns, columns=["rerun", "label", "at", "wall_ms", "queries", "query_ms", "rows", "bytes"])
+
+    def summary(self) -> pd.DataFrame:
+        '''calls, latency percentiles (ms), rows and bytes per statement, the most total time first'''
+        df = self.records()
+        if df.empty:
+            return pd.DataFrame(columns=["calls", "p50_ms", "p95_ms", "max_ms", "total_ms", "avg_rows", "avg_bytes"])
+        grouped = df.groupby("statement")
+        summary = pd.DataFrame({"calls": grouped.size(),
+                                "p50_ms": grouped["ms"].quantile(0.5),
+                                "p95_ms": grouped["ms"].quantile(0.95),
+                                "max_ms": grouped["ms"].max(),
+                                "total_ms": grouped["ms"].sum(),
+                                "avg_rows": grouped["rows"].mean(),
+                                "avg_bytes": grouped["bytes"].mean()})
+        return summary.sort_values("total_ms", ascending=False)
+
+    def to_jsonl(self) -> str:
+        with self._lock:
+            return "".join(json.dumps(entry) + "\n" for entry in self._records)
+
+    def total(self) -> int:
+        '''number of queries recorded since the process started, including those dropped from the buffer'''
+        with self._lock:
+            return self._total
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._reruns.clear()
+
+
+class _Timed:
+    '''
+    Times execute/executemany/callproc of a pymysql cursor and records them to the class's query_log.
+    Unbuffered cursors stream their rows after execute returns, so their record is completed when the
+    cursor is closed or runs its next statement, counting the rows fetched in between.
+    '''
+    query_log = None
+    _pending = None
+    _in_many = False
+
+    def _begin(self, statement: str, params: str):
+        self._finish()
+        self._pending = [statement, params, call_site(), time.perf_counter(), 0, 0]
+
+    def _count(self, rows):
+        if self._pending and rows:
+            self._pending[4] += len(rows)
+            self._pending[5] += rows_bytes(rows)
+
+    def _finish(self, rows: int = None):
+        pending, self._pending = self._pending, None
+        if pending:
+            statement, params, caller, start, fetched, nbytes = pending
+            self.query_log.record(statement, params, caller, time.perf_counter() - start,
+                                  fetched if rows is None else rows, nbytes)
+
+    def _buffered_result(self):
+        '''complete the record of a buffered cursor, whose rows have all arrived'''
+        rows = self._rows or ()
+        self._pending[5] = rows_bytes(rows)
+        self._finish(len(rows) if rows else max(self.rowcount, 0))
+
+    def execute(self, query, args=None):
+        if self._in_many: # one of the statements of executemany(), recorded as a whole
+            return super().execute(query, args)
+        self._begin(statement_key(query), param_shape(args))
+        try:
+            result = super().execute(query, args)
+        except Exception:
+            self._finish(0)
+            raise
+        if not self._unbuffered:
+            self._buffered_result()
+        return result
+
+    def executemany(self, query, args):
+        args = list(args) if args else []
+        self._begin(statement_key(query), f"{len(args)} x {param_shape(args[0])}" if args else "")
+        self._in_many = True
+        try:
+            result = super().executemany(query, args)
+        except Exception:
+            self._finish(0)
+            raise
+        finally:
+            self._in_many = False
+        self._finish(max(self.rowcount, 0))
+        return result
+
+    def callproc(self, procname, args=()):
+        self._begin(f"CALL {procname}", param_shape(args))
+        try:
+            result = super().callproc(procname, args)
+        except Exception:
+            self._finish(0)
+            raise
+        if not self._unbuffered:
+            self._buffered_result()
+        return result
+
+    def fetchone(self):
+        row = super().fetchone()
+        if self._unbuffered and row is not None:
+            self._count([row])
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(size)
+        if self._unbuffered:
+            self._count(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        if self._unbuffered:
+            self._count(rows)
+        return rows
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._finish()
+
+
+def timed_cursor(query_log: QueryLog):
+    '''
+    a pymysql cursor class recording to query_log, pass it as connect(cursorclass=...);
+    its `unbuffered` attribute is the matching server-side cursor class (see isf_frames.read_frame())
+    '''
+    unbuffered = type("TimedSSCursor", (_Timed, pymysql.cursors.SSCursor), {"query_log": query_log, "_unbuffered": True})
+    return type("TimedCursor", (_Timed, pymysql.cursors.Cursor),
+                {"query_log": query_log, "_unbuffered": False, "unbuffered": unbuffered})
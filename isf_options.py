@@ -0,0 +1,31 @@
+# This file contains the option lists of the foreign key dropdowns: the values of the referenced column,
+# read once and shared by all sessions, or searched by prefix when the referenced table is too big to list.
+
+import pandas as pd
+
+from isf_pages import escape_like
+from isf_sql import quote_ident
+
+
+def load_options(conn, referenced_table: str, referenced_col: str, limit: int):
+    '''
+    the values of a referenced key column in order, at most limit of them.
+    returns: (series of values, whether that is every value of the column)
+    '''
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {quote_ident(referenced_col)} FROM {quote_ident(referenced_table)} "
+                   f"ORDER BY {quote_ident(referenced_col)} LIMIT %s", (limit + 1,))
+    values = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return pd.Series(values[:limit], dtype=object), len(values) <= limit
+
+
+def search_options(conn, referenced_table: str, referenced_col: str, prefix: str, limit: int):
+    '''the first limit values of a referenced key column starting with prefix, as a series'''
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {quote_ident(referenced_col)} FROM {quote_ident(referenced_table)} "
+                   f"WHERE {quote_ident(referenced_col)} LIKE %s ORDER BY {quote_ident(referenced_col)} LIMIT %s",
+                   (escape_like(prefix) + "%", limit))
+    values = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return pd.Series(values, dtype=object)
@@ -0,0 +1,147 @@
+# This file contains the paged data source for large tables: keyset pagination on the primary key,
+# with filtering and sorting pushed down to MySQL as parameterized queries.
+
+from dataclasses import dataclass
+
+from isf_frames import typed_frame
+from isf_sql import quote_ident
+
+# operators offered in the filter editor: SQL template for the value placeholder
+FILTER_OPS = {"=": "= %s",
+              "!=": "<> %s",
+              "<": "< %s",
+              "<=": "<= %s",
+              ">": "> %s",
+              ">=": ">= %s",
+              "contains": "LIKE %s",
+              "starts with": "LIKE %s",
+              "is empty": "IS NULL",
+              "is not empty": "IS NOT NULL"}
+
+
+def escape_like(value: str) -> str:
+    '''escape the LIKE wildcards in a user supplied value'''
+    return str(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def filter_condition(col: str, op: str, value):
+    '''one parameterized WHERE condition for a filter chosen in the UI, returns (sql, params)'''
+    if op not in FILTER_OPS:
+        raise ValueError(f"unknown filter operator {op}")
+    sql = f"{quote_ident(col)} {FILTER_OPS[op]}"
+    if op in ("is empty", "is not empty"):
+        return sql, []
+    if op == "contains":
+        return sql, [f"%{escape_like(value)}%"]
+    if op == "starts with":
+        return sql, [f"{escape_like(value)}%"]
+    return sql, [value]
+
+
+def keyset_condition(cols: tuple, after: tuple, descending: bool):
+    '''
+    rows strictly after the last row of the previous page in (col1, col2, ...) order, written out as
+    col1 > x OR (col1 = x AND col2 > y) OR ... so MySQL can use an index range on the leading column
+    '''
+    op = "<" if descending else ">"
+    terms = []
+    params = []
+    for i, col in enumerate(cols):
+        equal = [f"{quote_ident(prev)} = %s" for prev in cols[:i]]
+        terms.append("(" + " AND ".join(equal + [f"{quote_ident(col)} {op} %s"]) + ")")
+        params.extend(after[:i])
+        params.append(after[i])
+    return "(" + " OR ".join(terms) + ")", params
+
+
+@dataclass(frozen=True)
+class PageQuery:
+    '''
+    what a paged view shows: a table, optionally filtered and sorted by one column, page_size rows at a time.
+    rows are ordered by (sort_col, pk...) so every row has a unique position to continue after.
+    sort_col must be a NOT NULL column, NULLs can't be compared in a keyset condition.
+    '''
+    table_name: str
+    pk_cols: tuple
+    sort_col: str = None  # None: primary key order
+    descending: bool = False
+    filters: tuple = ()  # ((col, op, value), ...)
+    page_size: int = 100
+
+    @property
+    def order_cols(self) -> tuple:
+        if self.sort_col is None:
+            return self.pk_cols
+        return (self.sort_col,) + tuple(col for col in self.pk_cols if col != self.sort_col)
+
+    def where(self, after: tuple = None):
+        '''WHERE clause (or "") with its params for the filters, and the keyset condition if after is given'''
+        conditions = []
+        params = []
+        for col, op, value in self.filters:
+            sql, values = filter_condition(col, op, value)
+            conditions.append(sql)
+            params.extend(values)
+        if after is not None:
+            sql, values = keyset_condition(self.order_cols, after, self.descending)
+            conditions.append(sql)
+            params.extend(values)
+        if not conditions:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
+    def page_sql(self, after: tuple = None):
+        '''SELECT of one page, one row more than page_size to know whether there is a next page'''
+        where, params = self.where(after)
+        direction = " DESC" if self.descending else ""
+        order = ", ".join(quote_ident(col) + direction for col in self.order_cols)
+        return (f"SELECT * FROM {quote_ident(self.table_name)}{where} ORDER BY {order} LIMIT %s",
+                params + [self.page_size + 1])
+
+
+def fetch_page(conn, query: PageQuery, columns: list, after: tuple = None, dtypes: dict = None):
+    '''
+    read one page of rows after the given keyset position (None for the first page).
+    returns: (dataframe of the page, keyset position after its last row, whether there is a next page)
+    '''
+    sql, params = query.page_sql(after)
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall()
+    cursor.close()
+    has_more = len(rows) > query.page_size
+    df = typed_frame(rows[:query.page_size], columns, dtypes)
+    last = None
+    if len(df):
+        positions = [columns.index(col) for col in query.order_cols]
+        last = tuple(rows[query.page_size - 1 if has_more else len(rows) - 1][i] for i in positions)
+    return df, last, has_more
+
+
+def estimate_count(conn, query: PageQuery, exact_below: int):
+    '''
+    number of rows matching the filters: the optimizer's estimate (table statistics, or EXPLAIN rows for a
+    filtered query), counted exactly with COUNT(*) when that estimate says fewer than exact_below rows are read.
+    returns: (count, whether it is exact)
+    '''
+    cursor = conn.cursor()
+    where, params = query.where()
+    if not query.filters:
+        cursor.execute("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                       "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (query.table_name,))
+        row = cursor.fetchone()
+        examined = estimate = int(row[0] or 0) if row else 0
+    else:
+        cursor.execute(f"EXPLAIN SELECT * FROM {quote_ident(query.table_name)}{where}", params)
+        names = [desc[0].lower() for desc in cursor.description]
+        row = cursor.fetchone()
+        examined = int(row[names.index("rows")] or 0)
+        estimate = int(examined * float(row[names.index("filtered")] or 100) / 100)
+
+    if examined < exact_below:
+        cursor.execute(f"SELECT COUNT(*) FROM {quote_ident(query.table_name)}{where}", params)
+        count = int(cursor.fetchone()[0])
+        cursor.close()
+        return count, True
+    cursor.close()
+    return estimate, False
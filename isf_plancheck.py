@@ -0,0 +1,420 @@
+# This file contains the query plan checker for the hot query shapes of the app and the customer site procedures,
+# run against a (scaled) local database, see isf_datagen.py. Each shape is filled in with real values of the
+# database and explained: full scans of big tables, filesorts and temporary tables are flagged, SELECTs are also
+# run under EXPLAIN ANALYZE for their actual time. A plan file kept as a baseline makes the check fail when a schema
+# change puts a scan back on one of the shapes. The indexes the shapes need are versioned migrations applied here.
+#
+#   python isf_plancheck.py explain --out plan_results.json
+#   python isf_plancheck.py explain --out plan_results.json --baseline plan_baseline.json
+#   python isf_plancheck.py compare plan_results.json plan_baseline.json
+#   python isf_plancheck.py propose plan_results.json      # candidate indexes for the flagged scans
+#   python isf_plancheck.py migrate [--dry-run]            # apply the MIGRATIONS not applied yet
+
+import argparse
+import json
+import re
+import sys
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable
+
+import pymysql
+import toml
+
+import isf_config as config
+from isf_catalog import Catalog
+from isf_delivery import queue_sql, feed_sql
+from isf_metrics import statement_key
+from isf_pages import PageQuery
+from isf_pool import ConnectionPool, connect_args
+from isf_sql import update_statement, case_update_statement, delete_statement, pk_in_condition, quote_ident
+
+# access types of EXPLAIN from the best to the worst, a table moving down this list is a regression
+ACCESS_RANK = ['system', 'const', 'eq_ref', 'ref', 'fulltext', 'ref_or_null', 'index_merge', 'unique_subquery',
+               'index_subquery', 'range', 'index', 'ALL']
+DUP_KEYNAME = 1061
+ACTUAL = re.compile(r"actual time=([\d.]+)\.\.([\d.]+) rows=([\d.]+) loops=(\d+)")
+TABLE_ALIAS = re.compile(r"(?:FROM|JOIN)\s+`?(\w+)`?(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|USING|ORDER|GROUP|LEFT|INNER|"
+                         r"LIMIT|FOR)\b)(\w+))?", re.IGNORECASE)
+
+# the schema changes the query shapes below rely on, applied in version order and recorded in schema_migrations;
+# a new index gets the next version number (see propose), applied migrations are never edited
+MIGRATIONS = [
+    (1, "index order_invoice.order_date for the order date range reports",
+     ["ALTER TABLE order_invoice ADD INDEX idx_order_date (order_date)"]),
+    (2, "get_product_sales filters on an order_date range instead of YEAR(order_date), so it can use idx_order_date",
+     ["DROP PROCEDURE IF EXISTS get_product_sales",
+      """CREATE PROCEDURE get_product_sales(IN year_p INT)
+BEGIN
+	SELECT p_name AS product, SUM(quantity) AS num_sold FROM order_invoice
+		JOIN order_item USING (order_id)
+		WHERE order_date >= MAKEDATE(year_p, 1) AND order_date < MAKEDATE(year_p + 1, 1)
+		GROUP BY product ORDER BY num_sold DESC;
+END"""]),
+    (3, "index order_invoice (customer_id, coupon_code) for the coupons a customer already used (get_promo_codes)",
+     ["ALTER TABLE order_invoice ADD INDEX idx_customer_coupon (customer_id, coupon_code)"]),
+]
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT NOT NULL PRIMARY KEY,
+    description VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+)"""
+
+# the year of the latest order, as [start, end) dates
+LATEST_YEAR = ("SELECT MAKEDATE(YEAR(MAX(order_date)), 1), MAKEDATE(YEAR(MAX(order_date)) + 1, 1) "
+               "FROM order_invoice")
+LATEST_ORDER = "SELECT order_id, customer_id FROM order_invoice ORDER BY order_id DESC LIMIT 1"
+LATEST_COUPON = ("SELECT o.customer_id, c.coupon_code FROM order_invoice o, coupon c "
+                 "ORDER BY o.order_id DESC, c.coupon_code LIMIT 1")
+# the arguments of a report procedure by the types of its parameters: nothing, a year, or a [start, end) range
+NO_PARAMS = "SELECT 1"
+REPORT_SAMPLES = {None: NO_PARAMS, 'int': "SELECT YEAR(MAX(order_date)) FROM order_invoice", 'date,date': LATEST_YEAR}
+
+# reading the statements of a stored procedure's body
+COMMENT = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+DECLARED = re.compile(r"\bDECLARE\s+(\w+)", re.IGNORECASE)
+TEMPORARY_TABLE = re.compile(r"\bCREATE\s+TEMPORARY\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?`?(\w+)", re.IGNORECASE)
+STATEMENT_START = re.compile(r"(?:^|\b(?:BEGIN|THEN|ELSE|DO|LOOP))\s*$", re.IGNORECASE)
+SELECT_INTO = re.compile(r"\bINTO\s+\w+(?:\s*,\s*\w+)*\s+(?=FROM\b)", re.IGNORECASE)
+
+
+@dataclass
+class Probe:
+    '''
+    one query shape: sql with %s params, filled in from the first row of sample (real values of the database),
+    through params(row) when the row isn't already the params.
+    allow: flags the shape can't avoid, e.g. a report grouping and sorting by a SUM needs a temporary table
+    '''
+    name: str
+    sql: str
+    sample: str
+    params: Callable = tuple
+    allow: tuple = ()
+
+
+def routine_statements(cursor, procedure: str) -> tuple:
+    '''
+    the SELECTs a stored procedure runs, as the server has its body: (statements, parameter names, local variables,
+    temporary tables it creates), or None if there is no such procedure. a SELECT ... INTO is kept without its INTO
+    '''
+    cursor.execute("SELECT ROUTINE_DEFINITION FROM information_schema.ROUTINES "
+                   "WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_NAME = %s AND ROUTINE_TYPE = 'PROCEDURE'",
+                   (procedure,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    cursor.execute("SELECT PARAMETER_NAME FROM information_schema.PARAMETERS "
+                   "WHERE SPECIFIC_SCHEMA = DATABASE() AND SPECIFIC_NAME = %s AND ROUTINE_TYPE = 'PROCEDURE' "
+                   "ORDER BY ORDINAL_POSITION", (procedure,))
+    params = [name for name, in cursor.fetchall()]
+    body = COMMENT.sub(" ", row[0])
+    local_vars = [name for name in DECLARED.findall(body) if name.upper() not in ('CONTINUE', 'EXIT', 'UNDO')]
+    statements = []
+    for part in body.split(";"):
+        select = re.search(r"\bSELECT\b", part, re.IGNORECASE)
+        # a statement of its own (not the SELECT of an INSERT, a cursor or a subquery), reading a table
+        if select is None or not STATEMENT_START.search(part[:select.start()]) \
+                or not re.search(r"\bFROM\b", part, re.IGNORECASE):
+            continue
+        statements.append(SELECT_INTO.sub("", " ".join(part[select.start():].split()), count=1))
+    return statements, params, local_vars, TEMPORARY_TABLE.findall(body)
+
+
+def routine_probes(cursor, procedure: str, sample: str, names: tuple = None, allow: tuple = ()) -> list:
+    '''
+    one probe per SELECT of a stored procedure, so the probes are the statements the server runs, not copies of them.
+    sample gives the values of names (the procedure's parameters by default, and any local variable a statement
+    needs), a statement using a variable with no value or a temporary table of the procedure is left out
+    '''
+    found = routine_statements(cursor, procedure)
+    if found is None:
+        print(f"{procedure:<40} skipped: procedure not found")
+        return []
+    statements, params, local_vars, temporary = found
+    names = [name.lower() for name in (params if names is None else names)]
+    variables = re.compile(r"(?<![\w.@`'])(" + "|".join(map(re.escape, params + local_vars)) + r")\b", re.IGNORECASE) \
+        if params or local_vars else None
+    probes = []
+    for sql in statements:
+        used = [name.lower() for name in variables.findall(sql)] if variables else []
+        if any(name not in names for name in used) or any(re.search(rf"\b{re.escape(table)}\b", sql, re.IGNORECASE)
+                                                             for table in temporary):
+            continue
+        sql = variables.sub("%s", sql.replace("%", "%%")) if variables else sql
+        order = tuple(names.index(name) for name in used)
+        probes.append(Probe(procedure, sql, sample, params=lambda row, order=order: tuple(row[i] for i in order),
+                            allow=allow))
+    if len(probes) > 1:
+        for i, probe in enumerate(probes, 1):
+            probe.name = f"{procedure} {i}"
+    return probes
+
+
+def workload(catalog: Catalog, cursor) -> list:
+    '''
+    the hot query shapes: the SELECTs of the analytics and customer site procedures read from the procedures on the
+    server (see routine_probes), and the app's own statements built with the same helpers as the app
+    '''
+    report = ("temporary table", "filesort")
+    probes = []
+    reports = dict.fromkeys([*config.ANALYTICS.values(), *config.PERIOD_REPORTS.values(),
+                             *config.ANALYTICS_SOURCE.values()])
+    for procedure in reports:
+        cursor.execute("SELECT GROUP_CONCAT(DATA_TYPE ORDER BY ORDINAL_POSITION) FROM information_schema.PARAMETERS "
+                       "WHERE SPECIFIC_SCHEMA = DATABASE() AND SPECIFIC_NAME = %s AND PARAMETER_MODE = 'IN'",
+                       (procedure,))
+        types = cursor.fetchone()[0]
+        probes += routine_probes(cursor, procedure, REPORT_SAMPLES.get(types, NO_PARAMS), allow=report)
+    probes += routine_probes(cursor, 'get_promo_codes', LATEST_COUPON)
+    probes += routine_probes(cursor, 'begin_delivery', LATEST_ORDER, names=('c_order_id', 'order_id_exists'))
+    probes += routine_probes(cursor, config.CHECKOUT, "SELECT pid FROM product ORDER BY pid DESC LIMIT 1",
+                             names=('pid_v',))
+
+    # the statements update_table / delete_from prepare (the "procedure" write engine), one row by its primary key
+    probes += [
+        Probe("update_table", update_statement('product', ['sell_price'], ('pid',)),
+              "SELECT sell_price, pid FROM product LIMIT 1"),
+        Probe("delete_from", delete_statement('product', ('pid',)), "SELECT pid FROM product LIMIT 1"),
+    ]
+
+    # admin portal: paged views, refreshing touched rows, batched commits
+    for table_name in ('order_invoice', 'order_item', 'customer'):
+        pk_cols = catalog.primary_key(table_name)
+        cols = ", ".join(quote_ident(col) for col in pk_cols)
+        query = PageQuery(table_name, pk_cols, page_size=config.PAGE_SIZES[0])
+        last_key = f"SELECT {cols} FROM {quote_ident(table_name)} ORDER BY {cols} LIMIT 1"
+        probes.append(Probe(f"page of {table_name}", query.page_sql(tuple(pk_cols))[0], last_key,
+                            params=lambda row, query=query: query.page_sql(tuple(row))[1]))
+        probes.append(Probe(f"refresh {table_name} rows",
+                            f"SELECT * FROM {quote_ident(table_name)} WHERE {pk_in_condition(pk_cols, 1)}", last_key))
+
+    version_col = config.VERSION_COL if config.VERSION_COL in catalog.columns('product') else None
+    version = ", row_version" if version_col else ""
+    probes += [
+        Probe("commit_update product", update_statement('product', ['sell_price'], ('pid',), version_col),
+              f"SELECT sell_price, pid{version} FROM product LIMIT 1"),
+        Probe("commit_update product, one statement",
+              case_update_statement('product', ['sell_price'], ('pid',), 1, version_col),
+              f"SELECT pid, sell_price, pid{version} FROM product LIMIT 1"),
+        Probe("commit_delete product", delete_statement('product', ('pid',), 2, version_col),
+              f"SELECT pid{version}, pid{version} FROM product LIMIT 1"),
+    ]
+
+    # a delivery partner's work queue and its feed
+    latest_partner = "SELECT delivery_partner_id FROM delivery ORDER BY order_id DESC LIMIT 1"
+    probes.append(Probe("delivery queue", queue_sql('delivery', len(config.DELIVERY_OPEN)), latest_partner,
+                        params=lambda row: (row[0], *config.DELIVERY_OPEN), allow=("filesort",)))
+    if config.UPDATED_COL in catalog.columns('delivery'):
+        probes.append(Probe("delivery feed", feed_sql('delivery', config.UPDATED_COL, ('order_id',), 1),
+                            "SELECT NOW(6) - INTERVAL 10 SECOND, delivery_partner_id, order_id FROM delivery "
+                            "ORDER BY order_id DESC LIMIT 1"))
+    return probes
+
+
+def read_plan(node, min_rows: int, tables: dict, flags: set):
+    '''collect the access of every table of an EXPLAIN FORMAT=JSON plan, and its flags, into tables and flags'''
+    if isinstance(node, list):
+        for item in node:
+            read_plan(item, min_rows, tables, flags)
+        return
+    if not isinstance(node, dict):
+        return
+    if "table_name" in node and "access_type" in node:
+        name, access, rows = node["table_name"], node["access_type"], node.get("rows_examined_per_scan", 0)
+        previous = tables.get(name)
+        if previous is None or ACCESS_RANK.index(access) > ACCESS_RANK.index(previous["access"]):
+            tables[name] = {"access": access, "key": node.get("key"), "rows": rows,
+                            "condition": node.get("attached_condition")}
+        if access in ('ALL', 'index') and rows >= min_rows: # scanning a small table is fine
+            flags.add(("full scan " if access == 'ALL' else "full index scan ") + name)
+    if node.get("using_filesort"):
+        flags.add("filesort")
+    if node.get("using_temporary_table"):
+        flags.add("temporary table")
+    for value in node.values():
+        read_plan(value, min_rows, tables, flags)
+
+
+def explain_probe(cursor, probe: Probe, min_rows: int, analyze: bool) -> dict:
+    '''the plan of one probe: tables with their access, flags (minus the allowed ones) and actual time'''
+    cursor.execute(probe.sample)
+    row = cursor.fetchone()
+    if row is None or None in row:
+        return {"sql": statement_key(probe.sql), "skipped": "no rows to take the values from"}
+    params = probe.params(row)
+    cursor.execute("EXPLAIN FORMAT=JSON " + probe.sql, params)
+    tables, flags = {}, set()
+    read_plan(json.loads(cursor.fetchone()[0]), min_rows, tables, flags)
+    result = {"sql": statement_key(probe.sql), "tables": tables,
+              "flags": sorted(flags - set(probe.allow)), "allowed": sorted(flags & set(probe.allow))}
+    # EXPLAIN ANALYZE runs the query, only SELECTs (a FOR UPDATE lock ends with the autocommit statement)
+    if analyze and probe.sql.lstrip().upper().startswith("SELECT"):
+        cursor.execute("EXPLAIN ANALYZE " + probe.sql, params)
+        text = cursor.fetchone()[0]
+        actual = ACTUAL.search(text)
+        result["analyze"] = text
+        result["actual_ms"] = float(actual.group(2)) if actual else None
+        result["actual_rows"] = float(actual.group(3)) if actual else None
+    return result
+
+
+def explain_workload(my_db, min_rows: int, analyze: bool) -> dict:
+    catalog = Catalog()
+    catalog.refresh(my_db)
+    results = {}
+    with my_db.connection() as conn:
+        cursor = conn.cursor()
+        for probe in workload(catalog, cursor):
+            try:
+                results[probe.name] = explain_probe(cursor, probe, min_rows, analyze)
+            except pymysql.Error as e: # e.g. a table or column the local schema doesn't have
+                results[probe.name] = {"sql": statement_key(probe.sql), "skipped": f"Error: {e.args[-1]}"}
+            print_probe(probe.name, results[probe.name])
+        cursor.close()
+    return results
+
+
+def print_probe(name: str, result: dict):
+    if "skipped" in result:
+        print(f"{name:<40} skipped: {result['skipped']}")
+        return
+    access = ", ".join(f"{table}:{info['access']}" + (f"({info['key']})" if info['key'] else "")
+                       for table, info in result["tables"].items())
+    time_ms = f"{result['actual_ms']:9.2f} ms" if result.get("actual_ms") is not None else " " * 12
+    print(f"{name:<40} {time_ms}  {access}" + (f"  <-- {', '.join(result['flags'])}" if result["flags"] else ""))
+
+
+def compare(results: dict, baseline: dict) -> list:
+    '''plan regressions against the baseline: a new flag, or a table read with a worse access type'''
+    regressions = []
+    for name, base in baseline["probes"].items():
+        now = results["probes"].get(name)
+        if now is None or "skipped" in now or "skipped" in base:
+            continue
+        for flag in sorted(set(now["flags"]) - set(base["flags"])):
+            regressions.append(f"{name}: {flag}")
+        for table, info in base["tables"].items():
+            current = now["tables"].get(table)
+            if current and ACCESS_RANK.index(current["access"]) > ACCESS_RANK.index(info["access"]):
+                regressions.append(f"{name}: {table} read by {current['access']}, was {info['access']}"
+                                   + (f" on {info['key']}" if info['key'] else ""))
+    for regression in regressions:
+        print("regression:", regression)
+    return regressions
+
+
+def propose(results: dict) -> list:
+    '''
+    candidate indexes for the flagged full scans: the columns the scanned table is compared on in the plan's
+    attached condition, equality comparisons first. they are only suggestions, check them against the queries
+    before adding them to MIGRATIONS
+    '''
+    statements = []
+    for name, result in results["probes"].items():
+        scanned = [flag.split()[-1] for flag in result.get("flags", []) if flag.startswith("full scan ")]
+        if not scanned:
+            continue
+        aliases = {alias or table: table for table, alias in TABLE_ALIAS.findall(result["sql"])}
+        for alias in scanned:
+            condition = result["tables"].get(alias, {}).get("condition") or ""
+            compared = re.findall(rf"`{alias}`\.`(\w+)`\s*(=|<=|>=|<|>|in\b|between\b|like\b)", condition,
+                                  re.IGNORECASE)
+            equal = [col for col, op in compared if op == "="]
+            ranged = [col for col, op in compared if op != "="]
+            cols = list(dict.fromkeys(equal + ranged[:1]))
+            if not cols:
+                continue
+            table = aliases.get(alias, alias)
+            statements.append(f"ALTER TABLE {table} ADD INDEX idx_{'_'.join(cols)} ({', '.join(cols)})  -- {name}")
+    next_version = max(version for version, _, _ in MIGRATIONS) + 1
+    for sql in dict.fromkeys(statements):
+        print(sql)
+    if statements:
+        print(f"add the ones worth keeping to MIGRATIONS from version {next_version}, then run migrate")
+    return statements
+
+
+def migrate(my_db, dry_run: bool = False) -> list:
+    '''apply the MIGRATIONS not recorded in schema_migrations yet, in version order. returns the versions applied'''
+    applied_now = []
+    with my_db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(MIGRATIONS_TABLE)
+        cursor.execute("SELECT version FROM schema_migrations")
+        applied = {row[0] for row in cursor.fetchall()}
+        for version, description, statements in sorted(MIGRATIONS):
+            if version in applied:
+                continue
+            print(f"{version:>4}  {description}")
+            if dry_run:
+                continue
+            for sql in statements:
+                try:
+                    cursor.execute(sql)
+                except pymysql.Error as e:
+                    if e.args[0] != DUP_KEYNAME: # the index was created by hand already
+                        raise
+                    print("      already there:", e.args[-1])
+            cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                           (version, description))
+            applied_now.append(version)
+        cursor.close()
+    if not applied_now and not dry_run:
+        print("the schema is up to date")
+    return applied_now
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the query plans of the hot query shapes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    explain = commands.add_parser("explain", help="explain every query shape and write the plans as JSON")
+    explain.add_argument("--out", default="plan_results.json")
+    explain.add_argument("--baseline", help="plans file to compare with, exits with 1 on a regression")
+    explain.add_argument("--min-rows", type=int, default=config.PLAN_SCAN_MIN_ROWS,
+                         help="full scans of tables estimated to have fewer rows are not flagged")
+    explain.add_argument("--no-analyze", action="store_true", help="don't run the SELECTs under EXPLAIN ANALYZE")
+    explain.add_argument("--secrets", default=".streamlit/secrets.toml", help="file with the DB_* credentials")
+    cmp = commands.add_parser("compare", help="compare a plans file with a baseline")
+    cmp.add_argument("results")
+    cmp.add_argument("baseline")
+    prop = commands.add_parser("propose", help="candidate indexes for the full scans flagged in a plans file")
+    prop.add_argument("results")
+    mig = commands.add_parser("migrate", help="apply the index migrations not applied yet")
+    mig.add_argument("--dry-run", action="store_true", help="only list the migrations that would be applied")
+    mig.add_argument("--secrets", default=".streamlit/secrets.toml", help="file with the DB_* credentials")
+    args = parser.parse_args()
+
+    if args.command in ("compare", "propose"):
+        with open(args.results) as f:
+            results = json.load(f)
+        if args.command == "propose":
+            propose(results)
+            return
+        with open(args.baseline) as f:
+            sys.exit(1 if compare(results, json.load(f)) else 0)
+
+    my_db = ConnectionPool(connect_args(toml.load(args.secrets)), min_size=1, max_size=1, ping_interval=3600)
+    if args.command == "migrate":
+        migrate(my_db, args.dry_run)
+        my_db.close()
+        return
+
+    results = {"meta": {"started": datetime.now().isoformat(timespec="seconds"), "min_rows": args.min_rows},
+               "probes": explain_workload(my_db, args.min_rows, not args.no_analyze)}
+    my_db.close()
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=2)
+    print("plans written to", args.out)
+    flagged = [name for name, result in results["probes"].items() if result.get("flags")]
+    if flagged:
+        print(f"{len(flagged)} query shapes flagged, see propose for candidate indexes")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            sys.exit(1 if compare(results, json.load(f)) else 0)
+
+
+if __name__ == '__main__':
+    main()
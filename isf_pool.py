@@ -0,0 +1,199 @@
+# This file contains a small thread-safe pool of pymysql connections shared by all streamlit sessions.
+# Every script thread borrows its own connection for the duration of a query instead of sharing one socket.
+
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+
+# client error codes meaning the socket is gone: server gone away, lost connection, out of sync, malformed packet
+LOST_CONNECTION_CODES = {(2006,), (2013,), (2014,), (2027,), (2055,)}
+
+
+def connect_args(secrets) -> dict:
+    '''pymysql.connect() arguments from the DB_* entries of .streamlit/secrets.toml (st.secrets or a loaded toml dict)'''
+    return dict(host = secrets["DB_HOST"],
+                port = int(secrets["DB_PORT"]),
+                user = secrets["DB_USER"],
+                password = secrets["DB_PASSWORD"],
+                database = secrets["DB_NAME"],
+                cursorclass = pymysql.cursors.Cursor,
+                autocommit = True)
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    '''raised when no connection could be checked out before the pool timeout'''
+
+
+class ConnectionPool:
+    '''
+    A bounded pool of pymysql connections with checkout/return semantics.
+
+    params:
+        connect_args: keyword arguments passed to pymysql.connect() for every new connection
+        min_size: number of connections opened up front and kept idle
+        max_size: upper bound of open connections (idle + checked out)
+        timeout: seconds to wait for a free connection before raising PoolTimeoutError
+        ping_interval: connections idle for longer than this are pinged (and replaced if dropped) before use
+    '''
+
+    def __init__(self, connect_args: dict, min_size=1, max_size=5, timeout=10, ping_interval=30):
+        if min_size > max_size:
+            raise ValueError("min_size cannot be larger than max_size")
+        self._connect_args = connect_args
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(connection, last_used_time), ...], most recently returned last
+        self._size = 0  # number of open connections, idle + checked out
+        self._closed = False
+
+        # counters for sizing the pool
+        self._stats = {"checkouts": 0, "waits": 0, "wait_time": 0.0, "max_wait_time": 0.0,
+                       "timeouts": 0, "reconnects": 0, "discarded": 0, "peak_in_use": 0}
+
+        for _ in range(min_size):
+            self._idle.append((self._open(), time.monotonic()))
+            self._size += 1
+
+    def _open(self) -> pymysql.connections.Connection:
+        return pymysql.connect(**self._connect_args)
+
+    def _is_alive(self, conn, last_used) -> bool:
+        '''
+        ping connections that sat idle for a while. a dropped connection is not reconnected by the ping,
+        checkout() replaces it so the reconnect is counted
+        '''
+        if not conn.open:
+            return False
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+        try:
+            conn.ping(reconnect=False)
+            return True
+        except pymysql.Error:
+            return False
+
+    def checkout(self) -> pymysql.connections.Connection:
+        '''borrow a connection, waiting up to `timeout` seconds if the pool is exhausted'''
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise pymysql.err.InterfaceError("connection pool is closed")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # reserve a slot, open the connection outside of the lock
+                    conn, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(2013, f"no free connection after {self.timeout}s "
+                                                 f"({self.max_size} checked out)")
+                waited = True
+                self._cond.wait(remaining)
+
+        try:
+            if conn is None:
+                conn = self._open()
+            elif not self._is_alive(conn, last_used):
+                self._close_quietly(conn)  # keep its slot for the replacement
+                with self._cond:
+                    self._stats["reconnects"] += 1
+                conn = self._open()
+        except pymysql.Error:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited_for = time.monotonic() - start
+        with self._cond:
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_time"] += waited_for
+            self._stats["max_wait_time"] = max(self._stats["max_wait_time"], waited_for)
+            in_use = self._size - len(self._idle)
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], in_use)
+        return conn
+
+    def checkin(self, conn: pymysql.connections.Connection, broken=False):
+        '''return a borrowed connection; broken or closed connections are dropped from the pool'''
+        if not broken and conn.open:
+            try:
+                if conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                    conn.rollback()  # never hand out a connection with an open transaction
+            except pymysql.Error:
+                broken = True
+        else:
+            broken = True
+
+        with self._cond:
+            if broken or self._closed:
+                self._size -= 1
+                self._stats["discarded"] += 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+            drop = broken or self._closed
+        if drop:
+            self._close_quietly(conn)
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except pymysql.Error:
+            pass
+
+    @contextmanager
+    def connection(self):
+        '''
+        borrow a connection for the duration of a with-block:
+
+            with pool.connection() as conn:
+                cursor = conn.cursor()
+        '''
+        conn = self.checkout()
+        broken = False
+        try:
+            yield conn
+        except pymysql.Error as e:
+            # lost connection / protocol errors, do not reuse the socket
+            broken = isinstance(e, pymysql.err.InterfaceError) or e.args[:1] in LOST_CONNECTION_CODES
+            raise
+        finally:
+            self.checkin(conn, broken=broken)
+
+    def stats(self) -> dict:
+        '''snapshot of pool occupancy and wait-time counters'''
+        with self._cond:
+            res = dict(self._stats)
+            res["size"] = self._size
+            res["idle"] = len(self._idle)
+            res["in_use"] = self._size - len(self._idle)
+            res["min_size"] = self.min_size
+            res["max_size"] = self.max_size
+        res["avg_wait_time"] = res["wait_time"] / res["checkouts"] if res["checkouts"] else 0.0
+        return res
+
+    def close(self):
+        '''close all idle connections; checked out connections are closed when returned'''
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
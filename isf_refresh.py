@@ -0,0 +1,93 @@
+# This file contains what a commit touched: the rows it saved, the tables its foreign key cascades may have changed,
+# and reading or merging rows by primary key.
+
+from dataclasses import dataclass, field
+
+from isf_commit import chunked
+from isf_frames import typed_frame, concat_frames
+from isf_sql import quote_ident, pk_in_condition
+
+# foreign key rules that change rows of the referencing table when the referenced row changes
+CASCADING_RULES = ('CASCADE', 'SET NULL', 'SET DEFAULT')
+
+
+@dataclass
+class TouchedRows:
+    '''
+    what a commit changed on one table.
+
+    saved: number of rows whose change was saved
+    changed_cols: columns whose values changed, to find foreign keys that cascade the change
+    deleted: whether rows were deleted, to find foreign keys that cascade deletes
+    conflicts: {pk tuple, ...} rows not saved because someone else changed or deleted them since they were loaded
+    '''
+    saved: int = 0
+    changed_cols: set = field(default_factory=set)
+    deleted: bool = False
+    conflicts: set = field(default_factory=set)
+
+    def merge(self, other):
+        self.saved += other.saved
+        self.changed_cols |= other.changed_cols
+        self.deleted = self.deleted or other.deleted
+        self.conflicts |= other.conflicts
+        return self
+
+    @property
+    def empty(self) -> bool:
+        return not self.saved
+
+
+def cascaded_tables(catalog, table_name: str, touched: TouchedRows) -> set:
+    '''
+    tables whose rows may have been changed by ON UPDATE / ON DELETE cascades of a commit,
+    following chains of cascades (e.g. category -> product -> order_item)
+    '''
+    affected = set()
+    pending = [(table_name, set(touched.changed_cols), touched.deleted)]
+    while pending:
+        parent, changed_cols, deleted = pending.pop()
+        for fk in catalog.referenced_by(parent):
+            update_cascades = fk.on_update in CASCADING_RULES and changed_cols & set(fk.referenced_columns)
+            delete_cascades = fk.on_delete in CASCADING_RULES and deleted
+            if not (update_cascades or delete_cascades) or fk.table in affected:
+                continue
+            affected.add(fk.table)
+            # follow the children of the child: its referencing columns changed (cascaded update or SET NULL),
+            # or its rows were deleted (ON DELETE CASCADE)
+            child_deleted = delete_cascades and fk.on_delete == 'CASCADE'
+            child_changed = set(fk.columns) if update_cascades or (delete_cascades and not child_deleted) else set()
+            pending.append((fk.table, child_changed, child_deleted))
+    return affected
+
+
+def fetch_rows(conn, table_name: str, columns: list, pk_cols: tuple, pks: list, chunk_size: int = 500, 
+               dtypes: dict = None):
+    '''read the current rows for a list of primary keys, in chunks of WHERE pk IN (...), as a typed dataframe'''
+    rows = []
+    cursor = conn.cursor()
+    for chunk in chunked(list(pks), chunk_size):
+        params = [val for pk_vals in chunk for val in pk_vals]
+        cursor.execute(f"SELECT * FROM {quote_ident(table_name)} WHERE {pk_in_condition(pk_cols, len(chunk))}", params)
+        rows.extend(cursor.fetchall())
+    cursor.close()
+    return typed_frame(rows, columns, dtypes)
+
+
+def merge_rows(df, pk_cols: tuple, fresh, removed: set):
+    '''
+    return a new dataframe: df without the removed rows and the rows being replaced, plus the fresh rows,
+    ordered by primary key like a full SELECT * on the clustered index would return them.
+    the shared df itself is never modified, other sessions may still hold a reference to it.
+    '''
+    pk_cols = list(pk_cols)
+    keys = set(removed) | {tuple(_plain(val) for val in key) for key in fresh[pk_cols].itertuples(index=False, name=None)}
+    current = df[pk_cols].itertuples(index=False, name=None)
+    keep = [tuple(_plain(val) for val in key) not in keys for key in current]
+    merged = concat_frames([df[keep].reset_index(drop=True), fresh], list(df.columns))
+    return merged.sort_values(pk_cols, kind="stable").reset_index(drop=True)
+
+
+def _plain(val):
+    '''numpy scalar -> python value, so keys from a dataframe compare equal to keys from edits'''
+    return val.item() if hasattr(val, "item") else val
@@ -0,0 +1,42 @@
+# This file contains the maintenance of the sales rollups read by the analytics page (database/rollup_procedures.sql):
+# rebuilding them, and checking that they return the same results as the procedures aggregating the order tables.
+
+from decimal import Decimal
+
+
+def rebuild_rollups(conn, procedure: str):
+    '''recompute the rollups from the order tables, in one transaction inside the procedure'''
+    cursor = conn.cursor()
+    cursor.callproc(procedure)
+    cursor.close()
+
+
+def _plain_rows(rows) -> list:
+    '''rows as sorted tuples with DECIMAL sums as ints, ties in ORDER BY num DESC come back in any order'''
+    return sorted(tuple(int(val) if isinstance(val, Decimal) else val for val in row) for row in rows)
+
+
+def compare_rollups(conn, analytics: dict, source: dict) -> list:
+    '''
+    run every rollup procedure next to its source procedure (the sales one for each year with orders)
+    and return a description of each result that differs, an empty list when they all match
+    '''
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT YEAR(order_date) FROM order_invoice WHERE order_date IS NOT NULL")
+    years = sorted(row[0] for row in cursor.fetchall())
+    checks = [("Number of Orders per Customer", ())]
+    checks += [("Best Selling Products by Year", (year,)) for year in years]
+
+    mismatches = []
+    for title, args in checks:
+        results = []
+        for procedure in (analytics[title], source[title]):
+            cursor.callproc(procedure, args)
+            results.append(_plain_rows(cursor.fetchall()))
+        rollup, expected = results
+        if rollup != expected:
+            missing = [row for row in expected if row not in rollup]
+            extra = [row for row in rollup if row not in expected]
+            mismatches.append(f"{title} {args or ''}: missing {missing}, unexpected {extra}")
+    cursor.close()
+    return mismatches
@@ -0,0 +1,98 @@
+# This file contains helpers for building parameterized SQL statements from catalog metadata.
+# Table and column names can't be bound as parameters, so they must come from the catalog and are quoted here.
+
+
+def quote_ident(name: str) -> str:
+    '''quote a table or column name as a MySQL identifier'''
+    return "`" + str(name).replace("`", "``") + "`"
+
+
+def pk_condition(pk_cols) -> str:
+    '''WHERE condition matching one row by its (possibly composite) primary key, one %s per pk column'''
+    return " AND ".join(f"{quote_ident(col)} = %s" for col in pk_cols)
+
+
+def describe_pk(pk_cols, pk_vals) -> str:
+    '''human readable primary key of a row for messages, e.g. "vendor_id = 1, pid = 5"'''
+    return ", ".join(f"{col} = {val}" for col, val in zip(pk_cols, pk_vals))
+
+
+def update_statement(table_name: str, cols, pk_cols, version_col: str = None) -> str:
+    '''
+    UPDATE setting several columns of one row, params: new values in cols order, then the pk values.
+    with a version_col the row is only updated if its version is still the one given after the pk values,
+    and the version is bumped, so a row changed by someone else in the meantime matches nothing
+    '''
+    assignments = ", ".join(f"{quote_ident(col)} = %s" for col in cols)
+    if version_col is None:
+        return f"UPDATE {quote_ident(table_name)} SET {assignments} WHERE {pk_condition(pk_cols)}"
+    version = quote_ident(version_col)
+    return (f"UPDATE {quote_ident(table_name)} SET {assignments}, {version} = {version} + 1 "
+            f"WHERE {pk_condition(pk_cols)} AND {version} = %s")
+
+
+def case_update_statement(table_name: str, cols, pk_cols, n_rows: int, version_col: str = None) -> str:
+    '''
+    UPDATE of n_rows rows in one statement, each column set to CASE pk WHEN <row pk> THEN <new value> ... END
+    and the rows matched by WHERE pk IN (...). params: for each column, the pk values and the new value of every row;
+    then the pk values of every row, each followed by its version with a version_col (bumped like update_statement).
+    cols must not contain pk columns: the assignments run left to right, later CASEs would see the new pk
+    '''
+    if len(pk_cols) == 1:
+        whens = " ".join(["WHEN %s THEN %s"] * n_rows)
+        case = f"CASE {quote_ident(pk_cols[0])} {whens}"
+    else:
+        case = "CASE " + " ".join([f"WHEN {pk_condition(pk_cols)} THEN %s"] * n_rows)
+    assignments = ", ".join(f"{quote_ident(col)} = {case} ELSE {quote_ident(col)} END" for col in cols)
+    key_cols = list(pk_cols)
+    if version_col is not None:
+        version = quote_ident(version_col)
+        assignments += f", {version} = {version} + 1"
+        key_cols.append(version_col)
+    return f"UPDATE {quote_ident(table_name)} SET {assignments} WHERE {pk_in_condition(key_cols, n_rows)}"
+
+
+def insert_statement(table_name: str, cols, n_rows: int = 1) -> str:
+    '''multi-row INSERT ... VALUES (...), (...) for n_rows rows, params: the values of each row in cols order'''
+    row = "(" + ", ".join(["%s"] * len(cols)) + ")"
+    col_list = ", ".join(quote_ident(col) for col in cols)
+    return f"INSERT INTO {quote_ident(table_name)} ({col_list}) VALUES " + ", ".join([row] * n_rows)
+
+
+def upsert_statement(table_name: str, cols, update_cols, n_rows: int = 1, version_col: str = None) -> str:
+    '''
+    multi-row INSERT ... ON DUPLICATE KEY UPDATE: rows whose primary or unique key already exists get
+    update_cols overwritten with the new values instead (and their version_col bumped, if given).
+    params: the values of each row in cols order
+    '''
+    # with nothing to update (only key columns given), rows that exist are left as they are
+    assignments = ", ".join(f"{quote_ident(col)} = new.{quote_ident(col)}" for col in update_cols or cols[:1])
+    if version_col is not None and update_cols:
+        assignments += f", {quote_ident(version_col)} = {quote_ident(version_col)} + 1"
+    return f"{insert_statement(table_name, cols, n_rows)} AS new ON DUPLICATE KEY UPDATE {assignments}"
+
+
+def delete_statement(table_name: str, pk_cols, n_rows: int = 1, version_col: str = None) -> str:
+    '''
+    DELETE of n_rows rows by primary key: WHERE pk IN (...), or WHERE (pk1, pk2) IN ((...), ...) for composite keys.
+    params: the pk values of each row, flattened. with a version_col each row's version follows its pk values,
+    and a row is only deleted if it still has that version
+    '''
+    key_cols = list(pk_cols) + [version_col] if version_col is not None else pk_cols
+    if n_rows == 1:
+        return f"DELETE FROM {quote_ident(table_name)} WHERE {pk_condition(key_cols)}"
+    return f"DELETE FROM {quote_ident(table_name)} WHERE {pk_in_condition(key_cols, n_rows)}"
+
+
+def pk_in_condition(pk_cols, n_rows: int) -> str:
+    '''condition matching n_rows rows by primary key, params: the pk values of each row, flattened'''
+    if len(pk_cols) == 1:
+        return f"{quote_ident(pk_cols[0])} IN (" + ", ".join(["%s"] * n_rows) + ")"
+    row = "(" + ", ".join(["%s"] * len(pk_cols)) + ")"
+    col_list = ", ".join(quote_ident(col) for col in pk_cols)
+    return f"({col_list}) IN (" + ", ".join([row] * n_rows) + ")"
+
+
+def call_statement(procedure_name: str, n_params: int) -> str:
+    '''CALL of a stored procedure with n_params parameters, usable with cursor.execute()'''
+    return f"CALL {quote_ident(procedure_name)}(" + ", ".join(["%s"] * n_params) + ")"
@@ -0,0 +1,191 @@
+# This file contains the bulk file transfer of admin tables: importing an uploaded CSV/Parquet file chunk by chunk
+# (checked against the column types and foreign keys in the schema catalog, upserted in batches) and exporting
+# a table to CSV/Parquet straight from a server-side cursor.
+
+from dataclasses import dataclass, field
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import isf_commit as committer
+from isf_frames import DATETIME, DECIMAL_TYPES, column_dtypes, iter_frames
+from isf_sql import quote_ident, upsert_statement
+from isf_validate import required_columns, coerce_column, check_foreign_keys
+
+CSV = "csv"
+PARQUET = "parquet"
+FORMATS = (CSV, PARQUET)
+
+# arrow type of each column dtype of an export, see export_dtypes()
+ARROW_TYPES = {"Int64": pa.int64(), "UInt64": pa.uint64(), "Float64": pa.float64(), DATETIME: pa.timestamp("ns"),
+               "string": pa.string()}
+
+
+def file_format(file_name: str) -> str:
+    '''csv or parquet from a file name'''
+    fmt = file_name.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"{file_name}: only .csv and .parquet files can be imported")
+    return fmt
+
+
+@dataclass
+class ImportReport:
+    '''
+    progress and outcome of a file import.
+    rejects: [(row number in the file starting at 1, reason), ...], at most max_rejects of them are kept
+    '''
+    rows_read: int = 0
+    rows_saved: int = 0
+    n_rejects: int = 0
+    rejects: list = field(default_factory=list)
+    ignored_cols: list = field(default_factory=list)
+    max_rejects: int = 1000
+
+    def reject(self, row: int, reason: str):
+        self.n_rejects += 1
+        if len(self.rejects) < self.max_rejects:
+            self.rejects.append((row, reason))
+
+
+def read_chunks(file, fmt: str, chunk_size: int):
+    '''yield the rows of a CSV (every value as text, empty as NULL) or Parquet file as dataframes of chunk_size rows'''
+    if fmt == PARQUET:
+        for batch in pq.ParquetFile(file).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(file, chunksize=chunk_size, dtype=str, keep_default_na=False, na_values=[""])
+
+
+def file_rows(file, fmt: str):
+    '''number of rows of a Parquet file from its footer, None for CSV (unknown until it is read)'''
+    if fmt != PARQUET:
+        return None
+    n_rows = pq.ParquetFile(file).metadata.num_rows
+    file.seek(0)
+    return n_rows
+
+
+def import_file(my_db, table, file, fmt: str, allowed_cols: list, chunk_size: int, batch_size: int,
+                on_progress=None, max_rejects: int = 1000, version_col: str = None) -> ImportReport:
+    '''
+    upsert the rows of a CSV/Parquet file into a table, one file chunk of chunk_size rows per transaction:
+    values are checked against the catalog types and foreign keys, rows that pass are sent as multi-row
+    INSERT ... ON DUPLICATE KEY UPDATE of batch_size rows (existing primary/unique keys are updated),
+    and a batch the database rejects is retried row by row so each failing row is reported.
+    file columns outside allowed_cols (e.g. view-only columns) are ignored.
+    params:
+        on_progress: called with the report after every chunk
+        version_col: row version column bumped on the rows that are updated, so open editors see the change
+    raises ValueError when the file lacks a required column or has no column of the table
+    '''
+    report = ImportReport(max_rejects=max_rejects)
+    key_cols = set(table.primary_key)
+    for cols in table.unique_keys.values():
+        key_cols |= set(cols)
+
+    for chunk in read_chunks(file, fmt, chunk_size):
+        first_row = report.rows_read + 1
+        report.rows_read += len(chunk)
+        chunk = chunk.reset_index(drop=True)
+        if first_row == 1:
+            report.ignored_cols = [col for col in chunk.columns if col not in allowed_cols]
+            missing = [col for col in required_columns(table) if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"the file has no column {', '.join(missing)}, required by {table.name}")
+        cols = [col for col in table.column_names if col in chunk.columns and col in allowed_cols]
+        if not cols:
+            raise ValueError(f"the file has none of the columns of {table.name}")
+
+        # type checks, column by column over the whole chunk
+        values = {}
+        ok = pd.Series(True, index=chunk.index)
+        reasons = {}
+        required = required_columns(table)
+        for col in cols:
+            values[col], bad, reason = coerce_column(chunk[col], table.column(col))
+            for i in bad[bad & ok].index:
+                reasons[i] = f"{col} {reason}: {chunk.at[i, col]!r}"
+            ok &= ~bad
+            if col in required:
+                empty = values[col].isna() & ok
+                for i in empty[empty].index:
+                    reasons[i] = f"{col} is required"
+                ok &= ~empty
+        chunk = pd.DataFrame(values)
+
+        with my_db.connection() as conn:
+            cursor = conn.cursor()
+            reasons.update(check_foreign_keys(cursor, table, chunk, ok, batch_size))
+            cursor.close()
+            for i, reason in sorted(reasons.items()):
+                report.reject(first_row + i, reason)
+
+            # rows filling in the same columns share one statement, missing columns keep their default/current value
+            groups = {}  # (col, ...): [(values, row number), ...]
+            for i, row in zip(chunk.index, chunk.itertuples(index=False, name=None)):
+                if i in reasons:
+                    continue
+                filled = tuple(col for col, val in zip(cols, row) if val is not None)
+                groups.setdefault(filled, []).append((tuple(val for val in row if val is not None), first_row + i))
+            batches = []
+            for filled, rows in groups.items():
+                update_cols = [col for col in filled if col not in key_cols]
+                single_sql = upsert_statement(table.name, filled, update_cols, version_col=version_col)
+                for part in committer.chunked(rows, batch_size):
+                    batches.append(committer.Batch(upsert_statement(table.name, filled, update_cols, len(part),
+                                                                    version_col),
+                                                   [val for row, _ in part for val in row],
+                                                   [(single_sql, row, row_number) for row, row_number in part]))
+            failed, errors, _ = committer.run_batches(conn, batches, committer.SAVEPOINT)
+        for row_number, error in zip(failed, errors):
+            report.reject(row_number, error)
+        report.rows_saved += sum(sum(batch.row_ok) for batch in batches)
+        if on_progress:
+            on_progress(report)
+    return report
+
+
+def export_dtypes(table) -> dict:
+    '''
+    the catalog dtypes with categoricals and untyped columns as text, so every chunk has the same file schema.
+    DECIMAL columns stay python Decimals, written as Parquet decimals (see export_schema())
+    '''
+    dtypes = column_dtypes(table)
+    return {col.name: None if col.data_type in DECIMAL_TYPES else
+            "string" if col.name not in dtypes or isinstance(dtypes[col.name], pd.CategoricalDtype)
+            or dtypes[col.name] == "category" else dtypes[col.name] for col in table.columns}
+
+
+def export_schema(table, dtypes: dict) -> pa.Schema:
+    '''the Parquet schema of an export: the arrow type of each export dtype, DECIMAL(p, s) as decimal128(p, s)'''
+    return pa.schema([(col.name, pa.decimal128(col.precision, col.scale) if col.data_type in DECIMAL_TYPES
+                       else ARROW_TYPES[dtypes[col.name]]) for col in table.columns])
+
+
+def export_table(conn, table, fmt: str, out, chunk_size: int) -> int:
+    '''
+    write every row of a catalog table to a binary file object as CSV or Parquet, one chunk of chunk_size rows
+    at a time from a server-side cursor (a Parquet row group per chunk), never holding the whole table in memory.
+    returns: number of rows written
+    '''
+    columns = table.column_names
+    dtypes = export_dtypes(table)
+    schema = export_schema(table, dtypes) if fmt == PARQUET else None
+    n_rows = 0
+    writer = pq.ParquetWriter(out, schema) if fmt == PARQUET else None
+    sql = f"SELECT {', '.join(quote_ident(col) for col in columns)} FROM {quote_ident(table.name)}"
+    try:
+        for df in iter_frames(conn, sql, (), columns, dtypes, chunk_size):
+            if fmt == PARQUET:
+                writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+            else:
+                out.write(df.to_csv(index=False, header=n_rows == 0).encode())
+            n_rows += len(df)
+        if fmt == CSV and n_rows == 0: # empty table, still a file with the column names
+            out.write(pd.DataFrame(columns=columns).to_csv(index=False).encode())
+    finally:
+        if writer is not None:
+            writer.close() # an empty table is still a valid file with the columns
+    return n_rows
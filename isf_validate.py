@@ -0,0 +1,244 @@
+# This file contains the checks of rows before they are sent to the database, each run over a whole column at once:
+# values against the column types, lengths, enums and nullability in the schema catalog, keys unique among the rows,
+# and foreign keys found in the referenced tables. Used by the file import and by the commit of data_editor edits.
+
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+import numpy as np
+import pandas as pd
+
+import isf_commit as committer
+from isf_frames import INT_TYPES, FLOAT_TYPES, DECIMAL_TYPES, DATE_TYPES, TEXT_TYPES
+from isf_sql import quote_ident, describe_pk, pk_in_condition
+
+
+def required_columns(table) -> list:
+    '''columns an inserted row must give: NOT NULL without a default, and not generated by auto increment'''
+    return [col.name for col in table.columns if not col.nullable and col.default is None and not col.auto_increment]
+
+
+def coerce_column(values: pd.Series, col):
+    '''
+    one column of rows (a file chunk, data_editor edits) as plain python values for the driver (None for NULL),
+    checked against the column's type in the catalog. returns: (values, mask of the rows whose value doesn't fit, reason)
+    '''
+    null = values.isna() | (values.astype(str) == "") if values.dtype == object else values.isna()
+    if col.data_type in INT_TYPES:
+        # python ints in an object column: a series of ints with a None would turn them into floats
+        out = pd.Series([None if pd.isna(val) else whole_number(val) for val in values], index=values.index,
+                        dtype=object)
+        bad, reason = ~null & out.isna(), "is not a whole number"
+    elif col.data_type in DECIMAL_TYPES:
+        out = pd.Series([None if pd.isna(val) else exact_number(val) for val in values], index=values.index,
+                        dtype=object)
+        bad, reason = ~null & out.isna(), "is not a number"
+    elif col.data_type in FLOAT_TYPES:
+        typed = pd.to_numeric(values, errors="coerce")
+        bad = ~null & typed.isna()
+        out, reason = typed.map(lambda val: None if pd.isna(val) else float(val)), "is not a number"
+    elif col.data_type in DATE_TYPES:
+        typed = pd.to_datetime(values, errors="coerce")
+        bad = ~null & typed.isna()
+        convert = (lambda val: val.date()) if col.data_type == 'date' else (lambda val: val.to_pydatetime())
+        out, reason = typed.map(lambda val: None if pd.isna(val) else convert(val)), "is not a date"
+    elif col.data_type == 'enum':
+        out = values.map(lambda val: None if pd.isna(val) or val == "" else str(val))
+        bad = ~null & ~out.isin(col.enum_values)
+        reason = "must be one of " + ", ".join(col.enum_values)
+    else:
+        out = values.map(lambda val: None if pd.isna(val) else str(val))
+        limit = col.max_length if col.data_type in TEXT_TYPES else None
+        bad = out.map(lambda val: limit is not None and val is not None and len(val) > limit)
+        reason = f"is longer than {limit} characters"
+    return out, bad.astype(bool) & ~null, reason
+
+
+def whole_number(val):
+    '''
+    an int from a number or its text, None if it isn't a whole number.
+    text is parsed exactly, never through float, so BIGINT values keep every digit
+    '''
+    if isinstance(val, (int, np.integer)):
+        return int(val)
+    if isinstance(val, (float, np.floating)):
+        return int(val) if float(val).is_integer() else None
+    try:
+        number = Decimal(str(val).strip())
+    except InvalidOperation:
+        return None
+    return int(number) if number.is_finite() and number == number.to_integral_value() else None
+
+
+def exact_number(val):
+    '''a Decimal from a number or its text (for DECIMAL columns, never through float), None if it isn't a number'''
+    if isinstance(val, Decimal):
+        return val if val.is_finite() else None
+    try:
+        number = Decimal(str(val).strip())
+    except InvalidOperation:
+        return None
+    return number if number.is_finite() else None
+
+
+def fold_key(key: tuple) -> tuple:
+    '''a key as the case-insensitive collation of the schema compares it'''
+    return tuple(val.casefold() if isinstance(val, str) else val for val in key)
+
+
+def check_foreign_keys(cursor, table, chunk: pd.DataFrame, ok: pd.Series, chunk_size: int, key_sets: dict = None,
+                       changed: pd.DataFrame = None) -> dict:
+    '''
+    {row index: reason} for the rows of a chunk referencing a key that doesn't exist,
+    looking up only the distinct values used in the chunk (in chunks of chunk_size keys)
+    params:
+        key_sets: {(referenced table, (referenced col, ...)): set of folded keys} keys known to exist (e.g. the
+                  cached dropdown options), only the keys not in them are looked up
+        changed: mask of the values given by each row, only the rows giving a foreign key column are checked
+    '''
+    missing = {}
+    for fk in table.foreign_keys:
+        if not set(fk.columns) <= set(chunk.columns):
+            continue
+        rows = ok if changed is None else ok & changed[list(fk.columns)].any(axis=1)
+        keys = chunk.loc[rows, list(fk.columns)].dropna()
+        known = (key_sets or {}).get((fk.referenced_table, tuple(fk.referenced_columns)), set())
+        wanted = sorted({key for key in keys.itertuples(index=False, name=None) if fold_key(key) not in known}, key=str)
+        found = set(known)
+        for part in committer.chunked(wanted, chunk_size):
+            cursor.execute(f"SELECT {', '.join(quote_ident(col) for col in fk.referenced_columns)} "
+                           f"FROM {quote_ident(fk.referenced_table)} "
+                           f"WHERE {pk_in_condition(fk.referenced_columns, len(part))}",
+                           [val for key in part for val in key])
+            found.update(fold_key(key) for key in cursor.fetchall())
+        for i, key in zip(keys.index, keys.itertuples(index=False, name=None)):
+            if fold_key(key) not in found:
+                missing.setdefault(i, f"{', '.join(fk.columns)} {', '.join(map(str, key))} "
+                                      f"not found in {fk.referenced_table}")
+    return missing
+
+
+def check_unique(table, frame: pd.DataFrame, changed: pd.DataFrame, ok: pd.Series, others: pd.DataFrame) -> dict:
+    '''
+    {row index: reason} for the rows giving a primary/unique key that another row of the frame gives too,
+    or that one of the other rows (e.g. the unchanged rows loaded in the editor) already has
+    '''
+    duplicates = {}
+    for cols in [table.primary_key, *table.unique_keys.values()]:
+        cols = list(cols)
+        if not cols or not set(cols) <= set(frame.columns):
+            continue
+        keyed = frame[cols].notna().all(axis=1)
+        rows = ok & keyed & changed[cols].any(axis=1)
+        if not rows.any():
+            continue
+        taken = {fold_key(key) for key in others[cols].dropna().itertuples(index=False, name=None)}
+        taken.update(fold_key(key) for key in frame.loc[keyed & ~rows, cols].itertuples(index=False, name=None))
+        keys = pd.Series([fold_key(key) for key in frame.loc[rows, cols].itertuples(index=False, name=None)],
+                         index=frame.index[rows], dtype=object)
+        clash = keys.duplicated(keep=False) | keys.map(lambda key: key in taken).astype(bool)
+        for i in clash[clash].index:
+            duplicates.setdefault(i, f"{', '.join(cols)} {', '.join(map(str, frame.loc[i, cols]))} "
+                                     f"is already used by another row")
+    return duplicates
+
+
+@dataclass
+class PendingEdits:
+    '''
+    the edits of a data_editor that are worth sending to the database.
+    edited: {row position: {col: new value, ...}} only the values that change the row, as plain python values
+    added: [{col: value, ...}, ...] the added rows, with the values they fill in
+    rejected: [(row description, reason), ...] rows left out because a check failed
+    noops: number of edited values dropped because the row already had them
+    '''
+    edited: dict = field(default_factory=dict)
+    added: list = field(default_factory=list)
+    rejected: list = field(default_factory=list)
+    noops: int = 0
+
+
+def as_objects(values: pd.Series) -> pd.Series:
+    '''a column of a typed dataframe as python objects, None for missing values'''
+    return values.astype(object).where(values.notna(), None)
+
+
+def validate_edits(table, df: pd.DataFrame, edited_rows: dict, added_rows: list, cursor=None, key_sets: dict = None,
+                   chunk_size: int = 500) -> PendingEdits:
+    '''
+    check the pending edits of a data_editor over df all at once, before anything is sent to the database.
+    the edited rows (with their new values) and the added rows form one dataframe checked column by column against
+    the catalog (type, length, enum, NOT NULL), then for primary/unique keys used twice among them or by the other
+    rows of df, then for foreign keys not found in the referenced tables (key_sets, then one query per chunk_size
+    distinct keys missing from them, with cursor). an edit setting the value a row already has is dropped.
+    params:
+        edited_rows: {row position in df: {col: new value, ...}} as the data_editor reports them
+        added_rows: [{col: value, ...}, ...] as the data_editor reports them
+        key_sets: see check_foreign_keys()
+    '''
+    pending = PendingEdits()
+    if not edited_rows and not added_rows:
+        return pending
+    cols = [col for col in table.column_names if col in df.columns]
+    positions = [int(row_i) for row_i in edited_rows]
+    edits = list(edited_rows.values())
+    current = df.iloc[positions][cols].reset_index(drop=True)
+    added = pd.DataFrame(list(added_rows), columns=cols)
+    n_edited = len(edits)
+    required = required_columns(table)
+
+    frame, changed, reasons = {}, {}, {}
+    ok = pd.Series(True, index=range(n_edited + len(added)))
+    for col in cols:
+        column = table.column(col)
+        edited_raw = pd.Series([edit.get(col) for edit in edits], dtype=object)
+        raw = pd.concat([edited_raw, added[col].astype(object)], ignore_index=True)
+        old, _, _ = coerce_column(as_objects(current[col]), column)
+        new, bad, reason = coerce_column(edited_raw, column)
+        values, add_bad, _ = coerce_column(added[col], column)
+        is_set = pd.Series([col in edit for edit in edits], dtype=bool)
+        noop = is_set & ~bad & ((new.isna() & old.isna()) | (new == old))
+        pending.noops += int(noop.sum())
+        set_edit = is_set & ~noop
+
+        # the row as it would be after the commit: new values where edited, current values elsewhere
+        frame[col] = pd.concat([new.where(set_edit, old), values], ignore_index=True)
+        changed[col] = pd.concat([set_edit, values.notna()], ignore_index=True)
+        bad = pd.concat([bad & set_edit, add_bad], ignore_index=True)
+        for i in bad[bad & ok].index:
+            reasons[i] = f"{col} {reason}: {raw[i]!r}"
+        ok &= ~bad
+        empty = pd.concat([set_edit & new.isna() & (not column.nullable), values.isna() & (col in required)],
+                          ignore_index=True) & ok
+        for i in empty[empty].index:
+            reasons[i] = f"{col} is required"
+        ok &= ~empty
+    frame, changed = pd.DataFrame(frame), pd.DataFrame(changed)
+
+    # keys are compared with the rows of df the edits don't touch, as the database will hold them
+    untouched = ~pd.Series(range(len(df))).isin(positions)
+    key_cols = [col for col in cols if col in set(table.primary_key).union(*table.unique_keys.values())]
+    others = pd.DataFrame({col: coerce_column(as_objects(df[col][untouched.values]), table.column(col))[0]
+                           for col in key_cols})
+    for i, reason in check_unique(table, frame, changed, ok, others).items():
+        reasons.setdefault(i, reason)
+    ok &= ~ok.index.isin(list(reasons))
+    for i, reason in check_foreign_keys(cursor, table, frame, ok, chunk_size, key_sets, changed).items():
+        reasons.setdefault(i, reason)
+
+    pk_cols = [col for col in table.primary_key if col in cols]
+    row_keys = list(edited_rows)
+    rows = zip(frame.itertuples(index=False, name=None), changed.itertuples(index=False, name=None))
+    for i, (row, given_cols) in enumerate(rows):
+        given = {col: val for col, val, is_given in zip(cols, row, given_cols) if is_given}
+        if i < n_edited:
+            label = f"the row where {describe_pk(pk_cols, tuple(current.at[i, col] for col in pk_cols))}"
+        else:
+            label = f"added row {i - n_edited + 1}"
+        if i in reasons:
+            pending.rejected.append((label, reasons[i]))
+        elif i < n_edited and given:
+            pending.edited[row_keys[i]] = given
+        elif i >= n_edited:
+            pending.added.append(given)
+    return pending
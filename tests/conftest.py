@@ -0,0 +1,29 @@
+# the isf_* modules live at the top of the repo, not in a package
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def db_args():
+    '''
+    pymysql.connect() arguments of the local test database, from the secrets file in ISF_TEST_SECRETS
+    (default .streamlit/secrets.toml). tests using it are skipped when there is no database to connect to.
+    '''
+    import pymysql
+    from isf_pool import connect_args
+
+    path = os.environ.get("ISF_TEST_SECRETS", os.path.join(ROOT, ".streamlit", "secrets.toml"))
+    if not os.path.exists(path):
+        pytest.skip(f"no database secrets at {path}")
+    toml = pytest.importorskip("toml") # tomllib is only in python 3.11+, the app reads its secrets with toml too
+    args = connect_args(toml.load(path))
+    try:
+        pymysql.connect(**args).close()
+    except pymysql.Error as e:
+        pytest.skip(f"no database to connect to: {e.args}")
+    return args
@@ -0,0 +1,7 @@
+from isf_analytics import ORDERS_TOKEN_QUERY, orders_token_query
+
+
+def test_orders_token_query_reads_the_edited_tables():
+    assert orders_token_query('updated_at', []) == ORDERS_TOKEN_QUERY.rstrip()
+    sql = orders_token_query('updated_at', ['product', 'order_item'])
+    assert sql.endswith(", (SELECT MAX(`updated_at`) FROM `product`), (SELECT MAX(`updated_at`) FROM `order_item`)")
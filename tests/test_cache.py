@@ -0,0 +1,102 @@
+import contextlib
+from datetime import datetime
+
+import pandas as pd
+
+import isf_cache
+from isf_cache import TableCache, TableWatch, frame_bytes
+
+
+class Clock:
+    '''stands in for time.monotonic() in isf_cache'''
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def frame(n_rows):
+    return pd.DataFrame({"pid": range(n_rows)})
+
+
+def test_table_cache_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(isf_cache.time, "monotonic", clock)
+    cache, loads = TableCache(max_bytes=10**6, default_ttl=60, ttls={"coupon": None}), []
+    load = lambda key: lambda: loads.append(key) or frame(3)
+    cache.get("product", load("product"))
+    cache.get("coupon", load("coupon"))
+    clock.now += 30
+    cache.get("product", load("product"))
+    assert loads == ["product", "coupon"]
+
+    clock.now += 31 # product is past its TTL, coupon never expires
+    assert cache.peek("product") is None and cache.peek("coupon") is not None
+    cache.get("product", load("product"))
+    assert loads == ["product", "coupon", "product"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expired"]) == (1, 3, 1)
+
+
+def test_table_cache_evicts_least_recently_used():
+    size = frame_bytes(frame(100))
+    cache = TableCache(max_bytes=2 * size)
+    cache.put("product", frame(100))
+    cache.put("coupon", frame(100))
+    cache.get("product", lambda: frame(100)) # a hit, product is now the most recently used
+    cache.put("vendor", frame(100))
+    assert cache.peek("coupon") is None and cache.peek("product") is not None and cache.peek("vendor") is not None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 2 * size
+
+    cache.put("customer", frame(1000)) # over the cap on its own, still kept as the only entry
+    assert cache.stats()["entries"] == 1 and cache.peek("customer") is not None
+
+
+def test_table_cache_invalidate_drops_every_entry_of_a_table():
+    cache = TableCache(max_bytes=10**6)
+    cache.put("product", frame(3))
+    cache.put(("product", "page", 1), frame(3))
+    cache.put("coupon", frame(3))
+    cache.invalidate("product")
+    assert cache.peek("product") is None and cache.peek(("product", "page", 1)) is None
+    assert cache.peek("coupon") is not None
+    assert cache.stats()["invalidations"] == 2 and cache.stats()["bytes"] == frame_bytes(frame(3))
+
+
+class FakeDb:
+    '''answers the probes of TableWatch: UPDATE_TIME per table, then COUNT(*) and MAX(updated_at) per table'''
+    def __init__(self):
+        self.update_times = {"product": None, "coupon": datetime(2024, 1, 1, 12)}
+        self.fingerprints = {"product": (3, datetime(2024, 1, 1, 9))}
+        self.queries = []
+
+    def connection(self):
+        return contextlib.nullcontext(self)
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=()):
+        self.queries.append(sql)
+        self.params = list(params)
+
+    def fetchall(self):
+        if "information_schema.TABLES" in self.queries[-1]:
+            return [(table, self.update_times[table], datetime(2024, 1, 1, 13), True) for table in self.params[1:]]
+        return [(table, *self.fingerprints[table]) for table in self.params]
+
+    def close(self):
+        pass
+
+
+def test_table_without_update_time_is_fingerprinted():
+    db, watch = FakeDb(), TableWatch(min_interval=0, updated_col="updated_at")
+    assert watch.poll(db, ["coupon", "product"]) == {"coupon": 0, "product": 0}
+    assert "UNION ALL" not in db.queries[-1] and "MAX(`updated_at`)" in db.queries[-1]
+    assert watch.poll(db, ["coupon", "product"]) == {"coupon": 0, "product": 0}
+
+    db.fingerprints["product"] = (2, datetime(2024, 1, 1, 9)) # a row deleted, UPDATE_TIME still unknown
+    changed = []
+    assert watch.poll(db, ["coupon", "product"], on_change=changed.append) == {"coupon": 0, "product": 1}
+    assert changed == [{"product"}]
@@ -0,0 +1,99 @@
+import contextlib
+
+import pytest
+
+from isf_catalog import Catalog, build_tables
+
+
+def row(table, col, position, data_type, column_type, nullable="NO", default=None, max_length=None, extra="",
+        constraint=None, key_position=None, ref_table=None, ref_column=None, rules=(None, None)):
+    return (table, col, position, data_type, column_type, nullable, default, max_length, None, None, extra,
+            constraint, key_position, ref_table, ref_column, *rules)
+
+
+# the rows CATALOG_QUERY returns for a few tables, ordered by table, column position, constraint
+ROWS = [
+    row("delivery", "order_id", 1, "int", "int", constraint="PRIMARY", key_position=1),
+    row("delivery", "order_id", 1, "int", "int", constraint="delivery_ibfk_1", key_position=1,
+        ref_table="order_invoice", ref_column="order_id", rules=("CASCADE", "CASCADE")),
+    row("delivery", "delivery_status", 2, "ENUM", "enum('placed','in-transit','it''s late')", default="placed"),
+    row("product", "pid", 1, "int", "int", extra="auto_increment", constraint="PRIMARY", key_position=1),
+    row("product", "p_name", 2, "varchar", "varchar(64)", max_length=64, constraint="p_name", key_position=1),
+    row("product", "p_label", 3, "varchar", "varchar(80)", nullable="YES", max_length=80, extra="VIRTUAL GENERATED"),
+    row("vendor_supplies_seafood_product", "pid", 1, "int", "int", constraint="PRIMARY", key_position=2),
+    row("vendor_supplies_seafood_product", "pid", 1, "int", "int", constraint="vs_fk", key_position=2,
+        ref_table="vendor_product", ref_column="pid", rules=("RESTRICT", "CASCADE")),
+    row("vendor_supplies_seafood_product", "vendor_id", 2, "int", "int", constraint="PRIMARY", key_position=1),
+    row("vendor_supplies_seafood_product", "vendor_id", 2, "int", "int", constraint="vs_fk", key_position=1,
+        ref_table="vendor_product", ref_column="vendor_id", rules=("RESTRICT", "CASCADE")),
+    row("vendor_supplies_seafood_product", "note", 3, "text", "text", nullable="YES", max_length=65535),
+]
+
+
+class FakePool:
+    '''hands out a connection whose cursor returns ROWS'''
+    class _Conn:
+        def cursor(self):
+            return self
+
+        def execute(self, sql):
+            pass
+
+        def fetchall(self):
+            return ROWS
+
+        def close(self):
+            pass
+
+    def connection(self):
+        return contextlib.nullcontext(self._Conn())
+
+
+def test_columns_and_types():
+    tables = build_tables(ROWS)
+    delivery = tables["delivery"]
+    assert delivery.column_names == ["order_id", "delivery_status"]
+    status = delivery.column("delivery_status")
+    assert status.data_type == "enum"
+    assert status.enum_values == ("placed", "in-transit", "it's late")
+    assert status.default == "placed" and not status.nullable
+    assert tables["product"].column("pid").auto_increment
+    assert tables["product"].column("p_name").max_length == 64
+
+
+def test_keys():
+    tables = build_tables(ROWS)
+    assert tables["product"].primary_key == ("pid",)
+    assert tables["product"].unique_keys == {"p_name": ("p_name",)}
+    (fk,) = tables["delivery"].foreign_keys
+    assert (fk.columns, fk.referenced_table, fk.referenced_columns) == (("order_id",), "order_invoice", ("order_id",))
+    assert (fk.on_update, fk.on_delete) == ("CASCADE", "CASCADE")
+
+
+def test_view_only_columns():
+    tables = build_tables(ROWS)
+    assert tables["product"].column("p_label").generated and not tables["product"].column("p_name").generated
+    assert tables["product"].view_only_columns == ["pid", "p_label"]
+    assert tables["vendor_supplies_seafood_product"].view_only_columns == [] # keys picked from the referenced tables
+
+
+def test_composite_keys_in_key_order():
+    table = build_tables(ROWS)["vendor_supplies_seafood_product"]
+    assert table.primary_key == ("vendor_id", "pid")
+    (fk,) = table.foreign_keys
+    assert fk.columns == ("vendor_id", "pid")
+    assert fk.referenced_columns == ("vendor_id", "pid")
+    assert table.fk_columns == {"vendor_id", "pid"}
+
+
+def test_catalog_lookups():
+    catalog = Catalog()
+    catalog.refresh(FakePool())
+    assert catalog.table_names() == ["delivery", "product", "vendor_supplies_seafood_product"]
+    assert catalog.columns("product") == ["pid", "p_name", "p_label"]
+    assert catalog.primary_key("delivery") == ("order_id",)
+    assert [fk.table for fk in catalog.referenced_by("order_invoice")] == ["delivery"]
+    with pytest.raises(KeyError):
+        catalog.table("nope")
+    with pytest.raises(KeyError):
+        catalog.table("product").column("nope")
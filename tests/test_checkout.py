@@ -0,0 +1,100 @@
+# concurrent checkout_cart calls (database/checkout_procedures.sql) against the local database: never oversell,
+# never deadlock. skipped without a database, see db_args in conftest.py
+
+import threading
+
+import pymysql
+import pytest
+
+import isf_config as config
+from isf_checkout import SIGNAL_ERROR, checkout, cart_json
+
+PRODUCTS = ["test checkout A", "test checkout B", "test checkout C"]
+BUYERS = 12
+ORDERS_PER_BUYER = 5
+STOCK = 20 # fewer than the BUYERS * ORDERS_PER_BUYER carts, each taking one of every product
+
+
+def test_cart_json():
+    assert cart_json({"cod": 2}) == '[{"p_name": "cod", "quantity": 2}]'
+    assert cart_json([("cod", "1"), ("crab", 3)]) == \
+        '[{"p_name": "cod", "quantity": 1}, {"p_name": "crab", "quantity": 3}]'
+
+
+@pytest.fixture
+def contested(db_args):
+    '''(customer id, payment type) to check out with, and the PRODUCTS with STOCK each; removed afterwards'''
+    conn = pymysql.connect(**db_args, autocommit=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT c.cid FROM customer c JOIN delivery_zone z ON z.zipcode = c.zip ORDER BY c.cid LIMIT 1")
+    customer_id = cursor.fetchone()[0]
+    cursor.execute("SELECT payment_type FROM payment ORDER BY payment_type LIMIT 1")
+    payment_type = cursor.fetchone()[0]
+    cursor.execute("SELECT category_name FROM category ORDER BY category_name LIMIT 1")
+    category = cursor.fetchone()[0]
+    cursor.executemany("INSERT INTO product (p_name, category, sell_price, qty_in_stock, product_img) "
+                       "VALUES (%s, %s, 1, %s, 'test')", [(name, category, STOCK) for name in PRODUCTS])
+    try:
+        yield cursor, customer_id, payment_type
+    finally:
+        in_products = ", ".join(["%s"] * len(PRODUCTS))
+        cursor.execute(f"SELECT DISTINCT order_id FROM order_item WHERE p_name IN ({in_products})", PRODUCTS)
+        order_ids = [order_id for order_id, in cursor.fetchall()]
+        if order_ids:
+            in_orders = ", ".join(["%s"] * len(order_ids))
+            cursor.execute(f"DELETE FROM delivery WHERE order_id IN ({in_orders})", order_ids)
+            cursor.execute(f"DELETE FROM order_item WHERE order_id IN ({in_orders})", order_ids)
+            cursor.execute(f"DELETE FROM order_invoice WHERE order_id IN ({in_orders})", order_ids)
+        cursor.execute(f"DELETE FROM product WHERE p_name IN ({in_products})", PRODUCTS)
+        cursor.close()
+        conn.close()
+
+
+def test_concurrent_checkouts_never_oversell_or_deadlock(db_args, contested):
+    cursor, customer_id, payment_type = contested
+    outcomes = []
+    order_ids = []
+    lock = threading.Lock()
+    start_line = threading.Barrier(BUYERS)
+
+    def buyer(i):
+        conn = pymysql.connect(**db_args)
+        start_line.wait()
+        for n in range(ORDERS_PER_BUYER):
+            # the same products listed in a different order by each cart
+            shift = (i + n) % len(PRODUCTS)
+            cart = [(name, 1) for name in PRODUCTS[shift:] + PRODUCTS[:shift]]
+            try:
+                order_id, _ = checkout(conn, config.CHECKOUT, customer_id, payment_type, '', cart, retries=0)
+                outcome = "ok"
+            except pymysql.Error as e:
+                outcome = "out_of_stock" if e.args[0] == SIGNAL_ERROR and "Not enough qty" in e.args[1] else e.args
+            with lock:
+                outcomes.append(outcome)
+                if outcome == "ok":
+                    order_ids.append(order_id)
+        conn.close()
+
+    threads = [threading.Thread(target=buyer, args=(i,)) for i in range(BUYERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # every cart either got one of each product or was turned down for stock: no deadlock, no other error
+    assert sorted(set(map(str, outcomes))) == ["ok", "out_of_stock"]
+    assert outcomes.count("ok") == STOCK
+    assert outcomes.count("out_of_stock") == BUYERS * ORDERS_PER_BUYER - STOCK
+
+    in_products = ", ".join(["%s"] * len(PRODUCTS))
+    cursor.execute(f"SELECT p_name, qty_in_stock FROM product WHERE p_name IN ({in_products})", PRODUCTS)
+    assert dict(cursor.fetchall()) == {name: 0 for name in PRODUCTS}
+    in_orders = ", ".join(["%s"] * len(order_ids))
+    cursor.execute(f"SELECT COUNT(*) FROM order_invoice WHERE order_id IN ({in_orders})", order_ids)
+    assert cursor.fetchone()[0] == STOCK
+    cursor.execute(f"SELECT p_name, SUM(quantity), COUNT(DISTINCT order_id) FROM order_item "
+                   f"WHERE p_name IN ({in_products}) GROUP BY p_name", PRODUCTS)
+    assert {name: (int(sold), orders) for name, sold, orders in cursor.fetchall()} == \
+        {name: (STOCK, STOCK) for name in PRODUCTS}
+    cursor.execute(f"SELECT COUNT(*) FROM delivery WHERE order_id IN ({in_orders})", order_ids)
+    assert cursor.fetchone()[0] == STOCK
@@ -0,0 +1,81 @@
+import pymysql
+
+import isf_commit as committer
+
+
+class FakeCursor:
+    '''runs "statements" that are row values: a value in fail raises like the server would'''
+    def __init__(self, conn):
+        self.conn, self.rowcount, self.lastrowid = conn, 0, None
+
+    def execute(self, sql, params=()):
+        if sql.startswith(("SAVEPOINT", "RELEASE", "ROLLBACK")):
+            return
+        bad = [val for val in params if val in self.conn.fail]
+        if bad:
+            raise pymysql.IntegrityError(1062, f"Duplicate entry '{bad[0]}'")
+        self.rowcount = len([val for val in params if val not in self.conn.missing])
+        self.conn.pending.extend(params)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, fail=(), missing=()):
+        self.fail, self.missing = set(fail), set(missing)
+        self.pending, self.saved = [], []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def begin(self):
+        self.pending = []
+
+    def commit(self):
+        self.saved += self.pending
+
+    def rollback(self):
+        self.pending = []
+
+
+def batch(*vals, expect_rows=False):
+    return committer.Batch("UPDATE", list(vals), [("UPDATE", (val,), f"row {val}") for val in vals],
+                           expect_rows=expect_rows)
+
+
+def test_chunked():
+    assert list(committer.chunked([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+
+
+def test_savepoint_keeps_the_rows_that_succeed():
+    conn = FakeConnection(fail={2})
+    batches = [batch(1, 2, 3), batch(4)]
+    failed, errors, committed = committer.run_batches(conn, batches, committer.SAVEPOINT)
+    assert committed
+    assert failed == ["row 2"]
+    assert errors == ["Error: Duplicate entry '2'"]
+    assert batches[0].row_ok == [True, False, True] and batches[1].row_ok == [True]
+    assert sorted(conn.saved) == [1, 3, 4]
+
+
+def test_atomic_saves_nothing_when_a_row_fails():
+    conn = FakeConnection(fail={4})
+    batches = [batch(1, 2), batch(4)]
+    failed, _, committed = committer.run_batches(conn, batches, committer.ATOMIC)
+    assert not committed
+    assert failed == ["row 4"]
+    assert conn.saved == []
+    assert not any(ok for b in batches for ok in b.row_ok)
+    # the failures are reported per batch, e.g. per step of one commit
+    assert committer.batch_failures(batches[:1]) == ([], [])
+    assert committer.batch_failures(batches[1:]) == (["row 4"], ["Error: Duplicate entry '4'"])
+
+
+def test_rows_matching_nothing_are_conflicts():
+    conn = FakeConnection(missing={2})
+    batches = [batch(1, 2, expect_rows=True)]
+    failed, errors, committed = committer.run_batches(conn, batches, committer.SAVEPOINT)
+    assert committed
+    assert failed == ["row 2"] and errors == [committer.CONFLICT]
+    assert batches[0].row_conflict == [False, True]
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from isf_delivery import feed_sql, apply_feed
+
+OPEN = ['placed', 'in-transit']
+
+
+def queue(rows):
+    return pd.DataFrame({"order_id": pd.array([row[0] for row in rows], dtype="Int64"),
+                         "delivery_partner_id": pd.array([row[1] for row in rows], dtype="Int64"),
+                         "delivery_status": [row[2] for row in rows],
+                         "expected_delivery_date": pd.to_datetime([row[3] for row in rows])})
+
+
+def test_feed_sql_reads_the_queued_rows_too():
+    assert feed_sql('delivery', 'updated_at') == \
+        "SELECT * FROM `delivery` WHERE `updated_at` >= %s AND (delivery_partner_id = %s)"
+    assert feed_sql('delivery', 'updated_at', ('order_id',), 2) == \
+        "SELECT * FROM `delivery` WHERE `updated_at` >= %s AND (delivery_partner_id = %s OR `order_id` IN (%s, %s))"
+
+
+def test_apply_feed():
+    current = queue([(1, 7, 'placed', '2024-01-03'), (2, 7, 'placed', '2024-01-02'), (3, 7, 'placed', '2024-01-04')])
+    fresh = queue([(1, 8, 'placed', '2024-01-03'),       # given to another partner
+                   (2, 7, 'delivered', '2024-01-02'),    # no longer open
+                   (4, 7, 'in-transit', '2024-01-01')])  # newly assigned
+    df = apply_feed(current, fresh, ('order_id',), OPEN, 7)
+    assert df["order_id"].tolist() == [4, 3]
@@ -0,0 +1,91 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pandas as pd
+
+from isf_catalog import build_tables
+from isf_frames import column_dtypes, typed_frame, concat_frames, read_frame
+from test_catalog import ROWS, row
+
+TABLES = build_tables(ROWS + [
+    row("payment", "payment_type", 1, "varchar", "varchar(32)", max_length=32),
+    row("payment", "amount", 2, "double", "double"),
+    row("payment", "paid_at", 3, "datetime", "datetime", nullable="YES"),
+    row("payment", "big_id", 4, "bigint", "bigint unsigned"),
+    row("payment", "fee", 5, "decimal", "decimal(10,2)", nullable="YES"),
+])
+
+
+class FakeConnection:
+    '''a connection whose (server-side) cursor returns rows in fetchmany chunks'''
+    cursorclass = object
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self, cursorclass=None):
+        return self
+
+    def execute(self, sql, params=()):
+        self.left = list(self.rows)
+
+    def fetchmany(self, size):
+        chunk, self.left = self.left[:size], self.left[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+def test_column_dtypes():
+    dtypes = column_dtypes(TABLES["delivery"])
+    assert dtypes["order_id"] == "Int64"
+    assert list(dtypes["delivery_status"].categories) == ["placed", "in-transit", "it's late"]
+    dtypes = column_dtypes(TABLES["payment"])
+    assert dtypes == {"amount": "Float64", "paid_at": "datetime64[ns]", "big_id": "UInt64"}
+
+
+def test_typed_frame():
+    dtypes = column_dtypes(TABLES["payment"])
+    df = typed_frame([("card", 2.5, datetime(2024, 1, 2), 2 ** 63), ("cash", None, None, 1)],
+                     ["payment_type", "amount", "paid_at", "big_id"], dtypes)
+    assert str(df["amount"].dtype) == "Float64" and df["amount"].isna().tolist() == [False, True]
+    assert df["paid_at"].dtype == "datetime64[ns]"
+    assert df["big_id"].tolist() == [2 ** 63, 1]
+    assert df["payment_type"].dtype == object
+
+
+def test_decimals_stay_exact():
+    dtypes = column_dtypes(TABLES["payment"])
+    df = typed_frame([(Decimal("0.10"),), (None,)], ["fee"], dtypes)
+    assert df["fee"].dtype == object
+    assert df["fee"].tolist() == [Decimal("0.10"), None]
+
+
+def test_sums_come_back_as_ints():
+    df = typed_frame([(Decimal("12"),)], ["total"], {"total": "Int64"})
+    assert df["total"].tolist() == [12]
+
+
+def test_concat_frames_keeps_categoricals():
+    first = typed_frame([("a",)], ["fk"], {"fk": "category"})
+    second = typed_frame([("b",)], ["fk"], {"fk": "category"})
+    df = concat_frames([first, second], ["fk"])
+    assert isinstance(df["fk"].dtype, pd.CategoricalDtype)
+    assert df["fk"].tolist() == ["a", "b"]
+
+
+def test_read_frame_in_chunks():
+    rows = [(i, "placed" if i % 2 else "in-transit") for i in range(7)]
+    dtypes = column_dtypes(TABLES["delivery"])
+    df = read_frame(FakeConnection(rows), "SELECT", (), ["order_id", "delivery_status"], dtypes, chunk_size=3)
+    assert df["order_id"].tolist() == list(range(7))
+    assert str(df["order_id"].dtype) == "Int64"
+    assert df["delivery_status"].tolist() == [status for _, status in rows]
+    assert df["delivery_status"].dtype == dtypes["delivery_status"]
+
+
+def test_read_frame_of_no_rows():
+    df = read_frame(FakeConnection([]), "SELECT", (), ["order_id", "delivery_status"],
+                    column_dtypes(TABLES["delivery"]))
+    assert df.empty and list(df.columns) == ["order_id", "delivery_status"]
@@ -0,0 +1,95 @@
+import pymysql
+
+from isf_metrics import QueryLog, statement_key, param_shape, timed_cursor
+
+
+class FakeResult:
+    '''the result pymysql cursors read from a connection: all of its rows at once, or one by one when unbuffered'''
+    warning_count = 0
+    insert_id = 0
+    has_next = False
+
+    def __init__(self, rows, affected_rows):
+        self.rows = tuple(rows) if rows else None
+        self.affected_rows = affected_rows
+        self.description = (("pid",),) if rows else None
+        self._unread = iter(rows)
+
+    def _read_rowdata_packet_unbuffered(self):
+        return next(self._unread, None)
+
+    def _finish_unbuffered_query(self):
+        self._unread = iter(())
+
+
+class FakeConnection:
+    '''answers every query with the rows of the table named in it, and counts the rows changed by other statements'''
+    def __init__(self, tables):
+        self.tables = tables
+        self.queries = []
+
+    def literal(self, obj):
+        return pymysql.converters.escape_item(obj, "utf8mb4")
+
+    def query(self, sql, unbuffered=False):
+        self.queries.append(sql)
+        rows = next((rows for table, rows in self.tables.items() if f"FROM {table}" in sql), [])
+        self._result = FakeResult(rows, -1 if unbuffered else len(rows) or 1)
+
+
+def test_statement_key():
+    assert statement_key("SELECT *  FROM product\n WHERE pid IN (%s, %s, %s) AND p_name = 'crab'") == \
+        "SELECT * FROM product WHERE pid IN (?) AND p_name = ?"
+    assert statement_key("INSERT INTO coupon (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)") == \
+        "INSERT INTO coupon (a, b) VALUES (?), ..."
+    assert param_shape((1, 2)) == "2 params" and param_shape({"b": 1, "a": 2}) == "cols: a, b"
+
+
+def test_timed_cursor_records_buffered_queries():
+    log = QueryLog(capacity=10, rerun_capacity=10)
+    conn = FakeConnection({"product": [(1,), (2,), (3,)]})
+    cursor = timed_cursor(log)(conn)
+    cursor.execute("SELECT pid FROM product WHERE pid IN (%s, %s)", (1, 2))
+    assert cursor.fetchall() == ((1,), (2,), (3,))
+    cursor.executemany("UPDATE coupon SET used = 1 WHERE coupon_code = %s", [("A",), ("B",)])
+    cursor.close()
+
+    records = log.records()
+    assert records["statement"].tolist() == ["SELECT pid FROM product WHERE pid IN (?)",
+                                             "UPDATE coupon SET used = ? WHERE coupon_code = %s"]
+    assert records["params"].tolist() == ["2 params", "2 x 1 params"]
+    assert records["rows"].tolist() == [3, 2] and records["bytes"].tolist()[0] == 24
+    assert records["caller"].tolist()[0] == "test_metrics.test_timed_cursor_records_buffered_queries"
+    assert len(conn.queries) == 3 and log.total() == 2
+
+
+def test_timed_cursor_records_unbuffered_queries_once_read():
+    log = QueryLog(capacity=10, rerun_capacity=10)
+    conn = FakeConnection({"product": [(1,), (2,), (3,)]})
+    cursor = timed_cursor(log).unbuffered(conn)
+    cursor.execute("SELECT pid FROM product")
+    assert cursor.fetchmany(2) == [(1,), (2,)]
+    assert log.total() == 0 # still streaming
+    cursor.close()
+    assert log.records()[["statement", "rows"]].values.tolist() == [["SELECT pid FROM product", 2]]
+
+
+def test_query_log_reruns_and_capacity():
+    log = QueryLog(capacity=3, rerun_capacity=10)
+    with log.rerun("customers") as totals:
+        with log.rerun("fragment") as inner: # a fragment rerun as part of a full one counts towards it
+            assert inner is totals
+            log.record("SELECT ?", "1 params", "test", 0.002, 5, 40)
+        log.record("SELECT ?", "1 params", "test", 0.004, 1, 8)
+    log.record("CALL get_product_sales", "1 params", "test", 0.020, 0, 0) # outside any rerun
+    log.record("SELECT ?", "1 params", "test", 0.006, 1, 8)
+
+    reruns = log.reruns()
+    assert reruns[["rerun", "label", "queries", "rows", "bytes"]].values.tolist() == [[1, "customers", 2, 6, 48]]
+    assert abs(reruns["query_ms"][0] - 6) < 1e-9
+
+    records = log.records() # the oldest record is dropped
+    assert len(records) == 3 and log.total() == 4
+    assert records["rerun"].isna().tolist() == [False, True, True]
+    summary = log.summary()
+    assert summary.index.tolist() == ["CALL get_product_sales", "SELECT ?"] and summary["calls"].tolist() == [1, 2]
@@ -0,0 +1,48 @@
+from isf_options import load_options, search_options
+
+ZIPCODES = ["02115", "02116", "10001", "10_01", "94105"]
+
+
+class FakeConn:
+    '''answers the option queries from ZIPCODES, honoring the LIMIT and the prefix of LIKE (escaped wildcards)'''
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        self.sql, self.params = sql, params
+        *like, limit = params
+        values = ZIPCODES
+        if like:
+            prefix = like[0][:-1].replace("\\_", "_").replace("\\%", "%").replace("\\\\", "\\")
+            values = [val for val in values if val.startswith(prefix)]
+        self.rows = [(val,) for val in values[:limit]]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_load_options():
+    conn = FakeConn()
+    values, complete = load_options(conn, "delivery_zone", "zipcode", 10)
+    assert values.tolist() == ZIPCODES and complete
+    assert conn.sql == "SELECT `zipcode` FROM `delivery_zone` ORDER BY `zipcode` LIMIT %s"
+
+    values, complete = load_options(conn, "delivery_zone", "zipcode", 5) # one more is read to know there are no more
+    assert values.tolist() == ZIPCODES and complete and conn.params == (6,)
+    values, complete = load_options(conn, "delivery_zone", "zipcode", 3)
+    assert values.tolist() == ZIPCODES[:3] and not complete
+
+
+def test_search_options():
+    conn = FakeConn()
+    assert search_options(conn, "delivery_zone", "zipcode", "021", 10).tolist() == ["02115", "02116"]
+    assert conn.sql == "SELECT `zipcode` FROM `delivery_zone` WHERE `zipcode` LIKE %s ORDER BY `zipcode` LIMIT %s"
+    assert search_options(conn, "delivery_zone", "zipcode", "0", 1).tolist() == ["02115"]
+
+    # LIKE wildcards typed in the search box match themselves only
+    assert search_options(conn, "delivery_zone", "zipcode", "10_", 10).tolist() == ["10_01"]
+    assert conn.params == ("10\\_%", 10)
+    assert search_options(conn, "delivery_zone", "zipcode", "%", 10).tolist() == []
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+
+from isf_pages import PageQuery, keyset_condition, fetch_page
+
+COLUMNS = ["vendor_id", "pid", "unit_price"]
+# (vendor_id, pid) is the primary key, unit_price repeats so sorting on it needs the key to break ties
+ROWS = [(vendor_id, pid, (vendor_id * pid) % 4) for vendor_id in range(1, 4) for pid in range(1, 6)]
+
+
+class FakeConn:
+    '''runs the page queries on an in-memory sqlite table (it reads `quoted` names, %s placeholders become ?)'''
+    def __init__(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("CREATE TABLE supplies (vendor_id INT, pid INT, unit_price INT, PRIMARY KEY (vendor_id, pid))")
+        self.db.executemany("INSERT INTO supplies VALUES (?, ?, ?)", ROWS)
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params):
+        self.result = self.db.execute(sql.replace("%s", "?"), params).fetchall()
+
+    def fetchall(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+def all_pages(query):
+    conn, rows, after, has_more = FakeConn(), [], None, True
+    while has_more:
+        df, after, has_more = fetch_page(conn, query, COLUMNS, after)
+        assert len(df) == query.page_size or not has_more
+        rows.extend(df.itertuples(index=False, name=None))
+    return rows
+
+
+def test_keyset_condition_composite_key():
+    assert keyset_condition(("vendor_id", "pid"), (2, 7), descending=False) == \
+        ("((`vendor_id` > %s) OR (`vendor_id` = %s AND `pid` > %s))", [2, 2, 7])
+    assert keyset_condition(("unit_price", "vendor_id", "pid"), (3, 2, 7), descending=True) == \
+        ("((`unit_price` < %s) OR (`unit_price` = %s AND `vendor_id` < %s) "
+         "OR (`unit_price` = %s AND `vendor_id` = %s AND `pid` < %s))", [3, 3, 2, 3, 2, 7])
+
+
+@pytest.mark.parametrize("sort_col", [None, "unit_price", "pid"])
+@pytest.mark.parametrize("descending", [False, True])
+def test_fetch_page_walks_every_row_once(sort_col, descending):
+    query = PageQuery("supplies", ("vendor_id", "pid"), sort_col, descending, page_size=4)
+    order = [COLUMNS.index(col) for col in query.order_cols]
+    expected = sorted(ROWS, key=lambda row: [row[i] for i in order], reverse=descending)
+    assert all_pages(query) == expected
+
+
+def test_fetch_page_with_filters():
+    query = PageQuery("supplies", ("vendor_id", "pid"), "unit_price", True, (("vendor_id", "!=", 2),), page_size=3)
+    assert all_pages(query) == sorted([row for row in ROWS if row[0] != 2], key=lambda row: (row[2], row[0], row[1]),
+                                      reverse=True)
+
+
+def test_fetch_page_last_page():
+    df, after, has_more = fetch_page(FakeConn(), PageQuery("supplies", ("vendor_id", "pid"), page_size=20), COLUMNS)
+    assert len(df) == 15 and after == (3, 5) and not has_more
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import pymysql
+import pytest
+
+from isf_pool import ConnectionPool, PoolTimeoutError
+
+
+class FakeConnection:
+    '''a connection that can be dropped by the server (ping fails) or left in a transaction'''
+    def __init__(self):
+        self.open = True
+        self.dropped = False
+        self.server_status = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        if self.dropped:
+            if reconnect: # a reconnecting ping would hide the drop from the pool
+                self.dropped = False
+                return
+            raise pymysql.err.OperationalError(2006, "MySQL server has gone away")
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.server_status = 0
+
+    def close(self):
+        self.open = False
+
+
+class FakePool(ConnectionPool):
+    def _open(self):
+        return FakeConnection()
+
+
+def test_min_size_connections_are_opened_and_reused():
+    pool = FakePool({}, min_size=2, max_size=3)
+    assert pool.stats()["size"] == 2
+    with pool.connection() as conn:
+        assert pool.stats()["in_use"] == 1
+    with pool.connection() as again:
+        assert again is conn
+    stats = pool.stats()
+    assert stats["checkouts"] == 2 and stats["idle"] == 2 and stats["peak_in_use"] == 1
+
+
+def test_exhausted_pool_waits_then_times_out():
+    pool = FakePool({}, min_size=0, max_size=2, timeout=0.05)
+    first, second = pool.checkout(), pool.checkout()
+    with pytest.raises(PoolTimeoutError):
+        pool.checkout()
+    assert pool.stats()["timeouts"] == 1
+
+    threading.Timer(0.01, pool.checkin, [first]).start()
+    pool.timeout = 5
+    assert pool.checkout() is first # handed over when it was returned
+    assert pool.stats()["waits"] == 1
+    pool.checkin(second)
+
+
+def test_dropped_idle_connection_is_replaced_and_counted():
+    pool = FakePool({}, min_size=1, max_size=1, ping_interval=0)
+    conn = pool.checkout()
+    pool.checkin(conn)
+    conn.dropped = True
+    time.sleep(0.001)
+    fresh = pool.checkout()
+    assert fresh is not conn and not conn.open
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_checkin_rolls_back_open_transactions_and_drops_broken_connections():
+    pool = FakePool({}, min_size=0, max_size=2)
+    conn = pool.checkout()
+    conn.server_status = pymysql.constants.SERVER_STATUS.SERVER_STATUS_IN_TRANS
+    pool.checkin(conn)
+    assert conn.rollbacks == 1 and pool.stats()["idle"] == 1
+
+    conn = pool.checkout()
+    with pytest.raises(pymysql.err.OperationalError):
+        with pool.connection() as broken:
+            raise pymysql.err.OperationalError(2013, "Lost connection")
+    assert not broken.open
+    stats = pool.stats()
+    assert stats["discarded"] == 1 and stats["size"] == 1
+    pool.checkin(conn)
+    pool.close()
+    assert pool.stats()["size"] == 0 and not conn.open
@@ -0,0 +1,53 @@
+from decimal import Decimal
+
+import isf_config as config
+from isf_rollups import rebuild_rollups, compare_rollups
+
+
+class FakeConn:
+    '''answers the order years query and each procedure call from results: {(procedure, args): rows}'''
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.rows = [(2024,), (2023,)]
+
+    def callproc(self, procedure, args=()):
+        self.calls.append((procedure, tuple(args)))
+        self.rows = self.results.get((procedure, tuple(args)), [])
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+def test_rebuild_rollups():
+    conn = FakeConn({})
+    rebuild_rollups(conn, config.ROLLUP_REBUILD)
+    assert conn.calls == [("rebuild_sales_rollups", ())]
+
+
+def test_compare_rollups_match():
+    # sums come back as DECIMAL from the source procedures, ties in any order
+    conn = FakeConn({("count_order_per_cid_rollup", ()): [("ann", 2), ("bob", 2)],
+                     ("count_order_per_cid", ()): [("bob", Decimal(2)), ("ann", Decimal(2))],
+                     ("get_product_sales_rollup", (2023,)): [("crab", 5)],
+                     ("get_product_sales", (2023,)): [("crab", Decimal(5))]})
+    assert compare_rollups(conn, config.ANALYTICS, config.ANALYTICS_SOURCE) == []
+    assert [call for call in conn.calls if call[1]] == [("get_product_sales_rollup", (2023,)),
+                                                        ("get_product_sales", (2023,)),
+                                                        ("get_product_sales_rollup", (2024,)),
+                                                        ("get_product_sales", (2024,))]
+
+
+def test_compare_rollups_mismatch():
+    conn = FakeConn({("get_product_sales_rollup", (2024,)): [("crab", 5), ("eel", 1)],
+                     ("get_product_sales", (2024,)): [("crab", Decimal(6)), ("eel", Decimal(1))]})
+    assert compare_rollups(conn, config.ANALYTICS, config.ANALYTICS_SOURCE) == \
+        ["Best Selling Products by Year (2024,): missing [('crab', 6)], unexpected [('crab', 5)]"]
@@ -0,0 +1,65 @@
+from isf_sql import (quote_ident, pk_condition, describe_pk, update_statement, case_update_statement,
+                     insert_statement, upsert_statement, delete_statement, pk_in_condition, call_statement)
+
+
+def test_quote_ident_escapes_backticks():
+    assert quote_ident("order_item") == "`order_item`"
+    assert quote_ident("we`ird") == "`we``ird`"
+
+
+def test_pk_condition_and_description():
+    assert pk_condition(("vendor_id", "pid")) == "`vendor_id` = %s AND `pid` = %s"
+    assert describe_pk(("vendor_id", "pid"), (1, 5)) == "vendor_id = 1, pid = 5"
+
+
+def test_update_statement():
+    assert update_statement("product", ["p_name", "sell_price"], ("pid",)) == \
+        "UPDATE `product` SET `p_name` = %s, `sell_price` = %s WHERE `pid` = %s"
+
+
+def test_update_statement_with_version():
+    assert update_statement("product", ["sell_price"], ("pid",), "row_version") == \
+        ("UPDATE `product` SET `sell_price` = %s, `row_version` = `row_version` + 1 "
+         "WHERE `pid` = %s AND `row_version` = %s")
+
+
+def test_case_update_statement():
+    assert case_update_statement("product", ["sell_price"], ("pid",), 2) == \
+        ("UPDATE `product` SET `sell_price` = CASE `pid` WHEN %s THEN %s WHEN %s THEN %s ELSE `sell_price` END "
+         "WHERE `pid` IN (%s, %s)")
+
+
+def test_case_update_statement_composite_key_with_version():
+    sql = case_update_statement("vendor_supplies_seafood_product", ["price"], ("vendor_id", "pid"), 2, "row_version")
+    assert sql == ("UPDATE `vendor_supplies_seafood_product` SET `price` = CASE "
+                   "WHEN `vendor_id` = %s AND `pid` = %s THEN %s WHEN `vendor_id` = %s AND `pid` = %s THEN %s "
+                   "ELSE `price` END, `row_version` = `row_version` + 1 "
+                   "WHERE (`vendor_id`, `pid`, `row_version`) IN ((%s, %s, %s), (%s, %s, %s))")
+
+
+def test_insert_and_upsert_statements():
+    assert insert_statement("coupon", ["coupon_code", "coupon_discount_amt"], 2) == \
+        "INSERT INTO `coupon` (`coupon_code`, `coupon_discount_amt`) VALUES (%s, %s), (%s, %s)"
+    assert upsert_statement("coupon", ["coupon_code", "coupon_discount_amt"], ["coupon_discount_amt"],
+                            version_col="row_version") == \
+        ("INSERT INTO `coupon` (`coupon_code`, `coupon_discount_amt`) VALUES (%s, %s) AS new "
+         "ON DUPLICATE KEY UPDATE `coupon_discount_amt` = new.`coupon_discount_amt`, "
+         "`row_version` = `row_version` + 1")
+
+
+def test_upsert_of_key_columns_only_leaves_rows_as_they_are():
+    assert upsert_statement("category", ["category_name"], []).endswith(
+        "ON DUPLICATE KEY UPDATE `category_name` = new.`category_name`")
+
+
+def test_delete_statement():
+    assert delete_statement("coupon", ("coupon_code",)) == "DELETE FROM `coupon` WHERE `coupon_code` = %s"
+    assert delete_statement("coupon", ("coupon_code",), 3) == \
+        "DELETE FROM `coupon` WHERE `coupon_code` IN (%s, %s, %s)"
+    assert delete_statement("coupon", ("coupon_code",), 2, "row_version") == \
+        "DELETE FROM `coupon` WHERE (`coupon_code`, `row_version`) IN ((%s, %s), (%s, %s))"
+
+
+def test_pk_in_condition_and_call():
+    assert pk_in_condition(("a", "b"), 1) == "(`a`, `b`) IN ((%s, %s))"
+    assert call_statement("add_coupon", 3) == "CALL `add_coupon`(%s, %s, %s)"
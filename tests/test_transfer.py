@@ -0,0 +1,125 @@
+import contextlib
+import io
+from decimal import Decimal
+
+import pymysql
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from isf_catalog import ColumnInfo, ForeignKey, TableInfo
+from isf_transfer import CSV, PARQUET, import_file, export_table
+
+
+def column(name, position, data_type, column_type, nullable=False, max_length=None, precision=None, scale=None):
+    return ColumnInfo(name, position, data_type, column_type, nullable, None, max_length, precision, scale, False)
+
+
+ITEM = TableInfo("item", [column("item_id", 1, "int", "int"),
+                          column("name", 2, "varchar", "varchar(16)", max_length=16),
+                          column("price", 3, "decimal", "decimal(6,2)", nullable=True, precision=6, scale=2),
+                          column("vendor_id", 4, "int", "int", nullable=True)],
+                 primary_key=("item_id",),
+                 foreign_keys=[ForeignKey("item_fk", "item", ("vendor_id",), "vendor", ("vendor_id",),
+                                          "CASCADE", "RESTRICT")])
+
+
+class FakeDb:
+    '''
+    a pool whose connections look up vendor ids in vendors, fail the inserts of a row named "dup"
+    and stream rows to server-side cursors
+    '''
+    cursorclass = pymysql.cursors.Cursor
+
+    def __init__(self, rows=()):
+        self.vendors = {1, 2}
+        self.rows = list(rows)
+        self.saved = []  # params of every insert that went through
+        self.transactions = 0
+
+    def connection(self):
+        return contextlib.nullcontext(self)
+
+    def cursor(self, cursorclass=None):
+        return self
+
+    def begin(self):
+        self.transactions += 1
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def execute(self, sql, params=()):
+        self.sql, self.params, self.rowcount = sql, list(params), 0
+        if sql.startswith("INSERT"):
+            if "dup" in self.params:
+                raise pymysql.err.IntegrityError(1062, "Duplicate entry 'dup'")
+            self.saved.append(self.params)
+        elif sql.startswith("SELECT"):
+            self.pending = list(self.rows)
+
+    def fetchall(self):
+        return [(vendor_id,) for vendor_id in self.params if vendor_id in self.vendors]
+
+    def fetchmany(self, size):
+        part, self.pending = self.pending[:size], self.pending[size:]
+        return part
+
+    def close(self):
+        pass
+
+
+def test_import_file_chunks_and_rejects():
+    file = io.BytesIO(b"item_id,name,price,vendor_id,note\n"
+                      b"1,crab,12.50,1,x\n"
+                      b"2,eel,abc,1,x\n"      # not a number
+                      b"3,cod,3,99,x\n"       # no vendor 99
+                      b"4,dup,4,2,x\n"        # the database rejects it
+                      b"5,,5,2,x\n"           # name is required
+                      b"6,tuna,,,x\n")
+    db, progress = FakeDb(), []
+    report = import_file(db, ITEM, file, CSV, ITEM.column_names, chunk_size=2, batch_size=10,
+                         on_progress=lambda report: progress.append(report.rows_read))
+    assert progress == [2, 4, 6] and db.transactions == 3 # a transaction per chunk
+    assert report.ignored_cols == ["note"]
+    assert report.rows_read == 6 and report.rows_saved == 2
+    assert report.rejects == [(2, "price is not a number: 'abc'"), (3, "vendor_id 99 not found in vendor"),
+                              (4, "Error: Duplicate entry 'dup'"), (5, "name is required")]
+    assert [1, "crab", Decimal("12.50"), 1] in db.saved
+    assert [6, "tuna"] in db.saved # empty values are left out of the insert
+
+
+def test_import_file_without_a_required_column():
+    with pytest.raises(ValueError, match="no column name"):
+        import_file(FakeDb(), ITEM, io.BytesIO(b"item_id,price\n1,2\n"), CSV, ITEM.column_names, 10, 10)
+
+
+def test_export_table_round_trip():
+    rows = [(1, "crab", Decimal("12.50"), 1), (2, "eel", None, None), (3, "cod", Decimal("0.05"), 2)]
+    out = io.BytesIO()
+    assert export_table(FakeDb(rows), ITEM, CSV, out, chunk_size=2) == 3
+    assert out.getvalue().decode().splitlines() == ["item_id,name,price,vendor_id", "1,crab,12.50,1", "2,eel,,",
+                                                    "3,cod,0.05,2"]
+
+    out = io.BytesIO()
+    assert export_table(FakeDb(rows), ITEM, PARQUET, out, chunk_size=2) == 3
+    out.seek(0)
+    exported = pq.read_table(out)
+    assert str(exported.schema.field("price").type) == "decimal128(6, 2)"
+    assert pq.ParquetFile(out).metadata.num_row_groups == 2 # a row group per chunk
+
+    out.seek(0)
+    db = FakeDb()
+    report = import_file(db, ITEM, out, PARQUET, ITEM.column_names, chunk_size=10, batch_size=10)
+    assert report.rows_saved == 3 and report.rejects == []
+    assert db.saved[0][:8] == [1, "crab", Decimal("12.50"), 1, 3, "cod", Decimal("0.05"), 2]
+
+
+def test_export_empty_table():
+    out = io.BytesIO()
+    assert export_table(FakeDb(), ITEM, PARQUET, out, chunk_size=2) == 0
+    out.seek(0)
+    assert pq.read_table(out).column_names == ITEM.column_names
@@ -0,0 +1,146 @@
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+from isf_catalog import ColumnInfo, ForeignKey, TableInfo
+from isf_validate import coerce_column, whole_number, validate_edits
+
+
+def column(name, data_type, column_type=None, nullable=True, default=None, max_length=None, auto_increment=False,
+           enum_values=()):
+    return ColumnInfo(name, 0, data_type, column_type or data_type, nullable, default, max_length, None, None,
+                      auto_increment, enum_values)
+
+
+PRODUCT = TableInfo(
+    name="product",
+    columns=[column("pid", "int", nullable=False, auto_increment=True),
+             column("name", "varchar", nullable=False, max_length=10),
+             column("sell_price", "int"),
+             column("unit", "enum", enum_values=("kg", "lb")),
+             column("added", "date"),
+             column("category_name", "varchar", max_length=20)],
+    primary_key=("pid",),
+    unique_keys={"uq_name": ("name",)},
+    foreign_keys=[ForeignKey("fk_cat", "product", ("category_name",), "category", ("name",), "CASCADE", "RESTRICT")])
+
+KEYS = {("category", ("name",)): {("fish",), ("shellfish",)}}
+
+
+def product_df():
+    return pd.DataFrame({"pid": pd.array([1, 2], dtype="Int64"), "name": ["cod", "crab"],
+                         "sell_price": pd.array([10, None], dtype="Int64"), "unit": ["kg", "lb"],
+                         "added": pd.to_datetime(["2024-01-02", "2024-02-03"]),
+                         "category_name": ["fish", "shellfish"]})
+
+
+def test_int_column_keeps_python_ints_next_to_nulls():
+    out, bad, _ = coerce_column(pd.Series(["12", None, ""], dtype=object), column("n", "int"))
+    assert out.tolist() == [12, None, None]
+    assert type(out[0]) is int
+    assert not bad.any()
+
+
+def test_bigint_text_is_parsed_exactly():
+    big = 2 ** 63 - 1
+    out, bad, _ = coerce_column(pd.Series([str(big), "9007199254740993"], dtype=object), column("n", "bigint"))
+    assert out.tolist() == [big, 9007199254740993]
+    assert not bad.any()
+
+
+def test_int_column_rejects_fractions_and_text():
+    out, bad, reason = coerce_column(pd.Series(["1.5", "abc", "3.0"], dtype=object), column("n", "int"))
+    assert bad.tolist() == [True, True, False]
+    assert out[2] == 3
+    assert reason == "is not a whole number"
+
+
+def test_decimal_column_is_parsed_exactly():
+    out, bad, _ = coerce_column(pd.Series(["0.10", 2.5, "abc", None], dtype=object), column("fee", "decimal"))
+    assert out.tolist()[:2] == [Decimal("0.10"), Decimal("2.5")]
+    assert bad.tolist() == [False, False, True, False]
+
+
+def test_whole_number():
+    assert whole_number(4.0) == 4
+    assert whole_number(4.5) is None
+    assert whole_number(" 7 ") == 7
+    assert whole_number("nan") is None
+
+
+def test_text_length_and_enum():
+    _, bad, _ = coerce_column(pd.Series(["short", "much too long"]), column("s", "varchar", max_length=10))
+    assert bad.tolist() == [False, True]
+    _, bad, _ = coerce_column(pd.Series(["kg", "ton", None]), column("u", "enum", enum_values=("kg", "lb")))
+    assert bad.tolist() == [False, True, False]
+
+
+def test_noop_edits_are_dropped():
+    pending = validate_edits(PRODUCT, product_df(), {0: {"name": "cod", "sell_price": "11"}, 1: {"sell_price": None}},
+                             [], key_sets=KEYS)
+    assert pending.edited == {0: {"sell_price": 11}}
+    assert pending.noops == 2
+    assert not pending.rejected
+
+
+def test_edit_values_are_typed():
+    pending = validate_edits(PRODUCT, product_df(), {1: {"added": "2024-03-04T00:00:00.000"}}, [], key_sets=KEYS)
+    assert pending.edited == {1: {"added": date(2024, 3, 4)}}
+
+
+def test_bad_rows_are_rejected_and_the_rest_kept():
+    edited = {0: {"unit": "ton"}, 1: {"name": None}}
+    added = [{"name": "tuna", "sell_price": 5, "category_name": "fish"},
+             {"name": "eel", "sell_price": "x"},
+             {"sell_price": 3}]
+    pending = validate_edits(PRODUCT, product_df(), edited, added, key_sets=KEYS)
+    assert pending.edited == {}
+    assert pending.added == [{"name": "tuna", "sell_price": 5, "category_name": "fish"}]
+    reasons = dict(pending.rejected)
+    assert reasons["the row where pid = 1"].startswith("unit must be one of")
+    assert reasons["the row where pid = 2"] == "name is required"
+    assert reasons["added row 2"] == "sell_price is not a whole number: 'x'"
+    assert reasons["added row 3"] == "name is required"
+
+
+def test_keys_unique_within_the_batch_and_the_loaded_rows():
+    added = [{"name": "tuna"}, {"name": "TUNA"}, {"name": "Crab"}]
+    pending = validate_edits(PRODUCT, product_df(), {}, added, key_sets=KEYS)
+    assert pending.added == []
+    assert [reason for _, reason in pending.rejected] == ["name tuna is already used by another row",
+                                                          "name TUNA is already used by another row",
+                                                          "name Crab is already used by another row"]
+
+
+def test_renaming_frees_the_old_key():
+    pending = validate_edits(PRODUCT, product_df(), {0: {"name": "hake"}}, [{"name": "cod"}], key_sets=KEYS)
+    assert not pending.rejected
+
+
+def test_foreign_keys_found_in_key_sets_need_no_query():
+    pending = validate_edits(PRODUCT, product_df(), {0: {"category_name": "Shellfish"}}, [], cursor=None,
+                             key_sets=KEYS)
+    assert pending.edited == {0: {"category_name": "Shellfish"}}
+
+
+class FakeCursor:
+    '''answers the key lookups of check_foreign_keys from a list of rows'''
+    def __init__(self, rows):
+        self.rows, self.queries = rows, []
+
+    def execute(self, sql, params):
+        self.queries.append(params)
+        self.result = [(val,) for val in params if (val,) in self.rows]
+
+    def fetchall(self):
+        return self.result
+
+
+def test_foreign_keys_missing_from_key_sets_are_looked_up():
+    cursor = FakeCursor([("crustacean",)])
+    pending = validate_edits(PRODUCT, product_df(), {0: {"category_name": "crustacean"}, 1: {"category_name": "eel"}},
+                             [], cursor=cursor, key_sets=KEYS)
+    assert cursor.queries == [["crustacean", "eel"]]
+    assert pending.edited == {0: {"category_name": "crustacean"}}
+    assert pending.rejected == [("the row where pid = 2", "category_name eel not found in category")]